@@ -12,9 +12,12 @@ from concurrent.futures import ThreadPoolExecutor
 import multiprocessing
 import os
 import subprocess
+import sys
+import tempfile
 import time
 import traceback
 
+from pingu_sdk import fuzzing
 from pingu_sdk.datastore import data_handler
 from pingu_sdk.metrics import logs
 from pingu_sdk.system import environment, shell
@@ -29,19 +32,41 @@ LOOP_SLEEP_INTERVAL = 3
 MAX_SUBPROCESS_TIMEOUT = 2 ** 31 // 1000
 
 _heartbeat_handle = None
+_warm_worker_context = None
 
 
-def start_bot(bot_command):
-    """Start the bot process."""
-    command = shell.get_command(bot_command)
-
-    # Wait until the process terminates or until run timed out.
+def _get_run_timeout():
+    """Return how long a bot process may run, capped to what the process APIs
+    accept."""
     run_timeout = environment.get_value('RUN_TIMEOUT')
     if run_timeout and run_timeout > MAX_SUBPROCESS_TIMEOUT:
         # logs.log_error(
         #    'Capping RUN_TIMEOUT to max allowed value: %d' % MAX_SUBPROCESS_TIMEOUT)
         run_timeout = MAX_SUBPROCESS_TIMEOUT
 
+    return run_timeout
+
+
+def _log_bot_exit(command, exit_code, output=None):
+    """Log how a bot process exited."""
+    log_message = f'Command: {command} (exit={exit_code})\n{output or ""}'
+
+    if exit_code == 0:
+        logs.log(log_message)
+    elif exit_code == 1:
+        # Anecdotally, exit=1 means there's a fatal Python exception.
+        logs.log_error(log_message)
+    else:
+        logs.log_warn(log_message)
+
+
+def start_bot(bot_command):
+    """Start the bot process."""
+    command = shell.get_command(bot_command)
+
+    # Wait until the process terminates or until run timed out.
+    run_timeout = _get_run_timeout()
+
     try:
         result = subprocess.run(
             command,
@@ -60,16 +85,120 @@ def start_bot(bot_command):
 
     if output:
         output = output.decode('utf-8', errors='ignore')
-    log_message = f'Command: {command} (exit={exit_code})\n{output}'
+    _log_bot_exit(command, exit_code, output)
 
-    if exit_code == 0:
-        logs.log(log_message)
-    elif exit_code == 1:
-        # Anecdotally, exit=1 means there's a fatal Python exception.
-        logs.log_error(log_message)
+    return exit_code
+
+
+def use_warm_worker():
+    """Return true if bot processes should be forked from the warm worker."""
+    if not environment.get_value('BOT_WARM_WORKER', False):
+        return False
+
+    return 'forkserver' in multiprocessing.get_all_start_methods()
+
+
+def get_warm_worker_preload_modules():
+    """Return the modules imported once by the warm worker, so that bot
+    processes forked from it start with them already loaded."""
+    # Only the warm worker needs the task modules, run.py itself stays light.
+    from bot.tasks import commands
+
+    return (['bot.startup.run_bot', 'bot.tasks.commands'] +
+            list(commands.COMMAND_MAP.values()) +
+            ['pingu_sdk.fuzzers.%s.engine' % engine for engine in fuzzing.ENGINES])
+
+
+def get_warm_worker_context():
+    """Return the multiprocessing context of the warm worker. The worker itself
+    starts with the first bot process and is reused after that."""
+    global _warm_worker_context
+    if _warm_worker_context is None:
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(get_warm_worker_preload_modules())
+        _warm_worker_context = context
+
+    return _warm_worker_context
+
+
+def _redirect_output(output_path):
+    """Send stdout and stderr of this process and of its children to
+    |output_path|, like start_bot does with a pipe."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    output_fd = os.open(output_path, os.O_WRONLY | os.O_APPEND)
+    os.dup2(output_fd, 1)
+    os.dup2(output_fd, 2)
+    os.close(output_fd)
+
+
+def _read_output(output_path):
+    """Return the output a warm bot process left in |output_path| and remove
+    the file."""
+    try:
+        with open(output_path, 'rb') as file_handle:
+            return file_handle.read().decode('utf-8', errors='ignore')
+    except (IOError, OSError):
+        return None
+    finally:
+        shell.remove_file(output_path)
+
+
+def run_warm_bot(output_path=None, environ=None):
+    """Entry point of a bot process forked from the warm worker. Sets up what
+    the __main__ block of run_bot would, and replaces the environment the warm
+    worker was started with by |environ|, the current environment of run.py."""
+    if output_path:
+        _redirect_output(output_path)
+
+    if environ is not None:
+        os.environ.clear()
+        os.environ.update(environ)
+
+    multiprocessing.set_start_method('spawn', force=True)
+
+    from bot.startup import run_bot
+
+    try:
+        run_bot.main()
+    except Exception:
+        traceback.print_exc()
+        raise SystemExit(1)
+
+
+def start_warm_bot():
+    """Start the bot in a process forked from the warm worker."""
+    run_timeout = _get_run_timeout()
+
+    # The forked process does not share file descriptors with this one, so its
+    # output is collected in a file instead of a pipe.
+    output_handle, output_path = tempfile.mkstemp(prefix='run-bot-', suffix='.log')
+    os.close(output_handle)
+
+    try:
+        # The process inherits the environment of the warm worker, which was
+        # started with the first bot process, so pass the current one as
+        # start_bot does.
+        process = get_warm_worker_context().Process(
+            target=run_warm_bot,
+            args=(output_path, dict(os.environ)),
+            name='run-bot')
+        process.start()
+    except Exception:
+        logs.log_error('Unable to start warm bot process.')
+        shell.remove_file(output_path)
+        return 1
+
+    # Wait until the process terminates or until run timed out.
+    process.join(run_timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        exit_code = 0
     else:
-        logs.log_warn(log_message)
+        exit_code = process.exitcode
 
+    _log_bot_exit(process.name, exit_code, _read_output(output_path))
     return exit_code
 
 
@@ -157,13 +286,17 @@ def run_loop(bot_command, heartbeat_command):
     if environment.is_android():
         atexit.register(stop_android_heartbeat)
 
+    warm_worker = use_warm_worker()
     while True:
         if environment.is_android():
             start_android_heartbeat()
 
         with ThreadPoolExecutor() as executor:
             future1 = executor.submit(start_heartbeat, heartbeat_command)
-            future2 = executor.submit(start_bot, bot_command)
+            if warm_worker:
+                future2 = executor.submit(start_warm_bot)
+            else:
+                future2 = executor.submit(start_bot, bot_command)
 
             # Wait for the first task to complete (heartbeat), if it finishes first, we will handle its result/exception
             try:
@@ -5,6 +5,7 @@
 # to be able to import dependencies directly, but we must store these in
 # subdirectories of common so that they are shared with App Engine.
 import multiprocessing
+import os
 import time
 import traceback
 
@@ -19,6 +20,20 @@ from pingu_sdk.datastore.data_handler import DATETIME_FORMAT
 from pingu_sdk.system.tasks import Task
 
 from pingu_sdk.datastore.pingu_api.bot_api import PinguAPIError
+from bot.tasks import entity_cache
+from bot.tasks import tracing
+
+# Scratch directories that are private to a task slot. Everything else (builds,
+# fuzzers, data bundles) is shared between slots on the same host.
+TASK_SLOT_DIRECTORY_VARIABLES = [
+    'FUZZ_INPUTS',
+    'FUZZ_INPUTS_DISK',
+    'BOT_TMPDIR',
+    'TEST_TMPDIR',
+    'ARTIFACTS_DIR',
+    'CRASH_STACKTRACES_DIR',
+]
+
 
 class _Monitor(object):
     """Monitor one task."""
@@ -34,16 +49,19 @@ class _Monitor(object):
             'job': self.task.job or '',
         })
         self.start_time = self.time_module.time()
+        tracing.start_task(self.task)
 
     def __exit__(self, exc_type, value, trackback):
-        pass
+        tracing.finish_task()
 
 
 def task_loop():
     """Executes tasks indefinitely."""
     # Defer heavy task imports to prevent issues with multiprocessing.Process
     from bot.tasks import commands
-            
+    from bot.tasks import task_poller
+    from bot.tasks import task_prefetcher
+
     # Main loop
     clean_exit = False
     while True:
@@ -54,16 +72,27 @@ def task_loop():
         environment.reset_environment()
         try:
             # Run regular updates.
-            task = tasks.get_task()
+            prefetch = task_prefetcher.is_enabled()
+            if prefetch:
+                task = task_prefetcher.get_task()
+            else:
+                task = task_poller.get_task()
 
             if not task:
-                wait_next_loop()
+                task_poller.wait_for_next_task()
                 continue
 
+            # Look for the next task right away once this one is done.
+            task_poller.reset_backoff()
+
             with _Monitor(task):
                 # Set the current task ID in environment for use by commands.
                 environment.set_value('TASK_ID', task.id)
                 with task.lease():
+                    if prefetch:
+                        # Lease and stage the next task while this one runs.
+                        task_prefetcher.prefetch_next_task()
+
                     # Execute the command and delete the task.
                     commands.process_command(task)
         except SystemExit as e:
@@ -87,6 +116,9 @@ def task_loop():
 
         if exception_occurred:
             data_handler.update_task_status(environment.get_value('TASK_ID'), TaskState.ERROR)
+            if task_prefetcher.is_enabled():
+                # The bot restarts without running the prefetched task.
+                task_prefetcher.release_staged_task()
             wait_next_loop()
             break
 
@@ -100,14 +132,8 @@ def wait_next_loop():
     time.sleep(utils.random_number(1, failure_wait_interval))
 
 
-def main():
-    """Prepare the configuration options and start requesting tasks."""
-    logs.configure('run_bot')
-
-    dates.initialize_timezone_from_environment()
-    # monitor.initialize()
-    fuzzers_init.run()
-    
+def run_loop():
+    """Execute tasks until the bot should terminate."""
     while True:
         # task_loop should be an infinite loop,
         # unless we run into an exception.
@@ -143,6 +169,77 @@ def main():
             return
 
 
+def get_task_slot_count():
+    """Return the number of tasks this bot may run concurrently."""
+    return max(1, environment.get_value('TASK_SLOTS', 1))
+
+
+def set_task_slot_environment(slot):
+    """Give a task slot its own scratch directories and identity. Must be called
+    before the first environment.reset_environment() of the slot process, so
+    that resets between tasks preserve the slot values."""
+    environment.set_value('TASK_SLOT', slot)
+    slot_directory_name = 'slot-%d' % slot
+    for variable in TASK_SLOT_DIRECTORY_VARIABLES:
+        directory = environment.get_value(variable)
+        if not directory:
+            continue
+
+        slot_directory = os.path.join(directory, slot_directory_name)
+        os.makedirs(slot_directory, exist_ok=True)
+        environment.set_value(variable, slot_directory)
+
+    # Keep the in-memory alias pointing at the slot testcase directory.
+    environment.set_value('FUZZ_INPUTS_MEMORY', environment.get_value('FUZZ_INPUTS'))
+
+
+def _initialize(extras=None):
+    """Initialize logging, timezone and fuzzing engines for this process."""
+    logs.configure('run_bot', extras=extras)
+
+    dates.initialize_timezone_from_environment()
+    entity_cache.configure()
+    # monitor.initialize()
+    fuzzers_init.run()
+
+
+def run_task_slot(slot):
+    """Entry point of a task slot process."""
+    set_task_slot_environment(slot)
+    _initialize(extras={'task_slot': slot})
+    run_loop()
+
+
+def run_task_slots(slot_count):
+    """Run |slot_count| task loops in parallel, each in its own process so that
+    the process-global environment stays isolated per task."""
+    processes = []
+    for slot in range(slot_count):
+        process = multiprocessing.Process(
+            target=run_task_slot, args=(slot,), name='task-slot-%d' % slot)
+        process.start()
+        processes.append(process)
+
+    logs.log('Started %d task slots.' % slot_count)
+    for process in processes:
+        process.join()
+        if process.exitcode:
+            logs.log_warn('Task slot %s exited with code %d.' %
+                          (process.name, process.exitcode))
+
+
+def main():
+    """Prepare the configuration options and start requesting tasks."""
+    slot_count = get_task_slot_count()
+    if slot_count > 1:
+        logs.configure('run_bot')
+        run_task_slots(slot_count)
+        return
+
+    _initialize()
+    run_loop()
+
+
 if __name__ == '__main__':
     multiprocessing.set_start_method('spawn')
 
@@ -18,7 +18,7 @@ from pingu_sdk.fuzzers import engine_common
 from pingu_sdk.fuzzing import leak_blacklist
 from pingu_sdk.metrics import logs
 from pingu_sdk.system import environment, errors, tasks
-from bot.tasks import setup, task_creation
+from bot.tasks import entity_cache, setup, task_creation
 from pingu_sdk.utils import utils
 from pingu_sdk.datastore.pingu_api.pingu_api_client import get_api_client
 from pingu_sdk.datastore.data_constants import TaskState
@@ -76,7 +76,7 @@ def setup_build(testcase: Testcase, crash: Crash, job_id: UUID, project_id: UUID
         revision = revision_list[revision_index]
 
     build_helper = BuildHelper(job_id=job_id, revision=revision)
-    return build_helper.setup_build()
+    return setup.setup_build(build_helper)
 
 
 def execute_task(context: TaskContext):
@@ -267,7 +267,7 @@ def execute_task(context: TaskContext):
         return
 
     # Test for reproducibility.
-    fuzz_target = api_client.fuzz_target_api.get_fuzz_target_by_keyName(testcase.fuzzer_id, environment.get_value("FUZZ_TARGET"))
+    fuzz_target = entity_cache.get_fuzz_target(testcase.fuzzer_id, environment.get_value("FUZZ_TARGET"))
     one_time_crasher_flag = not testcase_manager.test_for_reproducibility(
         fuzzer_name=testcase.fuzzer_id,
         fuzztarget_id=fuzz_target.id,
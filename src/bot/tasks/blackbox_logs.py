@@ -0,0 +1,181 @@
+"""Incremental collection of blackbox fuzzer logs.
+
+Blackbox fuzzers write their logs to *.log files in their artifacts directory,
+which are kept between rounds. Reading all of them into one string after every
+round re-reads the logs of all earlier rounds. The collector here remembers how
+far each log file was read and only reads what was written since the previous
+round. Only the head and tail of a round's log are kept in memory, the part in
+between is dropped; the full log of a round that was truncated is spilled to a
+file, which is uploaded instead of the truncated log.
+"""
+
+import collections
+import os
+import tempfile
+
+from pingu_sdk import testcase_manager
+from pingu_sdk.system import environment, shell
+
+LOG_EXTENSION = '.log'
+READ_CHUNK_SIZE = 64 * 1024
+
+# Number of bytes at the start of a log file compared to tell whether it was
+# rewritten since it was last read.
+PREFIX_SIZE = 64
+
+# Default number of bytes of a round's log kept in memory, a quarter of them
+# from its start and the rest from its end.
+DEFAULT_MAX_LOG_SIZE = 1024 * 1024
+
+TRUNCATED_MESSAGE = '\n...[truncated %d bytes]...\n'
+
+
+def is_enabled():
+    """Return true if blackbox fuzzer logs are collected incrementally."""
+    return bool(environment.get_value('STREAMING_BLACKBOX_LOGS', False))
+
+
+def get_max_log_size():
+    """Return the number of bytes of a round's log kept in memory."""
+    return max(
+        2, environment.get_value('MAX_BLACKBOX_LOG_SIZE', DEFAULT_MAX_LOG_SIZE))
+
+
+class BoundedLog(object):
+    """The head and tail of a log written in chunks. Once the log no longer
+    fits, all of it is spilled to a temporary file."""
+
+    def __init__(self, max_size):
+        self.head_size = max_size // 4
+        self.tail_size = max_size - self.head_size
+        self.size = 0
+        self.spill_path = None
+
+        self._head = bytearray()
+        # Chunks holding at least the last |tail_size| bytes, oldest first.
+        self._tail = collections.deque()
+        self._tail_length = 0
+        self._spill_handle = None
+
+    def _spill(self):
+        """Start spilling the log, with what was written so far."""
+        handle, self.spill_path = tempfile.mkstemp(
+            suffix=LOG_EXTENSION, dir=environment.get_value('BOT_TMPDIR'))
+        self._spill_handle = os.fdopen(handle, 'wb')
+        self._spill_handle.write(self._head)
+        for chunk in self._tail:
+            self._spill_handle.write(chunk)
+
+    def write(self, data):
+        """Append |data| to the log."""
+        if not data:
+            return
+
+        self.size += len(data)
+        if self._spill_handle:
+            self._spill_handle.write(data)
+
+        if len(self._head) < self.head_size:
+            head_length = self.head_size - len(self._head)
+            self._head += data[:head_length]
+            data = data[head_length:]
+            if not data:
+                return
+
+        self._tail.append(bytes(data))
+        self._tail_length += len(data)
+        if self._tail_length <= self.tail_size:
+            return
+
+        if not self._spill_handle:
+            # Bytes are dropped from here on, and all of them are still held.
+            self._spill()
+
+        while self._tail_length - len(self._tail[0]) >= self.tail_size:
+            self._tail_length -= len(self._tail.popleft())
+
+    def close(self):
+        """Finish the spill file, if any."""
+        if self._spill_handle:
+            self._spill_handle.close()
+            self._spill_handle = None
+
+    def get_text(self):
+        """Return the kept head and tail of the log as text."""
+        tail = b''.join(self._tail)[-self.tail_size:]
+        dropped_size = self.size - len(self._head) - len(tail)
+        if not dropped_size:
+            return (bytes(self._head) + tail).decode('utf-8', errors='ignore')
+
+        return (self._head.decode('utf-8', errors='ignore') +
+                TRUNCATED_MESSAGE % dropped_size +
+                tail.decode('utf-8', errors='ignore'))
+
+
+class LogCollector(object):
+    """Reads the log files of a blackbox fuzzer artifacts directory from where
+    the previous round stopped."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        # Inode, first bytes and read offset of each log file, by path.
+        self._offsets = {}
+
+    def _read_new_data(self, file_path, bounded_log):
+        """Append what was written to |file_path| since it was last read to
+        |bounded_log|. Return true if anything was read."""
+        try:
+            stat_result = os.stat(file_path)
+        except OSError:
+            return False
+
+        inode, prefix, offset = self._offsets.get(file_path, (None, b'', 0))
+        if inode != stat_result.st_ino or stat_result.st_size < offset:
+            # The file is new, or was replaced or truncated.
+            offset = 0
+        if stat_result.st_size == offset:
+            return False
+
+        with open(file_path, 'rb') as file_handle:
+            if offset and file_handle.read(len(prefix)) != prefix:
+                # The file was rewritten, or replaced by one reusing its inode.
+                offset = 0
+            file_handle.seek(offset)
+            if not offset:
+                prefix = file_handle.read(PREFIX_SIZE)
+                bounded_log.write(prefix)
+                offset = len(prefix)
+
+            for chunk in iter(lambda: file_handle.read(READ_CHUNK_SIZE), b''):
+                bounded_log.write(chunk)
+                offset += len(chunk)
+
+        self._offsets[file_path] = (stat_result.st_ino, prefix, offset)
+        return True
+
+    def collect(self):
+        """Return a BoundedLog with what was written to the log files since the
+        previous call, each followed by a newline."""
+        bounded_log = BoundedLog(get_max_log_size())
+        try:
+            for filename in sorted(os.listdir(self.directory)):
+                if not filename.endswith(LOG_EXTENSION):
+                    continue
+
+                if self._read_new_data(
+                        os.path.join(self.directory, filename), bounded_log):
+                    bounded_log.write(b'\n')
+        finally:
+            bounded_log.close()
+
+        return bounded_log
+
+
+def upload_log_file(log_path, header, **kwargs):
+    """Upload |header| followed by the log spilled to |log_path|, like
+    testcase_manager.upload_log, and remove the file."""
+    with open(log_path, 'rb') as file_handle:
+        log = header + file_handle.read()
+
+    testcase_manager.upload_log(log=log, **kwargs)
+    shell.remove_file(log_path)
@@ -0,0 +1,162 @@
+"""Index of the fuzz targets in a build directory.
+
+Finding a fuzz target walks the whole build directory, which is slow for
+builds with thousands of targets and is done by every fuzzing round and task
+that uses the build. The index maps file names to their paths in the build,
+together with the options file and seed corpus archive of each target. It is
+built by one walk on the first lookup after the build is unpacked and kept in
+the build directory, so it is removed with the build. A lookup that misses or
+finds a path that no longer exists, e.g. after more targets of a partially
+unpacked build were unpacked, rebuilds it once.
+"""
+
+import json
+import os
+
+from pingu_sdk.fuzzers import engine_common
+from pingu_sdk.fuzzers import options
+from pingu_sdk.fuzzers import utils as fuzzer_utils
+from pingu_sdk.metrics import logs
+from pingu_sdk.system import archive, environment, shell
+
+INDEX_FILENAME = '.fuzz_targets.json'
+
+
+def is_enabled():
+    """Return true if fuzz targets are looked up through a build index."""
+    return bool(environment.get_value('FUZZ_TARGET_INDEX', False))
+
+
+def get_index_path(build_directory):
+    """Return the path of the index of |build_directory|."""
+    return os.path.join(build_directory, INDEX_FILENAME)
+
+
+def _get_supporting_files(relative_path, paths):
+    """Return the options file and seed corpus archive of the target at
+    |relative_path| that are among |paths|."""
+    supporting_files = {}
+    options_path = fuzzer_utils.get_supporting_file(
+        relative_path, options.OPTIONS_FILE_EXTENSION)
+    if options_path in paths:
+        supporting_files['options'] = options_path
+
+    seed_corpus_path = fuzzer_utils.get_supporting_file(
+        relative_path, engine_common.SEED_CORPUS_ARCHIVE_SUFFIX)
+    for extension in archive.ARCHIVE_FILE_EXTENSIONS:
+        if seed_corpus_path + extension in paths:
+            supporting_files['seed_corpus'] = seed_corpus_path + extension
+            break
+
+    return supporting_files
+
+
+def build(build_directory):
+    """Walk |build_directory| and return its index. For file names found more
+    than once, the first path in walk order is kept, as find_fuzzer_path
+    does."""
+    paths = []
+    for root, _, files in shell.walk(build_directory):
+        for filename in files:
+            if filename == INDEX_FILENAME:
+                continue
+            paths.append(
+                os.path.relpath(os.path.join(root, filename), build_directory))
+
+    path_set = set(paths)
+    targets = {}
+    for relative_path in paths:
+        filename = os.path.basename(relative_path)
+        if filename in targets:
+            continue
+
+        targets[filename] = {'path': relative_path}
+        targets[filename].update(_get_supporting_files(relative_path, path_set))
+
+    return {'targets': targets}
+
+
+def _save(build_directory, index):
+    """Save |index| in |build_directory|."""
+    index_path = get_index_path(build_directory)
+    temp_path = index_path + '.tmp'
+    try:
+        with open(temp_path, 'w') as file_handle:
+            json.dump(index, file_handle)
+        os.replace(temp_path, index_path)
+    except (IOError, OSError) as e:
+        logs.log_warn('Failed to save fuzz target index: %s' % str(e))
+
+
+def get_index(build_directory, rebuild=False):
+    """Return the index of |build_directory|, building it if it does not exist
+    or |rebuild| is set."""
+    if not rebuild:
+        try:
+            with open(get_index_path(build_directory)) as file_handle:
+                return json.load(file_handle)
+        except (IOError, OSError, ValueError):
+            pass
+
+    index = build(build_directory)
+    logs.log('Indexed %d files in build directory %s.' %
+             (len(index['targets']), build_directory))
+    _save(build_directory, index)
+    return index
+
+
+def _lookup(build_directory, index, fuzzer_name):
+    """Return the entry of |fuzzer_name| in |index| with absolute paths, or
+    None if it is not there or its target no longer exists."""
+    names = [environment.get_executable_filename(fuzzer_name)]
+
+    # Legacy testcases include the project prefix in the target name, see
+    # engine_common.find_fuzzer_path.
+    project_name = environment.get_value('PROJECT_NAME')
+    if project_name and fuzzer_name.startswith(project_name + '_'):
+        names.append(fuzzer_name[len(project_name) + 1:])
+
+    for name in names:
+        entry = index['targets'].get(name)
+        if not entry:
+            continue
+
+        entry = {
+            key: os.path.join(build_directory, path)
+            for key, path in entry.items()
+        }
+        if os.path.exists(entry['path']):
+            return entry
+
+    return None
+
+
+def get_fuzz_target(build_directory, fuzzer_name):
+    """Return the path of |fuzzer_name| in |build_directory| and of its options
+    file and seed corpus archive if it has them, as a dict with the keys
+    'path', 'options' and 'seed_corpus'. Return None if it is not found."""
+    index = get_index(build_directory)
+    entry = _lookup(build_directory, index, fuzzer_name)
+    if not entry:
+        entry = _lookup(build_directory, get_index(build_directory, rebuild=True),
+                        fuzzer_name)
+
+    return entry
+
+
+def find_fuzzer_path(build_directory, fuzzer_name):
+    """Find the fuzzer path with the given name, like
+    engine_common.find_fuzzer_path but through the index of the build if
+    FUZZ_TARGET_INDEX is set."""
+    if (not is_enabled() or not build_directory or
+            environment.platform() == 'FUCHSIA' or
+            environment.is_android_kernel()):
+        return engine_common.find_fuzzer_path(build_directory, fuzzer_name)
+
+    entry = get_fuzz_target(build_directory, fuzzer_name)
+    if not entry:
+        logs.log_warn('Fuzzer: %s not found in build_directory: %s.' %
+                      (fuzzer_name, build_directory))
+        return None
+
+    return entry['path']
@@ -0,0 +1,159 @@
+"""Inventory of what this bot has cached on disk, used to prefer tasks that
+can reuse it."""
+
+import os
+import time
+
+from pingu_sdk.build_management.build_managers.build_utils import REVISION_FILE_NAME
+from pingu_sdk.system import environment, shell
+
+# Seconds an inventory is reused before the disk is scanned again.
+INVENTORY_TTL_IN_SECONDS = 5 * 60
+
+_inventory = None
+_inventory_time = 0
+
+
+def _read_revision(revision_file):
+    """Return the revision stored in |revision_file|, or None."""
+    try:
+        with open(revision_file) as file_handle:
+            return file_handle.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _list_directories(directory):
+    """Return (name, path) of the subdirectories of |directory|."""
+    if not directory or not os.path.isdir(directory):
+        return []
+
+    return [(entry.name, entry.path)
+            for entry in os.scandir(directory)
+            if entry.is_dir()]
+
+
+def _get_builds():
+    """Return the builds on disk keyed by build directory, which is the job id
+    unless the job uses a bucket path."""
+    builds = {}
+    for name, path in _list_directories(environment.get_value('BUILDS_DIR')):
+        for _, build_dir in _list_directories(path):
+            revision = _read_revision(os.path.join(build_dir, REVISION_FILE_NAME))
+            if revision is None:
+                continue
+
+            builds[name] = {
+                'revision': revision,
+                'size': shell.get_directory_size(path),
+            }
+            break
+
+    return builds
+
+
+def _get_fuzzers():
+    """Return the installed fuzzers keyed by name."""
+    fuzzers = {}
+    for name, path in _list_directories(environment.get_value('FUZZERS_DIR')):
+        revision = _read_revision(os.path.join(path, '.%s_version' % name))
+        if revision is None:
+            continue
+
+        fuzzers[name] = {
+            'revision': revision,
+            'size': shell.get_directory_size(path),
+        }
+
+    return fuzzers
+
+
+def _get_corpora():
+    """Return the corpora and data bundles on disk keyed by directory name."""
+    corpora = {}
+    for name, path in _list_directories(environment.get_value('DATA_BUNDLES_DIR')):
+        corpora[name] = {
+            'files': shell.get_directory_file_count(path),
+            'size': shell.get_directory_size(path),
+        }
+
+    return corpora
+
+
+def get_inventory(refresh=False):
+    """Return what is cached on disk. The scan is reused for
+    INVENTORY_TTL_IN_SECONDS unless |refresh| is set."""
+    global _inventory
+    global _inventory_time
+
+    if (refresh or _inventory is None or
+            time.time() - _inventory_time > INVENTORY_TTL_IN_SECONDS):
+        _inventory = {
+            'builds': _get_builds(),
+            'fuzzers': _get_fuzzers(),
+            'corpora': _get_corpora(),
+        }
+        _inventory_time = time.time()
+
+    return _inventory
+
+
+def summarize(inventory):
+    """Return the part of |inventory| advertised to the task API: revisions of
+    builds and fuzzers, and names of corpora."""
+    return {
+        'builds': {
+            name: build['revision']
+            for name, build in inventory['builds'].items()
+        },
+        'fuzzers': {
+            name: fuzzer['revision']
+            for name, fuzzer in inventory['fuzzers'].items()
+        },
+        'corpora': sorted(inventory['corpora']),
+    }
+
+
+def is_build_cached(task, inventory):
+    """Return true if the build revision |task| needs is the one cached for its
+    job. The task API gives that revision with each candidate task, e.g. the
+    latest build revision for fuzz and corpus pruning tasks. A task without one
+    could need any revision."""
+    build = inventory['builds'].get(str(task.job))
+    revision = getattr(task, 'revision', None)
+    return bool(build) and revision is not None and str(
+        revision) == build['revision']
+
+
+def score_task(task, inventory):
+    """Return the number of bytes |task| would not have to download because
+    they are already cached."""
+    score = 0
+
+    if is_build_cached(task, inventory):
+        score += inventory['builds'][str(task.job)]['size']
+
+    if task.command == 'fuzz':
+        fuzzer = inventory['fuzzers'].get(task.argument)
+        if fuzzer:
+            score += fuzzer['size']
+
+    elif task.command == 'corpus_pruning':
+        fuzzer_name, binary = task.argument.split(',', 1)
+        fuzzer = inventory['fuzzers'].get(fuzzer_name)
+        if fuzzer:
+            score += fuzzer['size']
+
+        # Corpora are stored under the project qualified target name.
+        for name, corpus in inventory['corpora'].items():
+            if name == binary or name.endswith('_' + binary):
+                score += corpus['size']
+
+    return score
+
+
+def sort_tasks(candidates, inventory):
+    """Return |candidates| sorted by how much of the local cache they reuse,
+    best first. Ties keep the queue order."""
+    return sorted(
+        candidates, key=lambda task: score_task(task, inventory), reverse=True)
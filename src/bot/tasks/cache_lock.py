@@ -0,0 +1,127 @@
+"""Cross-process locks on the caches shared by task slots.
+
+Builds, fuzzers and corpora are kept on disk for reuse and shared by all task
+slots of a host. An entry of one of these caches is set up under a lock of its
+own, so that two slots never unpack or update the same directory at the same
+time while slots setting up different entries don't wait for each other.
+Setup also holds the lock of the category in shared mode, and eviction holds
+the locks of all categories, so that entries are never deleted while they are
+set up. Setup never holds the locks of two categories. A task also holds the
+lock of every entry it uses in shared mode until it finishes, and eviction
+skips entries whose lock it can't take. Locks are advisory (flock) and are
+released when the holding process exits.
+"""
+
+import contextlib
+import hashlib
+import os
+import tempfile
+
+from pingu_sdk.system import environment
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Lock names, one per cache category of disk_cache.
+BUILDS = 'builds'
+FUZZERS = 'fuzzers'
+CORPORA = 'corpora'
+
+LOCK_DIRECTORY_NAME = 'cache-locks'
+
+# Files of the locks held in shared mode by the current task, by name.
+_held_locks = {}
+
+
+def get_lock_path(name):
+    """Return the path of the lock file |name|, in a directory shared by all
+    task slots."""
+    root_directory = environment.get_value('BOT_DIR') or tempfile.gettempdir()
+    lock_directory = os.path.join(root_directory, LOCK_DIRECTORY_NAME)
+    os.makedirs(lock_directory, exist_ok=True)
+    return os.path.join(lock_directory, name + '.lock')
+
+
+@contextlib.contextmanager
+def lock(name, shared=False):
+    """Hold the lock |name| for the duration of the context, in shared mode if
+    |shared| is set. Blocks until no other process holds it in a conflicting
+    mode. Does nothing where flock is not available."""
+    if fcntl is None:
+        yield
+        return
+
+    with open(get_lock_path(name), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def try_lock(name):
+    """Hold the lock |name| for the duration of the context if no other holder
+    has it, without blocking. Yield whether it was taken."""
+    if fcntl is None:
+        yield True
+        return
+
+    with open(get_lock_path(name), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def lock_entry(category, key):
+    """Hold the setup lock of the entry |key| of the cache |category|, e.g. the
+    path of a corpus directory, for the duration of the context."""
+    key_hash = hashlib.sha1(str(key).encode('utf-8')).hexdigest()
+    with lock(category, shared=True):
+        with lock('%s-%s' % (category, key_hash)):
+            yield
+
+
+def get_entry_lock_name(path):
+    """Return the name of the lock held while the cache entry at |path| is
+    used."""
+    return 'entry-' + hashlib.sha1(
+        os.path.abspath(path).encode('utf-8')).hexdigest()
+
+
+def hold_shared(name):
+    """Hold the lock |name| in shared mode until release_held is called, e.g.
+    while the current task uses the cache entry it protects."""
+    if fcntl is None or name in _held_locks:
+        return
+
+    lock_file = open(get_lock_path(name), 'a')
+    fcntl.flock(lock_file, fcntl.LOCK_SH)
+    _held_locks[name] = lock_file
+
+
+def release_held():
+    """Release the locks taken by hold_shared."""
+    for lock_file in _held_locks.values():
+        lock_file.close()
+    _held_locks.clear()
+
+
+@contextlib.contextmanager
+def lock_all(names):
+    """Hold all of the locks |names|, taken in a fixed order so that callers
+    holding several locks cannot deadlock. Used for eviction."""
+    with contextlib.ExitStack() as stack:
+        for name in sorted(names):
+            stack.enter_context(lock(name))
+        yield
@@ -0,0 +1,154 @@
+"""Checkpoints that let a long running task resume after a bot restart.
+
+A checkpoint belongs to a task id and its payload (command, argument and job),
+so that the same task leased again on this bot picks up where it stopped. Fuzz
+tasks with the same payload are queued again and again, so the payload alone
+would let an unrelated later task resume the state of an earlier one. Tasks store JSON-serializable state per phase, and can keep files
+and directories in the checkpoint since the task directories are cleared
+between tasks.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from pingu_sdk.metrics import logs
+from pingu_sdk.system import environment, shell
+
+CHECKPOINTS_DIRECTORY_NAME = 'checkpoints'
+STATE_FILENAME = 'state.json'
+FILES_DIRECTORY_NAME = 'files'
+
+# Default number of seconds after which a checkpoint is no longer resumed. Must
+# exceed the longest task (corpus pruning can run for 22 hours).
+DEFAULT_MAX_AGE = 2 * 24 * 60 * 60
+
+
+def is_enabled():
+    """Return true if tasks checkpoint their progress."""
+    return bool(environment.get_value('TASK_CHECKPOINTS', False))
+
+
+def get_max_age():
+    """Return the number of seconds after which saved state is not resumed."""
+    return environment.get_value('CHECKPOINT_MAX_AGE', DEFAULT_MAX_AGE)
+
+
+def get_checkpoints_directory():
+    """Return the directory holding all checkpoints."""
+    return os.path.join(
+        environment.get_value('BOT_DIR'), CHECKPOINTS_DIRECTORY_NAME)
+
+
+class Checkpoint(object):
+    """Per-phase state saved by one task."""
+
+    def __init__(self, task_id, payload, directory):
+        self.task_id = task_id
+        self.payload = payload
+        self.directory = directory
+        self.state = {
+            'task_id': task_id,
+            'payload': payload,
+            'updated': None,
+            'phases': {},
+            'phase_times': {}
+        }
+
+        state_file_path = os.path.join(directory, STATE_FILENAME)
+        if not os.path.exists(state_file_path):
+            return
+
+        try:
+            with open(state_file_path) as file_handle:
+                state = json.load(file_handle)
+        except (IOError, OSError, ValueError):
+            logs.log_warn('Ignoring unreadable checkpoint %s.' % directory)
+            return
+
+        if (state.get('task_id') != task_id or
+                state.get('payload') != payload or
+                time.time() - (state.get('updated') or 0) > get_max_age()):
+            logs.log('Discarding stale checkpoint for %s.' % payload)
+            self.clear()
+            return
+
+        state.setdefault('phase_times', {})
+        self.state = state
+        logs.log('Resuming %s from checkpointed phases: %s.' %
+                 (payload, ', '.join(sorted(state['phases']))))
+
+    def get(self, phase, default=None):
+        """Return the saved state of |phase|, or |default| if it was saved more
+        than CHECKPOINT_MAX_AGE seconds ago. Saving other phases does not keep
+        a phase fresh."""
+        saved_time = self.state['phase_times'].get(phase) or 0
+        if time.time() - saved_time > get_max_age():
+            return default
+
+        return self.state['phases'].get(phase, default)
+
+    def set(self, phase, value):
+        """Save the state of |phase|. The state file is replaced atomically so a
+        crash mid-write leaves the previous checkpoint intact."""
+        self.state['phases'][phase] = value
+        self.state['phase_times'][phase] = self.state['updated'] = time.time()
+
+        shell.create_directory(self.directory, create_intermediates=True)
+        state_file_path = os.path.join(self.directory, STATE_FILENAME)
+        temp_file_path = state_file_path + '.tmp'
+        with open(temp_file_path, 'w') as file_handle:
+            json.dump(self.state, file_handle)
+        os.replace(temp_file_path, state_file_path)
+
+    def get_file_path(self, name):
+        """Return where a file named |name| is kept in this checkpoint."""
+        return os.path.join(self.directory, FILES_DIRECTORY_NAME, name)
+
+    def save_file(self, name, source_path):
+        """Copy a file or directory into this checkpoint as |name| and return
+        its path there."""
+        destination_path = self.get_file_path(name)
+        shell.create_directory(
+            os.path.dirname(destination_path), create_intermediates=True)
+        temp_path = destination_path + '.tmp'
+        if os.path.isdir(source_path):
+            shell.remove_directory(temp_path)
+            shutil.copytree(source_path, temp_path)
+            shell.remove_directory(destination_path)
+        else:
+            shutil.copyfile(source_path, temp_path)
+
+        os.replace(temp_path, destination_path)
+        return destination_path
+
+    def clear(self):
+        """Delete this checkpoint, e.g. once its task completed."""
+        self.state = {
+            'task_id': self.task_id,
+            'payload': self.payload,
+            'updated': None,
+            'phases': {},
+            'phase_times': {}
+        }
+        shell.remove_directory(self.directory, ignore_errors=True)
+
+
+def get_checkpoint(task):
+    """Return the checkpoint of |task|, empty if nothing was saved for it, or
+    None if checkpointing is disabled or |task| has no id, e.g. a command
+    override."""
+    if not is_enabled():
+        return None
+
+    task_id = task.id
+    if not task_id or task_id == 'None':
+        return None
+
+    payload = task.payload()
+    key = hashlib.sha1(
+        ('%s %s' % (task_id, payload)).encode('utf-8')).hexdigest()
+    return Checkpoint(task_id, payload,
+                      os.path.join(get_checkpoints_directory(), key))
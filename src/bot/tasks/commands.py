@@ -1,5 +1,6 @@
 """Run command based on the current task."""
 
+import importlib
 import os
 import sys
 import six
@@ -9,29 +10,29 @@ from pingu_sdk.metrics import logs
 from pingu_sdk.system import environment, tasks, errors
 from pingu_sdk.system import process_handler
 from pingu_sdk.system import shell
-from bot.tasks import analyze_task
-from bot.tasks import corpus_pruning_task
-from bot.tasks import fuzz_task
-from bot.tasks import minimize_task
-from bot.tasks import progression_task
-from bot.tasks import regression_task
-from bot.tasks import symbolize_task
+from bot.tasks import disk_cache
+from bot.tasks import entity_cache
+from bot.tasks import reaper
+from bot.tasks import task_prefetcher
+from bot.tasks import tracing
+from bot.tasks import upload_queue
 from bot.tasks.task_context import TaskContext
 #from bot.tasks import upload_reports_task
 from pingu_sdk.utils import utils
 from pingu_sdk.datastore.data_constants import TaskState
-from pingu_sdk.datastore.pingu_api.pingu_api_client import get_api_client
 from pingu_sdk.system.tasks import Task
 
+# Task modules are imported on first use, a bot only pays for the tasks it
+# actually runs.
 COMMAND_MAP = {
-    'analyze': analyze_task,
-    'corpus_pruning': corpus_pruning_task,
-    'fuzz': fuzz_task,
-    'minimize': minimize_task,
-    'progression': progression_task,
-    'regression': regression_task,
-    'symbolize': symbolize_task,
-    #'upload_reports': upload_reports_task,
+    'analyze': 'bot.tasks.analyze_task',
+    'corpus_pruning': 'bot.tasks.corpus_pruning_task',
+    'fuzz': 'bot.tasks.fuzz_task',
+    'minimize': 'bot.tasks.minimize_task',
+    'progression': 'bot.tasks.progression_task',
+    'regression': 'bot.tasks.regression_task',
+    'symbolize': 'bot.tasks.symbolize_task',
+    #'upload_reports': 'bot.tasks.upload_reports_task',
 }
 
 TASK_RETRY_WAIT_LIMIT = 5 * 60  # 5 minutes.
@@ -45,18 +46,34 @@ class AlreadyRunningError(Error):
     """Exception raised for a task that is already running on another bot."""
 
 
+def is_running_in_task_slot():
+    """Return true if other tasks may be running concurrently on this host."""
+    return environment.get_value('TASK_SLOT') is not None
+
+
 def cleanup_task_state():
     """Cleans state before and after a task is executed."""
-    # Cleanup stale processes.
-    process_handler.cleanup_stale_processes()
-
-    # Clear build urls, temp and testcase directories.
-    shell.clear_build_urls_directory()
+    if not is_running_in_task_slot():
+        # Processes, build urls and system temp directories are shared by all
+        # task slots, so only clean them up when this is the only task running.
+        process_handler.cleanup_stale_processes()
+        shell.clear_build_urls_directory()
+        shell.clear_system_temp_directory()
+        shell.clear_device_temp_directories()
+
+    # Background uploads may still read from the directories cleared below.
+    upload_queue.flush()
+
+    # Clear temp and testcase directories. These are scratch space for a single
+    # task, unlike builds, fuzzers and corpora which are kept for reuse.
     shell.clear_crash_stacktraces_directory()
-    shell.clear_testcase_directories()
-    shell.clear_temp_directory()
-    shell.clear_system_temp_directory()
-    shell.clear_device_temp_directories()
+    reaper.clear_testcase_directories()
+    reaper.clear_temp_directory()
+
+    # Caches are shared by all task slots, eviction takes their locks. The
+    # entries used by the task that finished can be evicted again.
+    disk_cache.release_used()
+    disk_cache.enforce_budget()
 
     # Reset memory tool environment variables.
     environment.reset_current_memory_tool_options()
@@ -109,6 +126,26 @@ def update_environment_for_job(environment_string):
         environment.set_value('MAX_TESTCASES', max_testcases_override)
 
 
+def get_command_module(task_name):
+    """Return the module implementing |task_name|, importing it if needed."""
+    return importlib.import_module(COMMAND_MAP[task_name])
+
+
+def write_file_if_changed(file_path, content):
+    """Write |content| to |file_path| unless it already holds it. The file is
+    replaced atomically so that concurrent readers never see a partial write."""
+    if os.path.exists(file_path):
+        with open(file_path) as file_handle:
+            if file_handle.read() == content:
+                return False
+
+    temp_file_path = '%s.%d' % (file_path, os.getpid())
+    with open(temp_file_path, 'w') as file_handle:
+        file_handle.write(content)
+    os.replace(temp_file_path, file_path)
+    return True
+
+
 def set_task_payload(func):
     """Set TASK_PAYLOAD and unset TASK_PAYLOAD."""
 
@@ -144,6 +181,7 @@ def should_update_task_status(task_name):
     ]
 
 
+@tracing.traced('run_command')
 def run_command(context: TaskContext):
     """Run the command."""
     task_name = context.task.command
@@ -154,7 +192,7 @@ def run_command(context: TaskContext):
         logs.log_error("Unknown command '%s'" % task_name)
         return
 
-    task_module = COMMAND_MAP[task_name]
+    task_module = get_command_module(task_name)
 
     # If applicable, ensure this is the only instance of the task running.
     task_state_name = ' '.join([task_name, task_argument, str(job.id)])
@@ -177,6 +215,9 @@ def run_command(context: TaskContext):
     except Exception as e:
         raise Exception(e)
 
+    # Keep the checkpoint of a failed task so that it resumes when leased again.
+    context.clear_checkpoint()
+
     if should_update_task_status(task_name):
         data_handler.update_task_status(context.task.id, TaskState.FINISHED)
 
@@ -193,18 +234,25 @@ def process_command(task: Task):
     # Parse task payload.
     task_name = task.command
     task_argument = task.argument
-    api_client = get_api_client()
-    job = api_client.job_api.get_job(task.job)
+    staged_task = task_prefetcher.take_staged_task(task)
+    with tracing.span('api_fetch'):
+        if staged_task and staged_task.job:
+            job = staged_task.job
+        else:
+            job = entity_cache.get_job(task.job)
     if not job:
         logs.log_error("Job not found.")
         return
        
     # Download job related project configuration
     try:
-        project = api_client.project_api.get_project_by_id(job.project_id)
+        with tracing.span('api_fetch'):
+            if staged_task and staged_task.project:
+                project = staged_task.project
+            else:
+                project = entity_cache.get_project(job.project_id)
         project_config_path = os.path.join(environment.get_value('ROOT_DIR'), 'config', 'project.yaml')
-        with open(project_config_path, 'w') as f:
-            f.write(project.configuration)
+        write_file_if_changed(project_config_path, project.configuration)
     except Exception as e:
         raise Exception("Failed to download project configuration for job '%s'" % job.name)
 
@@ -247,8 +295,14 @@ def process_command(task: Task):
         minimize_fuzzer_override = job_environment.get('MINIMIZE_FUZZER_OVERRIDE')
         fuzzer_name = minimize_fuzzer_override or fuzzer_name
 
+    fuzzer = None
+    if (staged_task and staged_task.fuzzer and
+            staged_task.fuzzer.name == fuzzer_name):
+        fuzzer = staged_task.fuzzer
+
     if fuzzer_name and not environment.is_engine_fuzzer_job(fuzzer_name):
-        fuzzer = api_client.fuzzer_api.get_fuzzer(fuzzer_name)
+        if not fuzzer:
+            fuzzer = entity_cache.get_fuzzer(fuzzer_name)
         additional_default_variables = ''
         additional_variables_for_job = ''
         if (fuzzer and hasattr(fuzzer, 'additional_environment_string') and
@@ -282,5 +336,6 @@ def process_command(task: Task):
         task=task, 
         project=project,
         job=job,
-        fuzzer_name=fuzzer_name)
+        fuzzer_name=fuzzer_name,
+        fuzzer=fuzzer)
     run_command(context)
@@ -0,0 +1,227 @@
+"""Persistent manifest of the corpus units synced for a fuzz target.
+
+Finding the units a fuzzer added used to mean keeping the path of every synced
+unit in memory and comparing a full walk of the corpus against it. The
+manifest keeps the hash, size and mtime of each synced unit in an SQLite
+database next to the corpus instead, so it survives between tasks, only units
+whose size or mtime changed are hashed, and a unit whose content was already
+synced under another name is not reported as new. Such copies are recorded
+as not uploaded, so they are not hashed again by the next lookup.
+"""
+
+import hashlib
+import os
+import sqlite3
+
+from pingu_sdk.system import environment
+
+MANIFEST_SUFFIX = '_manifest.sqlite'
+HASH_CHUNK_SIZE = 64 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    path TEXT PRIMARY KEY,
+    sha1 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    generation INTEGER NOT NULL,
+    uploaded INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS units_sha1 ON units (sha1);
+"""
+
+
+def is_enabled():
+    """Return true if corpus syncs are tracked with a persistent manifest."""
+    return bool(environment.get_value('CORPUS_MANIFEST', False))
+
+
+def get_manifest_path(data_directory, project_qualified_target_name):
+    """Return the manifest path of a fuzz target, next to its sync file."""
+    return os.path.join(data_directory,
+                        project_qualified_target_name + MANIFEST_SUFFIX)
+
+
+def get_file_hash(file_path):
+    """Return the SHA-1 of the contents of |file_path|."""
+    file_hash = hashlib.sha1()
+    with open(file_path, 'rb') as file_handle:
+        for chunk in iter(lambda: file_handle.read(HASH_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+class CorpusManifest(object):
+    """Synced units of a corpus directory."""
+
+    def __init__(self, manifest_path, corpus_directory):
+        self._corpus_directory = corpus_directory
+        self._connection = sqlite3.connect(manifest_path)
+        self._connection.executescript(_SCHEMA)
+        self._migrate()
+
+        # Hashes computed by get_new_files, reused when the files are added.
+        self._pending_units = {}
+
+    def _migrate(self):
+        """Add the columns missing from manifests written by older versions."""
+        columns = [
+            row[1]
+            for row in self._connection.execute('PRAGMA table_info(units)')
+        ]
+        if 'uploaded' not in columns:
+            with self._connection:
+                self._connection.execute(
+                    'ALTER TABLE units ADD COLUMN uploaded INTEGER NOT NULL '
+                    'DEFAULT 1')
+
+    def _scan(self, directory=None):
+        """Yield the path and stat result of every unit in the corpus."""
+        try:
+            entries = list(os.scandir(directory or self._corpus_directory))
+        except OSError:
+            return
+
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from self._scan(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry.path, entry.stat(follow_symlinks=False)
+
+    def _get_key(self, file_path):
+        """Return the manifest key of |file_path|, relative to the corpus so
+        that the manifest stays valid if the corpus is moved."""
+        return os.path.relpath(file_path, self._corpus_directory)
+
+    def _get_recorded_unit(self, file_path, stat_result):
+        """Return the hash and upload state of |file_path| if it is in the
+        manifest with the same size and mtime, or None."""
+        row = self._connection.execute(
+            'SELECT sha1, size, mtime, uploaded FROM units WHERE path = ?',
+            (self._get_key(file_path),)).fetchone()
+        if not row or row[1:3] != (stat_result.st_size,
+                                   stat_result.st_mtime_ns):
+            return None
+
+        return row[0], bool(row[3])
+
+    def _is_unchanged(self, file_path, stat_result):
+        """Return true if |file_path| is in the manifest with the same size and
+        mtime."""
+        return self._get_recorded_unit(file_path, stat_result) is not None
+
+    def has_hash(self, sha1):
+        """Return true if a unit with content |sha1| was synced."""
+        return self._connection.execute(
+            'SELECT 1 FROM units WHERE sha1 = ? AND uploaded = 1 LIMIT 1',
+            (sha1,)).fetchone() is not None
+
+    def get_synced_units(self):
+        """Return the size and mtime of the units that were synced from or
+        uploaded to storage, by path relative to the corpus."""
+        return {
+            path: (size, mtime)
+            for path, size, mtime in self._connection.execute(
+                'SELECT path, size, mtime FROM units WHERE uploaded = 1')
+        }
+
+    def _get_generation(self):
+        """Return the generation of the last update."""
+        return self._connection.execute(
+            'SELECT COALESCE(MAX(generation), 0) FROM units').fetchone()[0]
+
+    def _get_unit(self, file_path, stat_result):
+        """Return the hash, size and mtime of |file_path|."""
+        pending_unit = self._pending_units.pop(file_path, None)
+        if pending_unit and pending_unit[1:] == (stat_result.st_size,
+                                                 stat_result.st_mtime_ns):
+            return pending_unit
+
+        return (get_file_hash(file_path), stat_result.st_size,
+                stat_result.st_mtime_ns)
+
+    def _record(self, units, generation, uploaded=False):
+        """Record |units| as (path, stat result) pairs as synced. Units already
+        recorded keep their upload state, unless |uploaded| is set."""
+        rows = []
+        for file_path, stat_result in units:
+            key = self._get_key(file_path)
+            if self._is_unchanged(file_path, stat_result):
+                self._connection.execute(
+                    'UPDATE units SET generation = ?, '
+                    'uploaded = MAX(uploaded, ?) WHERE path = ?',
+                    (generation, int(uploaded), key))
+                continue
+
+            rows.append((key,) + self._get_unit(file_path, stat_result) +
+                        (generation, 1))
+
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def update(self):
+        """Record the units in the corpus directory as synced, e.g. after a sync
+        from storage, and forget those that no longer exist. Return the number
+        of units."""
+        with self._connection:
+            generation = self._get_generation() + 1
+            self._record(self._scan(), generation)
+            self._connection.execute('DELETE FROM units WHERE generation < ?',
+                                     (generation,))
+            count = self._connection.execute(
+                'SELECT COUNT(*) FROM units').fetchone()[0]
+
+        self._pending_units.clear()
+        return count
+
+    def add(self, file_paths):
+        """Record |file_paths| as synced, e.g. after they were uploaded."""
+        units = []
+        for file_path in file_paths:
+            try:
+                units.append((file_path, os.stat(file_path)))
+            except OSError:
+                continue
+
+        with self._connection:
+            self._record(units, self._get_generation(), uploaded=True)
+
+    def get_new_files(self):
+        """Return the units that were not synced, skipping copies of content
+        that was already synced. The copies are recorded as not uploaded, and
+        are only reported again if the content they copy is no longer
+        synced."""
+        self._pending_units.clear()
+        new_files = []
+        new_hashes = set()
+        duplicate_rows = []
+        for file_path, stat_result in self._scan():
+            recorded_unit = self._get_recorded_unit(file_path, stat_result)
+            if recorded_unit:
+                sha1, uploaded = recorded_unit
+                if uploaded:
+                    continue
+            else:
+                sha1 = get_file_hash(file_path)
+
+            if sha1 in new_hashes or self.has_hash(sha1):
+                if not recorded_unit:
+                    duplicate_rows.append(
+                        (self._get_key(file_path), sha1, stat_result.st_size,
+                         stat_result.st_mtime_ns))
+                continue
+
+            new_hashes.add(sha1)
+            new_files.append(file_path)
+            self._pending_units[file_path] = (sha1, stat_result.st_size,
+                                              stat_result.st_mtime_ns)
+
+        if duplicate_rows:
+            with self._connection:
+                generation = self._get_generation()
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?, ?, 0)',
+                    [row + (generation,) for row in duplicate_rows])
+
+        return new_files
@@ -3,6 +3,7 @@
 import collections
 import datetime
 from enum import Enum
+import hashlib
 import os
 import random
 import shutil
@@ -21,7 +22,7 @@ from pingu_sdk.fuzzers import engine_common, options
 from pingu_sdk.fuzzing import corpus_manager, leak_blacklist
 from pingu_sdk.metrics import logs
 from pingu_sdk.system import environment, shell, archive
-from bot.tasks import task_creation, setup
+from bot.tasks import build_index, entity_cache, reaper, task_creation, setup
 from pingu_sdk.system import utils
 from pingu_sdk.datastore.data_constants import CORPUS_BACKUP_PUBLIC_LOOKBACK_DAYS, TaskState
 from pingu_sdk.datastore.models import CoverageInformation, FuzzTarget
@@ -179,6 +180,7 @@ class CorpusPurningContext(object):
         self.cross_pollination_method = cross_pollination_method
         self.tag = tag
         self.job = task_context.job
+        self.checkpoint = task_context.checkpoint
 
         self.merge_tmp_dir = None
         self.engine = engine.Engine.get(self.fuzzer.name)
@@ -269,7 +271,7 @@ class CorpusPurningContext(object):
     def cleanup(self):
         """Cleanup state."""
         for path in self._created_directories:
-            shell.remove_directory(path)
+            reaper.remove_directory(path)
 
     def _cross_pollinate_other_fuzzer_corpuses(self):
         """Add other fuzzer corpuses to shared corpus path for cross-pollination."""
@@ -310,7 +312,7 @@ class Runner(object):
         self.build_directory = build_directory
         self.context = context
 
-        self.target_path = engine_common.find_fuzzer_path(
+        self.target_path = build_index.find_fuzzer_path(
             self.build_directory, self.context.fuzz_target.binary)
         if not self.target_path:
             raise CorpusPruningException(
@@ -563,13 +565,25 @@ def _record_cross_pollination_stats(stats):
     }
 
 
+def _get_corpus_generation(directory):
+    """Return a digest of the names and sizes of the units in |directory|, which
+    changes whenever units are added to or removed from the corpus."""
+    digest = hashlib.sha1()
+    for root, _, files in shell.walk(directory):
+        for filename in sorted(files):
+            file_path = os.path.join(root, filename)
+            digest.update(('%s:%d\n' % (os.path.relpath(file_path, directory),
+                                        os.path.getsize(file_path))).encode('utf-8'))
+    return digest.hexdigest()
+
+
 def do_corpus_pruning(context:CorpusPurningContext, last_execution_failed, revision) -> CorpusPruningResult:
     """Run corpus pruning."""
     # Set |FUZZ_TARGET| environment variable to help with unarchiving only fuzz
     # target and its related files.
     environment.set_value('FUZZ_TARGET', context.fuzz_target.binary)
     build_helper = BuildHelper(job_id=context.job.id, revision=revision)
-    if not build_helper.setup_build():
+    if not setup.setup_build(build_helper):
         raise CorpusPruningException('Failed to setup build.')
 
     build_directory = environment.get_value('BUILD_DIR')
@@ -596,13 +610,45 @@ def do_corpus_pruning(context:CorpusPurningContext, last_execution_failed, revis
     
     initial_corpus_size = shell.get_directory_file_count(context.initial_corpus_path)
 
-    # Restore a small batch of quarantined units back to corpus.
-    context.restore_quarantined_units()
-
-    # Shrink to a minimized corpus using corpus merge.
-    pruner_stats = pruner.run(context.initial_corpus_path,
-                              context.minimized_corpus_path,
-                              context.bad_units_path)
+    # A checkpointed merge is only valid for the same build and the same
+    # corpus, fuzzing sessions keep adding units to it.
+    merge_key = None
+    merge_state = None
+    if context.checkpoint:
+        merge_key = {
+            'build_revision': environment.get_value('APP_REVISION'),
+            'corpus_generation': _get_corpus_generation(
+                context.initial_corpus_path),
+        }
+        merge_state = context.checkpoint.get('corpus_merge')
+
+    if merge_state and merge_state.get('key') == merge_key:
+        # The merge completed before a restart, reuse its output.
+        logs.log('Reusing checkpointed corpus merge.')
+        initial_corpus_size = merge_state['initial_corpus_size']
+        pruner_stats = merge_state['pruner_stats']
+        for name, directory in [('minimized_corpus', context.minimized_corpus_path),
+                                ('bad_units', context.bad_units_path)]:
+            shell.remove_directory(directory)
+            shutil.copytree(context.checkpoint.get_file_path(name), directory)
+    else:
+        # Restore a small batch of quarantined units back to corpus.
+        context.restore_quarantined_units()
+
+        # Shrink to a minimized corpus using corpus merge.
+        pruner_stats = pruner.run(context.initial_corpus_path,
+                                  context.minimized_corpus_path,
+                                  context.bad_units_path)
+
+        if context.checkpoint:
+            context.checkpoint.save_file('minimized_corpus',
+                                         context.minimized_corpus_path)
+            context.checkpoint.save_file('bad_units', context.bad_units_path)
+            context.checkpoint.set('corpus_merge', {
+                'key': merge_key,
+                'initial_corpus_size': initial_corpus_size,
+                'pruner_stats': pruner_stats,
+            })
 
     # Sync minimized corpus back to CS.
     context.sync_to_storage()
@@ -786,7 +832,7 @@ def _get_cross_pollinate_fuzzers(fuzzer_id, current_fuzzer_name, method, tag):
 
     default_backup_bucket = utils.default_backup_bucket()
     for target, target_job in selected_targets_and_jobs:
-        job = get_api_client().job_api.get_job(target_job.job_id)
+        job = entity_cache.get_job(target_job.job_id)
         if not job:
             continue
 
@@ -850,7 +896,7 @@ def execute_task(task_context: TaskContext):
     api_client = get_api_client()
     fuzzer_name, binary = full_fuzzer_name.split(',')
     environment.set_value("FUZZER_NAME", fuzzer_name)
-    fuzz_target = api_client.fuzz_target_api.get_fuzz_target_by_keyName(fuzzer_id=task_context.fuzzer.id, binary=binary)
+    fuzz_target = entity_cache.get_fuzz_target(task_context.fuzzer.id, binary)
     task_name = 'corpus_pruning_%s_%s' % (full_fuzzer_name, task_context.job.id)
     revision = 0  # Trunk revision
 
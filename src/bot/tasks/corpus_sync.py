@@ -0,0 +1,170 @@
+"""Delta sync of a fuzz target corpus from storage.
+
+A full sync unpacks every unit of the corpus archive over the local corpus.
+A delta sync compares the units listed in the archive with those on disk by
+size and CRC-32, extracts only the missing or changed ones with a bounded pool
+of workers, and removes the units that were deleted from storage.
+
+With a corpus manifest, local units with the size and mtime they had when they
+were last synced are taken as unchanged without reading them, and only units
+the manifest knows were synced are removed, so that units generated but not
+uploaded yet are kept. Without one, nothing is removed.
+
+The storage API only serves the corpus as one archive, so a delta sync still
+downloads all of it and fuzz tasks keep skipping syncs of recently synced
+corpora.
+"""
+
+import os
+import tempfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from pingu_sdk.metrics import logs
+from pingu_sdk.system import environment, shell
+
+DEFAULT_DOWNLOAD_WORKERS = 8
+CRC_CHUNK_SIZE = 64 * 1024
+
+
+def is_enabled():
+    """Return true if corpora are synced from storage by delta."""
+    return bool(environment.get_value('DELTA_CORPUS_SYNC', False))
+
+
+def get_download_workers():
+    """Return the number of units extracted in parallel."""
+    return max(
+        1,
+        environment.get_value('CORPUS_DOWNLOAD_WORKERS',
+                              DEFAULT_DOWNLOAD_WORKERS))
+
+
+def get_remote_units(archive_path):
+    """Return the size and CRC-32 of each unit in the corpus archive, by
+    path."""
+    with zipfile.ZipFile(archive_path) as archive:
+        return {
+            os.path.normpath(info.filename): (info.file_size, info.CRC)
+            for info in archive.infolist()
+            if not info.is_dir()
+        }
+
+
+def get_local_units(directory):
+    """Return the size of each unit in |directory|, by path relative to it."""
+    units = {}
+    for root, _, files in shell.walk(directory):
+        for filename in files:
+            path = os.path.join(root, filename)
+            try:
+                units[os.path.relpath(path, directory)] = os.path.getsize(path)
+            except OSError:
+                continue
+
+    return units
+
+
+def get_file_crc(file_path):
+    """Return the CRC-32 of the contents of |file_path|, as stored for zip
+    archive members."""
+    crc = 0
+    with open(file_path, 'rb') as file_handle:
+        for chunk in iter(lambda: file_handle.read(CRC_CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+
+    return crc
+
+
+def _is_unit_changed(directory, name, remote_unit, local_units,
+                     synced_units):
+    """Return true if the unit |name| is missing from |directory| or differs
+    from |remote_unit|, the size and CRC-32 of the unit in storage. Units with
+    the size and mtime recorded in |synced_units| are not read."""
+    size, crc = remote_unit
+    if local_units.get(name) != size:
+        return True
+
+    path = os.path.join(directory, name)
+    try:
+        if synced_units.get(name) == (size, os.stat(path).st_mtime_ns):
+            return False
+
+        return get_file_crc(path) != crc
+    except (IOError, OSError):
+        return True
+
+
+def _extract_units(archive_path, names, directory):
+    """Extract the units |names| of the archive into |directory|."""
+    with zipfile.ZipFile(archive_path) as archive:
+        members = {
+            os.path.normpath(info.filename): info for info in archive.infolist()
+        }
+        for name in names:
+            archive.extract(members[name], directory)
+
+
+def _download_archive(corpus_storage):
+    """Download the corpus archive of |corpus_storage| and return its path."""
+    corpus_data = corpus_storage.api_client.download_corpus(
+        corpus_storage.project_id, corpus_storage.fuzz_target_id,
+        corpus_storage.kind)
+
+    handle, archive_path = tempfile.mkstemp(
+        suffix='.zip', dir=environment.get_value('BOT_TMPDIR'))
+    with os.fdopen(handle, 'wb') as file_handle:
+        file_handle.write(corpus_data)
+
+    return archive_path
+
+
+def sync_to_disk(corpus_storage, directory, manifest=None):
+    """Make |directory| match the corpus of |corpus_storage|, extracting only
+    the units that are missing or changed locally, and removing those of the
+    synced units in |manifest| that are gone from storage. Return true on
+    success."""
+    try:
+        archive_path = _download_archive(corpus_storage)
+    except Exception as e:
+        logs.log_error('Failed to download corpus: %s' % str(e))
+        return False
+
+    try:
+        remote_units = get_remote_units(archive_path)
+        shell.create_directory(directory, create_intermediates=True)
+        local_units = get_local_units(directory)
+        synced_units = manifest.get_synced_units() if manifest else {}
+
+        missing_units = sorted(
+            name for name, remote_unit in remote_units.items()
+            if _is_unit_changed(directory, name, remote_unit, local_units,
+                                synced_units))
+        deleted_units = [
+            name for name in local_units
+            if name not in remote_units and name in synced_units
+        ]
+
+        for name in deleted_units:
+            shell.remove_file(os.path.join(directory, name))
+
+        worker_count = min(get_download_workers(), len(missing_units)) or 1
+        with ThreadPoolExecutor(max_workers=worker_count) as executor:
+            futures = [
+                executor.submit(_extract_units, archive_path,
+                                missing_units[i::worker_count], directory)
+                for i in range(worker_count)
+            ]
+            for future in futures:
+                future.result()
+    except (IOError, OSError, zipfile.BadZipFile) as e:
+        logs.log_error('Failed to sync corpus to %s: %s' % (directory, str(e)))
+        return False
+    finally:
+        shell.remove_file(archive_path)
+
+    logs.log('Corpus delta sync to %s: %d units, %d extracted, %d removed.' %
+             (directory, len(remote_units), len(missing_units),
+              len(deleted_units)))
+    return True
@@ -0,0 +1,272 @@
+"""Local merging of coverage files before upload.
+
+Every fuzzing round writes its own coverage files, so consecutive rounds and
+sessions upload mostly the same coverage again. SanitizerCoverage (.sancov
+format) PCs and LCOV line coverage are merged here with the coverage already
+uploaded for the same fuzz target and revision, which is kept on disk in the
+same formats, and only the coverage not uploaded before is sent, as one file
+per format. Coverage files in other formats (e.g. .profraw) are uploaded as
+they are.
+"""
+
+import array
+import os
+import shutil
+import sys
+
+from pingu_sdk.fuzzing import coverage_uploader
+from pingu_sdk.metrics import logs
+from pingu_sdk.system import environment, shell
+
+COVERAGE_DIRECTORY_NAME = 'coverage'
+DELTA_DIRECTORY_NAME = 'coverage-delta'
+
+SANCOV_EXTENSION = '.sancov'
+LCOV_EXTENSION = '.lcov'
+
+# Magic numbers starting SanitizerCoverage files with 64 and 32 bit PCs.
+SANCOV_MAGIC_64 = 0xC0BFFFFFFFFFFF64
+SANCOV_MAGIC_32 = 0xC0BFFFFFFFFFFF32
+SANCOV_HEADER_SIZE = 8
+
+# Records an LCOV tracefile can start with.
+LCOV_PREFIXES = (b'TN:', b'SF:')
+
+
+def is_enabled():
+    """Return true if coverage is merged locally before upload."""
+    return bool(environment.get_value('MERGE_COVERAGE', False))
+
+
+def get_coverage_directory():
+    """Return the directory holding the uploaded coverage of each target."""
+    return os.path.join(environment.get_value('BOT_DIR'), COVERAGE_DIRECTORY_NAME)
+
+
+def get_state_path(fuzz_target_id, revision, extension):
+    """Return where the uploaded coverage of a fuzz target revision is kept in
+    the format of |extension|."""
+    return os.path.join(get_coverage_directory(),
+                        '%s-%s%s' % (fuzz_target_id, revision, extension))
+
+
+def read_sancov(file_path):
+    """Return the set of PCs in a SanitizerCoverage file, or None if
+    |file_path| is not one."""
+    with open(file_path, 'rb') as file_handle:
+        header = file_handle.read(SANCOV_HEADER_SIZE)
+        if len(header) < SANCOV_HEADER_SIZE:
+            return None
+
+        magic = int.from_bytes(header, 'little')
+        if magic == SANCOV_MAGIC_64:
+            pcs = array.array('Q')
+        elif magic == SANCOV_MAGIC_32:
+            pcs = array.array('I')
+        else:
+            return None
+
+        data = file_handle.read()
+
+    data = data[:len(data) - len(data) % pcs.itemsize]
+    pcs.frombytes(data)
+    if sys.byteorder != 'little':
+        pcs.byteswap()
+    return set(pcs)
+
+
+def write_sancov(file_path, pcs):
+    """Write |pcs| as a SanitizerCoverage file with 64 bit PCs."""
+    pcs = array.array('Q', sorted(pcs))
+    if sys.byteorder != 'little':
+        pcs.byteswap()
+
+    with open(file_path, 'wb') as file_handle:
+        file_handle.write(SANCOV_MAGIC_64.to_bytes(SANCOV_HEADER_SIZE, 'little'))
+        file_handle.write(pcs.tobytes())
+
+
+def read_lcov(file_path):
+    """Return the covered lines in an LCOV tracefile as a dict of source files
+    to dicts of line numbers to hit counts, or None if |file_path| is not one.
+    Lines that were not hit are left out."""
+    with open(file_path, 'rb') as file_handle:
+        if file_handle.read(len(LCOV_PREFIXES[0])) not in LCOV_PREFIXES:
+            return None
+
+        file_handle.seek(0)
+        try:
+            text = file_handle.read().decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+    lines = {}
+    source_file_lines = None
+    for record in text.splitlines():
+        if record.startswith('SF:'):
+            source_file_lines = lines.setdefault(record[3:], {})
+        elif record == 'end_of_record':
+            source_file_lines = None
+        elif record.startswith('DA:') and source_file_lines is not None:
+            try:
+                line, count = record[3:].split(',')[:2]
+                line, count = int(line), int(count)
+            except ValueError:
+                continue
+
+            if count > 0:
+                source_file_lines[line] = source_file_lines.get(line, 0) + count
+
+    return lines
+
+
+def write_lcov(file_path, lines):
+    """Write the covered |lines| returned by read_lcov as an LCOV tracefile."""
+    with open(file_path, 'w') as file_handle:
+        for source_file, source_file_lines in sorted(lines.items()):
+            file_handle.write('SF:%s\n' % source_file)
+            for line, count in sorted(source_file_lines.items()):
+                file_handle.write('DA:%d,%d\n' % (line, count))
+            file_handle.write('end_of_record\n')
+
+
+def _merge_lines(lines, other_lines):
+    """Add the hit counts of |other_lines| to |lines|."""
+    for source_file, other_source_file_lines in other_lines.items():
+        source_file_lines = lines.setdefault(source_file, {})
+        for line, count in other_source_file_lines.items():
+            source_file_lines[line] = source_file_lines.get(line, 0) + count
+
+
+def _get_new_lines(lines, uploaded_lines):
+    """Return the lines of |lines| that are not in |uploaded_lines|."""
+    new_lines = {}
+    for source_file, source_file_lines in lines.items():
+        uploaded_source_file_lines = uploaded_lines.get(source_file, {})
+        new_source_file_lines = {
+            line: count
+            for line, count in source_file_lines.items()
+            if line not in uploaded_source_file_lines
+        }
+        if new_source_file_lines:
+            new_lines[source_file] = new_source_file_lines
+
+    return new_lines
+
+
+def _count_lines(lines):
+    """Return the number of covered lines in |lines|."""
+    return sum(len(source_file_lines) for source_file_lines in lines.values())
+
+
+def _load_uploaded_coverage(state_path, read_function, default):
+    """Return the coverage uploaded before in the file |state_path|, or
+    |default|."""
+    try:
+        coverage = read_function(state_path)
+    except (IOError, OSError):
+        return default
+
+    return default if coverage is None else coverage
+
+
+def _save_uploaded_coverage(fuzz_target_id, revision, pcs, lines):
+    """Save the uploaded coverage of a fuzz target revision, and drop the
+    coverage kept for its other revisions."""
+    state_paths = {
+        get_state_path(fuzz_target_id, revision, SANCOV_EXTENSION): pcs,
+        get_state_path(fuzz_target_id, revision, LCOV_EXTENSION): lines,
+    }
+    state_directory = get_coverage_directory()
+    shell.create_directory(state_directory, create_intermediates=True)
+
+    fuzz_target_prefix = '%s-' % fuzz_target_id
+    for filename in os.listdir(state_directory):
+        file_path = os.path.join(state_directory, filename)
+        if filename.startswith(fuzz_target_prefix) and file_path not in state_paths:
+            shell.remove_file(file_path)
+
+    for state_path, coverage in state_paths.items():
+        if not coverage:
+            continue
+
+        temp_path = state_path + '.tmp'
+        if state_path.endswith(SANCOV_EXTENSION):
+            write_sancov(temp_path, coverage)
+        else:
+            write_lcov(temp_path, coverage)
+        os.replace(temp_path, state_path)
+
+
+def upload_coverage(revision, project_id, fuzz_target_id, binary_path,
+                    artifacts_directory, fuzzer_name):
+    """Upload the coverage in |artifacts_directory| that was not uploaded for
+    this fuzz target revision before."""
+    uploaded_pcs = _load_uploaded_coverage(
+        get_state_path(fuzz_target_id, revision, SANCOV_EXTENSION), read_sancov,
+        set())
+    uploaded_lines = _load_uploaded_coverage(
+        get_state_path(fuzz_target_id, revision, LCOV_EXTENSION), read_lcov, {})
+
+    delta_directory = os.path.join(artifacts_directory, DELTA_DIRECTORY_NAME)
+    shell.remove_directory(delta_directory, recreate=True)
+
+    session_pcs = set()
+    session_lines = {}
+    merged_files_count = 0
+    other_files_count = 0
+    for coverage_file in coverage_uploader._get_coverage_files(
+            artifacts_directory):
+        if not os.path.isfile(coverage_file):
+            continue
+
+        pcs = read_sancov(coverage_file)
+        if pcs is not None:
+            session_pcs.update(pcs)
+            merged_files_count += 1
+            continue
+
+        lines = read_lcov(coverage_file)
+        if lines is not None:
+            _merge_lines(session_lines, lines)
+            merged_files_count += 1
+            continue
+
+        shutil.copy(coverage_file, delta_directory)
+        other_files_count += 1
+
+    new_pcs = session_pcs - uploaded_pcs
+    if new_pcs:
+        write_sancov(
+            os.path.join(delta_directory, '%s.delta.cov' % fuzzer_name), new_pcs)
+
+    new_lines = _get_new_lines(session_lines, uploaded_lines)
+    if new_lines:
+        write_lcov(
+            os.path.join(delta_directory, '%s.delta.lcov' % fuzzer_name),
+            new_lines)
+
+    logs.log('Merged %d coverage files into %d new PCs (%d uploaded before) and '
+             '%d new lines (%d uploaded before), %d other coverage files.' %
+             (merged_files_count, len(new_pcs), len(uploaded_pcs),
+              _count_lines(new_lines), _count_lines(uploaded_lines),
+              other_files_count))
+
+    try:
+        if not new_pcs and not new_lines and not other_files_count:
+            logs.log('No new coverage to upload.')
+            return
+
+        coverage_uploader.upload_coverage(
+            project_id=project_id,
+            fuzz_target_id=fuzz_target_id,
+            binary_path=binary_path,
+            artifacts_directory=delta_directory,
+            fuzzer_name=fuzzer_name)
+    finally:
+        shell.remove_directory(delta_directory, ignore_errors=True)
+
+    if new_pcs or new_lines:
+        _merge_lines(uploaded_lines, new_lines)
+        _save_uploaded_coverage(fuzz_target_id, revision, uploaded_pcs | new_pcs,
+                                uploaded_lines)
@@ -0,0 +1,217 @@
+"""Disk budget for the caches that are kept across tasks.
+
+Scratch directories (testcases, temp, crash stacktraces) are wiped after every
+task. Builds, fuzzers and corpora are kept so that the next task on the same
+job or target can reuse them, and are evicted least recently used first once a
+category exceeds its quota or all of them exceed the total budget. Entries
+used by a running task are locked by it and never evicted.
+"""
+
+import os
+import time
+
+from pingu_sdk.build_management.build_managers.base_build import (
+    BaseBuild, TIMESTAMP_FILE)
+from pingu_sdk.metrics import logs, monitor
+from pingu_sdk.system import environment, shell
+from bot.tasks import cache_lock
+from bot.tasks import reaper
+
+# Cache categories and the directory holding their entries.
+CATEGORIES = {
+    'builds': 'BUILDS_DIR',
+    'fuzzers': 'FUZZERS_DIR',
+    'corpora': 'DATA_BUNDLES_DIR',
+}
+
+BYTES_IN_GB = 1024**3
+
+CACHE_EVICTION_COUNT = monitor.CounterMetric(
+    'bot/cache/eviction_count',
+    description='Count of cache entries evicted to stay within the disk budget',
+    field_spec=[
+        monitor.StringField('category'),
+    ])
+
+CACHE_EVICTED_BYTES = monitor.CounterMetric(
+    'bot/cache/evicted_bytes',
+    description='Bytes evicted from the caches to stay within the disk budget',
+    field_spec=[
+        monitor.StringField('category'),
+    ])
+
+_stats = {}
+
+
+class CacheEntry(object):
+    """A cached build, fuzzer or corpus directory."""
+
+    def __init__(self, category, path):
+        self.category = category
+        self.path = path
+        self.size = shell.get_directory_size(path)
+        self.last_used_time = get_last_used_time(category, path)
+
+    def delete(self):
+        """Delete this entry."""
+        logs.log('Evicting %s cache entry %s (%d bytes).' %
+                 (self.category, self.path, self.size))
+        reaper.remove_directory(self.path, ignore_errors=True)
+
+        stats = _stats.setdefault(self.category, {
+            'evictions': 0,
+            'evicted_bytes': 0,
+        })
+        stats['evictions'] += 1
+        stats['evicted_bytes'] += self.size
+        CACHE_EVICTION_COUNT.increment({'category': self.category})
+        CACHE_EVICTED_BYTES.increment_by(self.size, {'category': self.category})
+
+
+def _get_gb_value(name):
+    """Return the environment value |name|, in GB, as bytes or None."""
+    value = environment.get_value(name)
+    if value is None:
+        return None
+
+    return int(float(value) * BYTES_IN_GB)
+
+
+def get_budget():
+    """Return the total disk budget of the caches in bytes, or None."""
+    return _get_gb_value('CACHE_DISK_BUDGET_GB')
+
+
+def get_quota(category):
+    """Return the disk quota of |category| in bytes, or None."""
+    return _get_gb_value('CACHE_%s_QUOTA_GB' % category.upper())
+
+
+def is_enabled():
+    """Return true if a cache budget or quota is configured."""
+    return (get_budget() is not None or
+            any(get_quota(category) is not None for category in CATEGORIES))
+
+
+def get_stats():
+    """Return eviction counts and bytes per category."""
+    return {category: dict(stats) for category, stats in _stats.items()}
+
+
+def get_last_used_time(category, path):
+    """Return when the cache entry at |path| was last used."""
+    if category == 'builds' and os.path.exists(
+            os.path.join(path, TIMESTAMP_FILE)):
+        return BaseBuild(path).last_used_time()
+
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def get_entry_path(path):
+    """Return the path of the cache entry holding |path|, or None if it is not
+    in a cache."""
+    path = os.path.abspath(path)
+    for directory_name in CATEGORIES.values():
+        directory = environment.get_value(directory_name)
+        if not directory:
+            continue
+
+        relative_path = os.path.relpath(path, os.path.abspath(directory))
+        if relative_path == os.curdir or relative_path.startswith(os.pardir):
+            continue
+
+        return os.path.join(
+            os.path.abspath(directory),
+            relative_path.split(os.sep)[0])
+
+    return None
+
+
+def mark_used(path):
+    """Record that the cache entry holding |path| was used by the current
+    task, and protect it from eviction until the task finishes."""
+    entry_path = get_entry_path(path)
+    if not entry_path:
+        return
+
+    try:
+        os.utime(entry_path)
+    except OSError:
+        pass
+
+    cache_lock.hold_shared(cache_lock.get_entry_lock_name(entry_path))
+
+
+def release_used():
+    """Allow the entries used by the current task to be evicted again."""
+    cache_lock.release_held()
+
+
+def get_entries(category):
+    """Return the entries of |category|, least recently used first."""
+    directory = environment.get_value(CATEGORIES[category])
+    if not directory or not os.path.isdir(directory):
+        return []
+
+    entries = [
+        CacheEntry(category, entry.path)
+        for entry in os.scandir(directory)
+        if entry.is_dir()
+    ]
+    return sorted(entries, key=lambda entry: entry.last_used_time)
+
+
+def _evict(entries, limit):
+    """Evict the least recently used of |entries| until their size is within
+    |limit|, skipping those used by running tasks. Return the entries that are
+    left."""
+    total_size = sum(entry.size for entry in entries)
+    remaining_entries = []
+    for entry in entries:
+        if total_size <= limit:
+            remaining_entries.append(entry)
+            continue
+
+        with cache_lock.try_lock(cache_lock.get_entry_lock_name(
+                entry.path)) as locked:
+            if not locked:
+                logs.log('Not evicting %s cache entry %s, it is in use.' %
+                         (entry.category, entry.path))
+                remaining_entries.append(entry)
+                continue
+
+            entry.delete()
+        total_size -= entry.size
+
+    return remaining_entries
+
+
+def enforce_budget():
+    """Evict cache entries until every category is within its quota and all
+    of them are within the total budget. Runs under the locks of all cache
+    categories, since task slots share the caches and may be setting up an
+    entry at the same time, and skips the entries other tasks are using."""
+    if not is_enabled():
+        return
+
+    start_time = time.time()
+    with cache_lock.lock_all(CATEGORIES):
+        entries = []
+        for category in CATEGORIES:
+            category_entries = get_entries(category)
+            quota = get_quota(category)
+            if quota is not None:
+                category_entries = _evict(category_entries, quota)
+            entries.extend(category_entries)
+
+        budget = get_budget()
+        if budget is not None:
+            entries.sort(key=lambda entry: entry.last_used_time)
+            entries = _evict(entries, budget)
+
+    logs.log('Cache uses %d bytes after eviction (took %.1fs).' %
+             (sum(entry.size for entry in entries), time.time() - start_time),
+             eviction_stats=get_stats())
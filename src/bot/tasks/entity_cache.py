@@ -0,0 +1,188 @@
+"""Read-through cache for Pingu API entities that are read on every task.
+
+Cached entities are served without asking the API until their time to live
+expires, so an entity edited while bots run is picked up within that time.
+Writes made by the bot itself drop the cached copies right away.
+"""
+
+import collections
+import copy
+import threading
+import time
+
+from pingu_sdk.datastore.pingu_api.pingu_api_client import get_api_client
+from pingu_sdk.system import environment
+
+# Default number of seconds a cached entity is considered fresh.
+DEFAULT_TTL_IN_SECONDS = 5 * 60
+
+# Default maximum number of cached entities.
+DEFAULT_CAPACITY = 256
+
+
+class EntityCache(object):
+    """In-memory LRU cache of entities with a time to live."""
+
+    def __init__(self, capacity, ttl_in_seconds):
+        self.capacity = capacity
+        self.ttl_in_seconds = ttl_in_seconds
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+
+    def get(self, key):
+        """Return a copy of the cached value for |key|, or None if it is missing
+        or expired."""
+        with self.lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > time.time():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                # Callers are free to mutate what they get back.
+                return copy.deepcopy(entry[1])
+
+            if entry:
+                del self._cache[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Put (key, value) into cache, evicting the least recently used entry
+        when full. None is not cached."""
+        if value is None:
+            return
+
+        with self.lock:
+            self._cache[key] = (time.time() + self.ttl_in_seconds,
+                                copy.deepcopy(value))
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drop |key| from the cache."""
+        with self.lock:
+            self._cache.pop(key, None)
+
+    def clear(self):
+        """Drop everything and reset the counters."""
+        with self.lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+
+_cache = None
+
+
+def configure():
+    """Enable the process wide entity cache. Until this is called, every read
+    goes to the API."""
+    global _cache
+    _cache = EntityCache(
+        capacity=environment.get_value('ENTITY_CACHE_SIZE', DEFAULT_CAPACITY),
+        ttl_in_seconds=environment.get_value('ENTITY_CACHE_TTL',
+                                             DEFAULT_TTL_IN_SECONDS))
+
+
+def get_stats():
+    """Return the hit and miss counters of the cache."""
+    if _cache is None:
+        return {'hits': 0, 'misses': 0, 'size': 0}
+
+    return {'hits': _cache.hits, 'misses': _cache.misses, 'size': len(_cache)}
+
+
+def _get(key, fetch, refresh=False):
+    """Return the entity for |key|, calling |fetch| on a miss."""
+    cache = _cache
+    if cache is None:
+        return fetch()
+
+    if not refresh:
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+    value = fetch()
+    cache.put(key, value)
+    return value
+
+
+def get_job(job_id):
+    """Return the job with the given id."""
+    return _get(('job', str(job_id)),
+                lambda: get_api_client().job_api.get_job(job_id))
+
+
+def get_project(project_id):
+    """Return the project with the given id."""
+    return _get(
+        ('project', str(project_id)),
+        lambda: get_api_client().project_api.get_project_by_id(project_id))
+
+
+def _get_fuzzer(key, fetch, refresh):
+    """Return a fuzzer, keeping the by-name and by-id entries on the same
+    revision."""
+
+    def fetch_and_alias():
+        fuzzer = fetch()
+        if fuzzer is not None:
+            _cache.put(('fuzzer', fuzzer.name), fuzzer)
+            _cache.put(('fuzzer_id', str(fuzzer.id)), fuzzer)
+        return fuzzer
+
+    if _cache is None:
+        return fetch()
+
+    return _get(key, fetch_and_alias, refresh=refresh)
+
+
+def get_fuzzer(name, refresh=False):
+    """Return the fuzzer with the given name."""
+    return _get_fuzzer(('fuzzer', name),
+                       lambda: get_api_client().fuzzer_api.get_fuzzer(name=name),
+                       refresh)
+
+
+def get_fuzzer_by_id(fuzzer_id, refresh=False):
+    """Return the fuzzer with the given id. Use |refresh| to fetch it even if
+    a cached copy is still fresh."""
+    return _get_fuzzer(('fuzzer_id', str(fuzzer_id)),
+                       lambda: get_api_client().fuzzer_api.get_fuzzer_by_id(
+                           str(fuzzer_id)),
+                       refresh)
+
+
+def get_trials(app_name):
+    """Return the trials for the given application."""
+    return _get(('trials', app_name),
+                lambda: get_api_client().trial_api.get_trials_by_name(app_name))
+
+
+def get_fuzz_target(fuzzer_id, binary):
+    """Return the fuzz target of a fuzzer with the given binary name."""
+    return _get(('fuzz_target', str(fuzzer_id), binary),
+                lambda: get_api_client().fuzz_target_api.
+                get_fuzz_target_by_keyName(fuzzer_id=fuzzer_id, binary=binary))
+
+
+def invalidate_fuzzer(fuzzer):
+    """Drop all cached copies of |fuzzer|."""
+    cache = _cache
+    if cache is None:
+        return
+
+    cache.invalidate(('fuzzer', fuzzer.name))
+    cache.invalidate(('fuzzer_id', str(fuzzer.id)))
+
+
+def update_fuzzer(fuzzer):
+    """Write |fuzzer| and drop the stale cached copies."""
+    get_api_client().fuzzer_api.update_fuzzer(fuzzer)
+    invalidate_fuzzer(fuzzer)
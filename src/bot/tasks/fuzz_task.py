@@ -5,9 +5,11 @@ from collections import namedtuple
 import datetime
 import itertools
 import os
+import queue
 import random
 import re
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import List, Tuple
 
 import pytz
@@ -25,7 +27,10 @@ from pingu_sdk.metrics import logs, monitoring_metrics, fuzzer_stats, fuzzer_log
 from pingu_sdk.platforms import android
 from pingu_sdk.stacktraces import CrashInfo
 from pingu_sdk.system import environment, errors, shell, process_handler
-from bot.tasks import setup, task_creation, trials
+from bot.tasks import (blackbox_logs, build_index, cache_lock,
+                       corpus_manifest, corpus_sync, coverage_merger,
+                       disk_cache, entity_cache, setup, task_creation,
+                       throughput, tracing, trials, upload_queue)
 from pingu_sdk.utils import utils, dates
 from pingu_sdk.fuzzers.libFuzzer import stats as libfuzzer_stats
 from pingu_sdk.fuzzers import engine
@@ -49,12 +54,25 @@ FUZZER_METADATA_REGEX = re.compile(r'metadata::(\w+):\s*(.*)')
 FUZZER_FAILURE_THRESHOLD = 0.33
 MAX_GESTURES = 30
 MAX_NEW_CORPUS_FILES = 500
+CORPUS_UPLOAD_BATCH_SIZE = 100
 SELECTION_METHOD_DISTRIBUTION = [
     SelectionMethod('default', .7),
     SelectionMethod('multi_armed_bandit', .3)
 ]
 THREAD_WAIT_TIMEOUT = 1
 
+# Seconds to wait for results of parallel fuzzing rounds before checking that
+# the instances are still running.
+PARALLEL_FUZZ_ROUNDS_POLL_INTERVAL = 5
+
+# Name of the coverage profile of a parallel fuzzing round, in its artifacts
+# directory.
+PROFILE_FILENAME = 'default.profraw'
+
+# Default number of seconds allowed for distilling new corpus units.
+DEFAULT_CORPUS_DISTILLATION_TIMEOUT = 10 * 60
+CORPUS_DISTILLATION_ARGUMENTS = ['-timeout=5', '-rss_limit_mb=2560']
+
 
 class FuzzTaskException(Exception):
     """Fuzz task exception."""
@@ -472,13 +490,21 @@ class SyncCorpusStorage(object):
         self.corpus_storage = corpus_manager.FuzzTargetCorpus(
             project_id, fuzz_target_id, log_results=False)
 
-        self._corpus_directory = corpus_directory
+        self.corpus_directory = corpus_directory
         self._data_directory = data_directory
         self._project_qualified_target_name = project_qualified_target_name
         self._synced_files = set()
 
+        # Tracks synced files on disk instead of in |_synced_files|.
+        self._manifest = None
+        if corpus_manifest.is_enabled():
+            self._manifest = corpus_manifest.CorpusManifest(
+                corpus_manifest.get_manifest_path(
+                    data_directory, project_qualified_target_name),
+                corpus_directory)
+
     def _walk(self):
-        for root, _, files in shell.walk(self._corpus_directory):
+        for root, _, files in shell.walk(self.corpus_directory):
             for filename in files:
                 yield os.path.join(root, filename)
 
@@ -498,7 +524,7 @@ class SyncCorpusStorage(object):
 
         # Check if the corpus was recently synced. If yes, set a flag so that we
         # don't sync it again and save some time.
-        if last_sync_time and os.path.exists(self._corpus_directory):
+        if last_sync_time and os.path.exists(self.corpus_directory):
             
             age = current_time - last_sync_time
             
@@ -509,15 +535,26 @@ class SyncCorpusStorage(object):
                 already_synced = True
 
         time_before_sync_start = time.time()
-        result = already_synced or self.corpus_storage.rsync_to_disk(self._corpus_directory)
-        self._synced_files.clear()
-        self._synced_files.update(self._walk())
+        if already_synced:
+            result = True
+        elif corpus_sync.is_enabled():
+            result = corpus_sync.sync_to_disk(self.corpus_storage,
+                                              self.corpus_directory,
+                                              manifest=self._manifest)
+        else:
+            result = self.corpus_storage.rsync_to_disk(self.corpus_directory)
+        if self._manifest:
+            synced_files_count = self._manifest.update()
+        else:
+            self._synced_files.clear()
+            self._synced_files.update(self._walk())
+            synced_files_count = len(self._synced_files)
 
-        logs.log('%d corpus files for target %s synced to disk.' % (len(
-            self._synced_files), self._project_qualified_target_name))
+        logs.log('%d corpus files for target %s synced to disk.' % (
+            synced_files_count, self._project_qualified_target_name))
 
         # On success of rsync, update the last sync file with current timestamp.
-        if result and self._synced_files and not already_synced:
+        if result and synced_files_count and not already_synced:
             utils.write_data_to_file(time_before_sync_start, sync_file_path)
 
             # if environment.is_trusted_host():
@@ -528,12 +565,35 @@ class SyncCorpusStorage(object):
         return result
 
     def upload_files(self, new_files):
-        """Update state after files are uploaded."""
-        result = self.corpus_storage.upload_files(new_files)
-        self._synced_files.update(new_files)
+        """Upload |new_files| in batches of CORPUS_UPLOAD_BATCH_SIZE files, one
+        request per batch, and record the files of the batches that were
+        uploaded as synced, so that those of failed batches are retried.
+        Return true if all batches were uploaded."""
+        if not new_files:
+            return self.corpus_storage.upload_files(new_files)
+
+        result = True
+        for i in range(0, len(new_files), CORPUS_UPLOAD_BATCH_SIZE):
+            batch = new_files[i:i + CORPUS_UPLOAD_BATCH_SIZE]
+            # The corpus storage returns False on failure, and the (None)
+            # result of the API call on success.
+            if self.corpus_storage.upload_files(batch) is False:
+                logs.log_warn('Failed to upload %d corpus files.' % len(batch))
+                result = False
+                continue
+
+            if self._manifest:
+                self._manifest.add(batch)
+            else:
+                self._synced_files.update(batch)
 
         return result
 
+    def is_synced_content(self, sha1):
+        """Return true if a unit with content |sha1| is known to be in storage.
+        Only tracked with a corpus manifest."""
+        return bool(self._manifest and self._manifest.has_hash(sha1))
+
     def get_new_files(self):
         """Return list of new files in the directory that were generated by the
     fuzzer."""
@@ -546,6 +606,9 @@ class SyncCorpusStorage(object):
                 if os.path.basename(f).startswith(device_serial)
             ]
 
+        if self._manifest:
+            return self._manifest.get_new_files()
+
         new_files = []
         for file_path in self._walk():
             if file_path not in self._synced_files:
@@ -554,9 +617,109 @@ class SyncCorpusStorage(object):
         return new_files
 
 
+def is_corpus_distillation_enabled():
+    """Return true if new corpus units are distilled before upload."""
+    return (bool(environment.get_value('CORPUS_DISTILLATION', False)) and
+            not environment.is_android_kernel())
+
+
+def distill_new_corpus_files(engine_impl: Engine,
+                             corpus_storage: SyncCorpusStorage, new_files):
+    """Merge |new_files| into the synced corpus of |corpus_storage| with the
+    engine, keeping only the units that add coverage over it. Return the new
+    files that are left, or |new_files| if the engine can't distill them."""
+    target_path = environment.get_value('TARGET_PATH')
+    corpus_directory = corpus_storage.corpus_directory
+    distillation_directory = os.path.join(
+        environment.get_value('FUZZ_INPUTS_DISK'), 'corpus_distillation')
+    new_units_directory = os.path.join(distillation_directory, 'new')
+    reproducers_directory = os.path.join(distillation_directory, 'reproducers')
+    shell.remove_directory(distillation_directory, recreate=True)
+    shell.create_directory(new_units_directory)
+    shell.create_directory(reproducers_directory)
+
+    # Move the new units out of the corpus, so that the merge treats the
+    # synced units as the initial corpus and only copies back the new units
+    # adding coverage features.
+    moved_files = []
+    for new_file in new_files:
+        moved_file = os.path.join(
+            new_units_directory, '%d-%s' % (len(moved_files),
+                                            os.path.basename(new_file)))
+        shell.move(new_file, moved_file)
+        moved_files.append((new_file, moved_file))
+
+    timeout = environment.get_value('CORPUS_DISTILLATION_TIMEOUT',
+                                    DEFAULT_CORPUS_DISTILLATION_TIMEOUT)
+    try:
+        engine_impl.minimize_corpus(target_path,
+                                    CORPUS_DISTILLATION_ARGUMENTS,
+                                    [new_units_directory], corpus_directory,
+                                    reproducers_directory, timeout)
+    except Exception as e:
+        logs.log_warn('Failed to distill new corpus units, uploading all '
+                      'of them: %s' % str(e))
+        for new_file, moved_file in moved_files:
+            shell.move(moved_file, new_file)
+        return new_files
+    finally:
+        shell.remove_directory(distillation_directory, ignore_errors=True)
+
+    distilled_files = corpus_storage.get_new_files()
+    logs.log('Distilled %d new corpus files to %d adding coverage.' %
+             (len(new_files), len(distilled_files)))
+    return distilled_files
+
+
+def is_content_addressed_corpus_enabled():
+    """Return true if new corpus units are renamed after their content before
+    upload."""
+    return bool(environment.get_value('CONTENT_ADDRESSED_CORPUS', False))
+
+
+def get_corpus_upload_path(file_path, uploaded_hashes, is_synced=None):
+    """Return the path to upload the new corpus unit |file_path| from, or None
+    if its content is in |uploaded_hashes| or in storage according to
+    |is_synced|. If CONTENT_ADDRESSED_CORPUS is set, the unit is renamed after
+    the SHA-1 of its contents, as libFuzzer names its own units, so that
+    storage keys uploads by content, and copies of uploaded content, including
+    those already in the corpus under the hash name, are removed."""
+    try:
+        sha1 = corpus_manifest.get_file_hash(file_path)
+    except (IOError, OSError):
+        return None
+
+    content_addressed = is_content_addressed_corpus_enabled()
+    if sha1 in uploaded_hashes or (is_synced and is_synced(sha1)):
+        if content_addressed:
+            shell.remove_file(file_path)
+        return None
+
+    if not content_addressed:
+        uploaded_hashes.add(sha1)
+        return file_path
+
+    content_addressed_path = os.path.join(os.path.dirname(file_path), sha1)
+    if content_addressed_path == file_path:
+        uploaded_hashes.add(sha1)
+        return file_path
+
+    if os.path.exists(content_addressed_path):
+        shell.remove_file(file_path)
+        return None
+
+    try:
+        os.rename(file_path, content_addressed_path)
+    except OSError:
+        content_addressed_path = file_path
+
+    uploaded_hashes.add(sha1)
+    return content_addressed_path
+
+
 def upload_testcase_run_stats(testcase_run):
     """Upload TestcaseRun stats."""
-    fuzzer_stats.upload_stats([testcase_run])
+    upload_queue.upload_stats(testcase_run)
 
 
 def add_additional_testcase_run_data(testcase_run,
@@ -873,8 +1036,7 @@ def store_fuzzer_run_results(testcase_file_paths, fuzzer: Fuzzer, fuzzer_command
                                           fuzzer_command, truncated_fuzzer_output)
 
     # Refresh the fuzzer object.
-    client = get_api_client()
-    fuzzer = client.fuzzer_api.get_fuzzer_by_id(str(fuzzer.id))
+    fuzzer = entity_cache.get_fuzzer_by_id(fuzzer.id, refresh=True)
 
     # Make sure fuzzer is same as the latest revision.
     if not fuzzer:
@@ -888,7 +1050,7 @@ def store_fuzzer_run_results(testcase_file_paths, fuzzer: Fuzzer, fuzzer_command
     fuzzer.result = generated_testcase_string
     fuzzer.result_timestamp = datetime.datetime.utcnow()
     fuzzer.return_code = fuzzer_return_code
-    client.fuzzer_api.update_fuzzer(fuzzer)
+    entity_cache.update_fuzzer(fuzzer)
 
     logs.log('Finished storing results from fuzzer run.')
 
@@ -1123,6 +1285,18 @@ def _update_testcase_variant_if_needed(group: CrashGroup, context: FuzzingSessio
     api_cliet.testcase_variant_api.update_testcase_variant(variant)
 
 
+@tracing.traced('coverage_upload')
+def upload_coverage(revision=None, **kwargs):
+    """Upload the coverage files of a fuzzing session. If enabled, only the
+    coverage not uploaded for this |revision| before is sent."""
+    if coverage_merger.is_enabled():
+        coverage_merger.upload_coverage(revision, **kwargs)
+        return
+
+    coverage_uploader.upload_coverage(**kwargs)
+
+
+@tracing.traced('crash_processing')
 def process_crashes(crashes: Crash, context: FuzzingSessionContext):
     """Process a list of crashes."""
     processed_groups = []
@@ -1183,6 +1357,7 @@ def process_crashes(crashes: Crash, context: FuzzingSessionContext):
         new_crash_count, known_crash_count, processed_groups))
     return new_crash_count, known_crash_count, processed_groups
 
+
 '''
 def get_strategy_distribution_from_ndb():
     """Queries and returns the distribution stored in the ndb table."""
@@ -1226,13 +1401,75 @@ def _add_issue_metadata_from_environment(metadata):
         metadata['issue_labels'] = _append(metadata.get('issue_labels'), labels)
 
 
+def is_prepare_once_per_session_enabled():
+    """Return true if engine options are prepared once per fuzzing session
+    instead of once per round."""
+    return bool(environment.get_value('PREPARE_ONCE_PER_SESSION', False))
+
+
+class PreparedFuzzTarget(object):
+    """A fuzz target set up once for all the fuzzing rounds of a session.
+
+    The target path and issue metadata do not change between rounds. Engines
+    pick their fuzzing strategies in prepare, so the options are only reused
+    across rounds if PREPARE_ONCE_PER_SESSION is set, and re-prepared for every
+    round otherwise."""
+
+    def __init__(self, engine_impl: engine.Engine, fuzztarget: FuzzTarget,
+                 sync_corpus_directory, project_id):
+        self.engine_impl = engine_impl
+        self.fuzztarget = fuzztarget
+        self.sync_corpus_directory = sync_corpus_directory
+        self.project_id = project_id
+
+        self.build_dir = environment.get_value('BUILD_DIR')
+        self.target_path = build_index.find_fuzzer_path(self.build_dir,
+                                                        fuzztarget.binary)
+        environment.set_value('TARGET_PATH', self.target_path)
+        self.issue_metadata = engine_common.get_all_issue_metadata(
+            self.target_path)
+
+        self._options = None
+        self._pid = os.getpid()
+
+    def get_options(self):
+        """Return the engine options for a fuzzing round."""
+        if self._options:
+            return self._options
+
+        options = self.engine_impl.prepare(
+            self.sync_corpus_directory, self.target_path, self.build_dir,
+            self.project_id, self.fuzztarget.id)
+        if is_prepare_once_per_session_enabled():
+            self._options = options
+
+        return options
+
+    def cleanup_round(self):
+        """Clean up the temporary artifacts of a fuzzing round, keeping those
+        the reused options refer to (e.g. the corpus subset directory)."""
+        if self._options and os.getpid() == self._pid:
+            return
+
+        fuzzer_utils.cleanup()
+
+    def cleanup(self):
+        """Clean up the temporary artifacts of the session."""
+        self._options = None
+        fuzzer_utils.cleanup()
+
+
+@tracing.traced('fuzzing_round')
 def run_engine_fuzzer(engine_impl: engine.Engine, fuzztarget: FuzzTarget, sync_corpus_directory,
-                      testcase_directory, artifacts_directory, project_id) -> Tuple[FuzzResult, dict, str]:
-    """Run engine for fuzzing."""
-    build_dir = environment.get_value('BUILD_DIR')
-    target_path = engine_common.find_fuzzer_path(build_dir, fuzztarget.binary)
-    environment.set_value('TARGET_PATH', target_path)
-    options = engine_impl.prepare(sync_corpus_directory, target_path, build_dir, project_id, fuzztarget.id)
+                      testcase_directory, artifacts_directory, project_id,
+                      prepared_target: PreparedFuzzTarget = None) -> Tuple[FuzzResult, dict, str]:
+    """Run engine for fuzzing. |prepared_target| is the PreparedFuzzTarget of
+    the session, or None to set the fuzz target up for this round only."""
+    if not prepared_target:
+        prepared_target = PreparedFuzzTarget(engine_impl, fuzztarget,
+                                             sync_corpus_directory, project_id)
+    target_path = prepared_target.target_path
+    options = prepared_target.get_options()
 
     fuzz_test_timeout = environment.get_value('FUZZ_TEST_TIMEOUT')
     additional_processing_time = engine_impl.fuzz_additional_processing_timeout(
@@ -1262,18 +1499,228 @@ def run_engine_fuzzer(engine_impl: engine.Engine, fuzztarget: FuzzTarget, sync_c
         'fuzzer_binary_name': fuzztarget.binary,
     }
 
-    fuzzer_metadata.update(engine_common.get_all_issue_metadata(target_path))
+    fuzzer_metadata.update(prepared_target.issue_metadata)
     _add_issue_metadata_from_environment(fuzzer_metadata)
 
     # Cleanup fuzzer temporary artifacts (e.g. mutations dir, merge dirs. etc).
-    fuzzer_utils.cleanup()
+    prepared_target.cleanup_round()
 
     return result, fuzzer_metadata, options.strategies
 
 
+def get_fuzz_targets_per_task():
+    """Return how many fuzz targets a fuzz task fuzzes from one build."""
+    return max(1, environment.get_value('FUZZ_TARGETS_PER_TASK', 1))
+
+
+def _get_fuzz_target_weight(fuzz_target, target_weights):
+    """Return the weight of |fuzz_target|, as fuzzer_selection does."""
+    if not target_weights:
+        return 1.0
+
+    return target_weights.get(fuzz_target, 1.0)
+
+
+def select_session_fuzz_targets(first_target, fuzz_targets, target_weights,
+                                count):
+    """Return |first_target| followed by up to |count| - 1 more of
+    |fuzz_targets|, picked at random by weight."""
+    selected_targets = [first_target]
+    candidates = [
+        fuzzer_selection.WeightedTarget(
+            target, _get_fuzz_target_weight(target, target_weights))
+        for target in fuzz_targets
+        if target != first_target
+    ]
+    candidates = [candidate for candidate in candidates if candidate.weight > 0]
+    while candidates and len(selected_targets) < count:
+        candidate = utils.random_weighted_choice(candidates)
+        candidates.remove(candidate)
+        selected_targets.append(candidate.target)
+
+    return selected_targets
+
+
+def allocate_fuzzing_rounds(fuzz_targets, target_weights, total_rounds):
+    """Split |total_rounds| fuzzing rounds between |fuzz_targets| in proportion
+    to their weights, and return (fuzz target, rounds) pairs. Every target gets
+    at least one round."""
+    weights = [
+        _get_fuzz_target_weight(target, target_weights) for target in fuzz_targets
+    ]
+    total_weight = sum(weights)
+    if not total_weight:
+        weights = [1.0] * len(fuzz_targets)
+        total_weight = len(fuzz_targets)
+
+    spare_rounds = max(0, total_rounds - len(fuzz_targets))
+    shares = [spare_rounds * weight / total_weight for weight in weights]
+    rounds = [1 + int(share) for share in shares]
+
+    # Hand out the rounds lost to rounding down by largest remainder.
+    remaining_rounds = spare_rounds - sum(int(share) for share in shares)
+    by_remainder = sorted(
+        range(len(shares)),
+        key=lambda index: shares[index] - int(shares[index]),
+        reverse=True)
+    for index in by_remainder[:remaining_rounds]:
+        rounds[index] += 1
+
+    return list(zip(fuzz_targets, rounds))
+
+
+def get_parallel_fuzz_round_count():
+    """Return how many engine fuzzing rounds run at once. With
+    PARALLEL_FUZZ_ROUNDS set this is MAX_FUZZ_THREADS, which also divides the
+    cores between the instances when libFuzzer uses fork mode."""
+    if not environment.get_value('PARALLEL_FUZZ_ROUNDS', False):
+        return 1
+
+    return max(1, utils.maximum_parallel_processes_allowed())
+
+
+def _run_engine_fuzzer_instance(result_queue, fuzzing_round, engine_impl,
+                                fuzztarget, sync_corpus_directory,
+                                testcase_directory, artifacts_directory,
+                                project_id, prepared_target=None):
+    """Run one parallel engine fuzzing round in a child process and report its
+    results to |result_queue|."""
+    # Keep the coverage profiles of parallel instances apart, in the artifacts
+    # directory of the instance rather than in the build shared by all tasks.
+    environment.set_value('LLVM_PROFILE_FILE',
+                          os.path.join(artifacts_directory, PROFILE_FILENAME))
+    try:
+        result = run_engine_fuzzer(engine_impl, fuzztarget,
+                                   sync_corpus_directory, testcase_directory,
+                                   artifacts_directory, project_id,
+                                   prepared_target=prepared_target)
+    except Exception:
+        logs.log_error('Fuzzing round %d failed.' % fuzzing_round)
+        result = None
+
+    result_queue.put((fuzzing_round, result))
+
+
+def _move_instance_crashes(fuzz_result, instance_testcase_directory,
+                           testcase_directory, fuzzing_round):
+    """Move the crash inputs of a parallel fuzzing round out of its testcase
+    directory into |testcase_directory| and update their paths."""
+    for crash in fuzz_result.crashes:
+        if (not crash or os.path.dirname(crash.input_path) !=
+                instance_testcase_directory):
+            continue
+
+        input_path = os.path.join(
+            testcase_directory,
+            'round-%d-%s' % (fuzzing_round, os.path.basename(crash.input_path)))
+        try:
+            os.replace(crash.input_path, input_path)
+        except OSError:
+            logs.log_warn('Failed to move crash input %s.' % crash.input_path)
+            continue
+        crash.input_path = input_path
+
+
+@tracing.traced('parallel_fuzzing_rounds')
+def run_parallel_engine_fuzzers(engine_impl: engine.Engine, fuzztarget: FuzzTarget,
+                                sync_corpus_directory, testcase_directory,
+                                artifacts_directory, project_id, fuzzing_rounds,
+                                prepared_target=None):
+    """Run an engine instance for each of |fuzzing_rounds| at once against the
+    same corpus, and return their run_engine_fuzzer results in order (None for
+    failed rounds). Every instance gets its own testcase and artifacts
+    directories; new corpus units are merged into the corpus directory by the
+    engine as usual."""
+    result_queue = process_handler.get_queue()
+    if not result_queue:
+        logs.log_error('Unable to create queue, fuzzing rounds one at a time.')
+        return [
+            run_engine_fuzzer(engine_impl, fuzztarget, sync_corpus_directory,
+                              testcase_directory, artifacts_directory, project_id,
+                              prepared_target=prepared_target)
+            for _ in fuzzing_rounds
+        ]
+
+    processes = []
+    instance_testcase_directories = {}
+    instance_artifacts_directories = {}
+    for fuzzing_round in fuzzing_rounds:
+        instance_testcase_directory = os.path.join(
+            testcase_directory, 'round-%d' % fuzzing_round)
+        instance_artifacts_directory = '%s-round-%d' % (artifacts_directory,
+                                                       fuzzing_round)
+        shell.create_directory(
+            instance_testcase_directory, create_intermediates=True)
+        shell.create_directory(
+            instance_artifacts_directory, create_intermediates=True)
+        instance_testcase_directories[fuzzing_round] = instance_testcase_directory
+        instance_artifacts_directories[fuzzing_round] = instance_artifacts_directory
+
+        process = process_handler.get_process()(
+            target=_run_engine_fuzzer_instance,
+            args=(result_queue, fuzzing_round, engine_impl, fuzztarget,
+                  sync_corpus_directory, instance_testcase_directory,
+                  instance_artifacts_directory, project_id),
+            kwargs={'prepared_target': prepared_target})
+        process.start()
+        processes.append(process)
+
+    # Drain the queue before joining, children can't exit with unread results.
+    results = {}
+    while len(results) < len(processes):
+        try:
+            fuzzing_round, result = result_queue.get(
+                timeout=PARALLEL_FUZZ_ROUNDS_POLL_INTERVAL)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                logs.log_error('Parallel fuzzing rounds exited without results.')
+                break
+            continue
+
+        results[fuzzing_round] = result
+
+    for process in processes:
+        process.join()
+    process_handler.close_queue(result_queue)
+
+    # Merge the coverage files and other artifacts of all instances.
+    shell.create_directory(artifacts_directory, create_intermediates=True)
+    for fuzzing_round, directory in instance_artifacts_directories.items():
+        for filename in os.listdir(directory):
+            os.replace(
+                os.path.join(directory, filename),
+                os.path.join(artifacts_directory,
+                             'round-%d-%s' % (fuzzing_round, filename)))
+        shell.remove_directory(directory)
+
+    # Keep the crash inputs next to those of sequential rounds and drop the
+    # rest of the instance testcase directories.
+    for fuzzing_round, directory in instance_testcase_directories.items():
+        if results.get(fuzzing_round):
+            _move_instance_crashes(results[fuzzing_round][0], directory,
+                                   testcase_directory, fuzzing_round)
+        shell.remove_directory(directory)
+
+    return [results.get(fuzzing_round) for fuzzing_round in fuzzing_rounds]
+
+
+class BlackboxFuzzResult(FuzzResult):
+    """Result of a blackbox fuzzing round. |log_path| is the file holding the
+    full log of the round if |logs| was truncated, else None."""
+
+    def __init__(self, logs, command, crashes, stats, time_executed,
+                 log_path=None):
+        super().__init__(logs, command, crashes, stats, time_executed)
+        self.log_path = log_path
+
+
+@tracing.traced('fuzzing_round')
 def run_blackbox_fuzzer(fuzzer_executable, fuzzer_command, timeout, testcase_directory, 
-                      artifacts_directory, working_dir) -> Tuple[FuzzResult, dict, int]: 
-    """Run the opaque fuzzer and return a FuzzResult object with post-execution evidence."""
+                      artifacts_directory, working_dir,
+                      log_collector: blackbox_logs.LogCollector = None) -> Tuple[BlackboxFuzzResult, dict, int]: 
+    """Run the opaque fuzzer and return a FuzzResult object with post-execution evidence.
+    With a |log_collector|, only the logs written during this round are
+    collected, truncated to their head and tail."""
     logs.log(f'Running fuzzer - {fuzzer_command}.')
     
     return_code, duration, output = process_handler.run_process(
@@ -1291,11 +1738,17 @@ def run_blackbox_fuzzer(fuzzer_executable, fuzzer_command, timeout, testcase_dir
         return_code = FuzzErrorCode.FUZZER_EXECUTION_FAILED
 
     # Collect logs from artifacts_directory/*.log.
-    log_files = [f for f in os.listdir(artifacts_directory) if f.endswith('.log')]
-    fuzzer_logs = ""
-    for log_file in log_files:
-        with open(os.path.join(artifacts_directory, log_file), 'r', encoding='utf-8', errors='ignore') as f:
-            fuzzer_logs += f.read() + "\n"
+    log_path = None
+    if log_collector:
+        round_log = log_collector.collect()
+        fuzzer_logs = round_log.get_text()
+        log_path = round_log.spill_path
+    else:
+        log_files = [f for f in os.listdir(artifacts_directory) if f.endswith('.log')]
+        fuzzer_logs = ""
+        for log_file in log_files:
+            with open(os.path.join(artifacts_directory, log_file), 'r', encoding='utf-8', errors='ignore') as f:
+                fuzzer_logs += f.read() + "\n"
     fuzzer_logs = fuzzer_logs.strip() or utils.decode_to_unicode(output)  # Fallback to process output if no logs.
 
     # Collect testcase that produced a crashe from testcase_directory/crash-*.
@@ -1316,12 +1769,13 @@ def run_blackbox_fuzzer(fuzzer_executable, fuzzer_command, timeout, testcase_dir
             import json
             stats = json.load(f)  # Assumes JSON schema.
 
-    result = FuzzResult(
+    result = BlackboxFuzzResult(
         logs=fuzzer_logs,
         command=fuzzer_command,
         crashes=crashes,
         stats=stats,
-        time_executed=duration
+        time_executed=duration,
+        log_path=log_path
     )
     
     fuzzer_metadata = {
@@ -1331,6 +1785,154 @@ def run_blackbox_fuzzer(fuzzer_executable, fuzzer_command, timeout, testcase_dir
     _add_issue_metadata_from_environment(fuzzer_metadata)
 
     return result, fuzzer_metadata, return_code
+
+
+def get_parallel_blackbox_round_count():
+    """Return how many blackbox fuzzing rounds run at once. With
+    PARALLEL_BLACKBOX_ROUNDS set this is MAX_FUZZ_THREADS."""
+    if not environment.get_value('PARALLEL_BLACKBOX_ROUNDS', False):
+        return 1
+
+    return max(1, utils.maximum_parallel_processes_allowed())
+
+
+def get_blackbox_fuzzer_command(fuzzer_executable, input_directory,
+                                testcase_directory, artifacts_directory):
+    """Return the command running a blackbox fuzzer with its input, testcase
+    and artifacts directories."""
+    command = shell.get_execute_command(fuzzer_executable)
+    argument_separator = ' ' if command.startswith(('node ', 'sh ')) else '='
+    return (
+        f'{command} --input_dir{argument_separator}{input_directory} '
+        f'--testcase_dir{argument_separator}{testcase_directory} '
+        f'--artifacts_dir{argument_separator}{artifacts_directory} '
+    )
+
+
+class BlackboxWorkerPool(object):
+    """Runs blackbox fuzzing rounds on several workers at once. Every worker
+    has its own testcase and artifacts directories, reused by the rounds it
+    runs. The fuzzer runs in a child process, so workers are threads."""
+
+    def __init__(self, worker_count, fuzzer_executable, input_directory,
+                 testcase_directory, artifacts_directory, timeout, working_dir):
+        self.fuzzer_executable = fuzzer_executable
+        self.input_directory = input_directory
+        self.timeout = timeout
+        self.working_dir = working_dir
+
+        self.worker_directories = []
+        self._log_collectors = []
+        self._free_workers = queue.Queue()
+        for worker in range(worker_count):
+            worker_testcase_directory = os.path.join(testcase_directory,
+                                                     'worker-%d' % worker)
+            worker_artifacts_directory = '%s-worker-%d' % (artifacts_directory,
+                                                          worker)
+            shell.create_directory(
+                worker_testcase_directory, create_intermediates=True)
+            shell.create_directory(
+                worker_artifacts_directory, create_intermediates=True)
+            self.worker_directories.append((worker_testcase_directory,
+                                            worker_artifacts_directory))
+            self._log_collectors.append(
+                blackbox_logs.LogCollector(worker_artifacts_directory)
+                if blackbox_logs.is_enabled() else None)
+            self._free_workers.put(worker)
+
+    def _run_round(self, fuzzing_round):
+        """Run |fuzzing_round| on a free worker."""
+        worker = self._free_workers.get()
+        try:
+            testcase_directory, artifacts_directory = (
+                self.worker_directories[worker])
+            logs.log('Fuzzing round %d on worker %d.' % (fuzzing_round, worker))
+            fuzzer_command = get_blackbox_fuzzer_command(
+                self.fuzzer_executable, self.input_directory, testcase_directory,
+                artifacts_directory)
+            return run_blackbox_fuzzer(self.fuzzer_executable, fuzzer_command,
+                                       self.timeout, testcase_directory,
+                                       artifacts_directory, self.working_dir,
+                                       self._log_collectors[worker])
+        finally:
+            self._free_workers.put(worker)
+
+    def run(self, fuzzing_rounds):
+        """Run |fuzzing_rounds| and yield the round number and
+        run_blackbox_fuzzer results of each, in the order they complete. A
+        failed round stops the rounds that have not started yet."""
+        worker_count = len(self.worker_directories)
+        executor = ThreadPoolExecutor(
+            max_workers=worker_count, thread_name_prefix='blackbox-worker')
+        pending_rounds = iter(fuzzing_rounds)
+        futures = {}
+        try:
+            # Only submit a round once a worker is free, so that nothing is
+            # queued behind a failed round.
+            for fuzzing_round in itertools.islice(pending_rounds, worker_count):
+                futures[executor.submit(self._run_round,
+                                        fuzzing_round)] = fuzzing_round
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    fuzzing_round = futures.pop(future)
+                    yield (fuzzing_round,) + tuple(future.result())
+
+                    for next_round in itertools.islice(pending_rounds, 1):
+                        futures[executor.submit(self._run_round,
+                                                next_round)] = next_round
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def merge_artifacts(self, artifacts_directory):
+        """Move the artifacts of all workers (e.g. coverage files) into
+        |artifacts_directory|."""
+        shell.create_directory(artifacts_directory, create_intermediates=True)
+        for worker, (_, worker_artifacts_directory) in enumerate(
+                self.worker_directories):
+            for filename in os.listdir(worker_artifacts_directory):
+                os.replace(
+                    os.path.join(worker_artifacts_directory, filename),
+                    os.path.join(artifacts_directory,
+                                 'worker-%d-%s' % (worker, filename)))
+            shell.remove_directory(worker_artifacts_directory)
+
+
+def checkpoint_crashes(checkpoint, fuzzing_round, engine_crashes,
+                       fuzzing_strategies):
+    """Copy the inputs of |engine_crashes| into |checkpoint| and return their
+    serializable state."""
+    crashes_state = []
+    for index, crash in enumerate(engine_crashes):
+        if not crash:
+            continue
+
+        input_path = checkpoint.save_file(
+            'crash-%d-%d-%s' % (fuzzing_round, index,
+                                os.path.basename(crash.input_path)),
+            crash.input_path)
+        crashes_state.append({
+            'input_path': input_path,
+            'stacktrace': utils.decode_to_unicode(crash.stacktrace),
+            'reproduce_args': crash.reproduce_args,
+            'crash_time': crash.crash_time,
+            'fuzzing_strategies': fuzzing_strategies,
+        })
+
+    return crashes_state
+
+
+def restore_checkpointed_crashes(crashes_state):
+    """Return the Crashes saved by checkpoint_crashes."""
+    return [
+        Crash.from_engine_crash(
+            engine.Crash(crash['input_path'], crash['stacktrace'],
+                         crash['reproduce_args'], crash['crash_time']),
+            crash['fuzzing_strategies']) for crash in crashes_state
+    ]
+
+
 class FuzzingSession(object):
     """Class for orchestrating fuzzing sessions."""
 
@@ -1339,6 +1941,7 @@ class FuzzingSession(object):
         self.fuzzer = context.fuzzer
         self.job = context.job
         self.project = context.project
+        self.checkpoint = context.checkpoint
 
         # Set up randomly selected fuzzing parameters.
         self.redzone = pick_redzone()
@@ -1364,6 +1967,7 @@ class FuzzingSession(object):
 
         return self.fuzzer.name
 
+    @tracing.traced('corpus_sync')
     def sync_corpus(self, sync_corpus_directory):
         """Sync corpus from Storage."""
         self.corpus_storage = SyncCorpusStorage(self.project.id, self.fuzz_target.id,
@@ -1394,12 +1998,19 @@ class FuzzingSession(object):
 
         return os.path.getsize(file_path)
 
-    def sync_new_corpus_files(self):
-        """Sync new files from corpus to GCS."""
+    @tracing.traced('corpus_upload')
+    def sync_new_corpus_files(self, engine_impl: Engine = None):
+        """Sync new files from corpus to GCS. If corpus distillation is
+        enabled, only the new files adding coverage according to |engine_impl|
+        are kept."""
         if not self.corpus_storage:
             return
 
         new_files = self.corpus_storage.get_new_files()
+        if new_files and engine_impl and is_corpus_distillation_enabled():
+            with tracing.span('corpus_distillation'):
+                new_files = distill_new_corpus_files(
+                    engine_impl, self.corpus_storage, new_files)
         new_files_count = len(new_files)
         logs.log('%d new corpus files generated by fuzzer %s (job %s).' %
                  (new_files_count, self.fuzz_target.project_qualified_name(),
@@ -1407,11 +2018,17 @@ class FuzzingSession(object):
 
         filtered_new_files = []
         filtered_new_files_count = 0
+        uploaded_hashes = set()
         for new_file in new_files:
             if filtered_new_files_count >= MAX_NEW_CORPUS_FILES:
                 break
             if self._file_size(new_file) > engine_common.CORPUS_INPUT_SIZE_LIMIT:
                 continue
+            new_file = get_corpus_upload_path(
+                new_file, uploaded_hashes,
+                is_synced=self.corpus_storage.is_synced_content)
+            if not new_file:
+                continue
             filtered_new_files.append(new_file)
             filtered_new_files_count += 1
 
@@ -1419,7 +2036,7 @@ class FuzzingSession(object):
             logs.log(('Uploading only %d out of %d new corpus files '
                       'generated by fuzzer %s (job %s).') %
                      (filtered_new_files_count, new_files_count,
-                      self.fuzz_target.project_qualified_name(), self.job_id))
+                      self.fuzz_target.project_qualified_name(), self.job.name))
 
         self.corpus_storage.upload_files(filtered_new_files)
 
@@ -1576,6 +2193,34 @@ class FuzzingSession(object):
         return (error_occurred, testcase_file_paths, sync_corpus_directory,
                 fuzzer_metadata)
 
+    def _run_engine_fuzzing_rounds(self, engine_impl: Engine,
+                                   sync_corpus_directory, artifacts_directory,
+                                   first_round, prepared_target):
+        """Run the fuzzing rounds from |first_round| on and yield the round
+        number and results of each. Rounds run one after another, or in batches
+        of parallel engine instances if PARALLEL_FUZZ_ROUNDS is set."""
+        max_rounds = environment.get_value('MAX_TESTCASES', 1)
+        instance_count = get_parallel_fuzz_round_count()
+        for batch_start in range(first_round, max_rounds, instance_count):
+            fuzzing_rounds = list(
+                range(batch_start, min(batch_start + instance_count, max_rounds)))
+            if len(fuzzing_rounds) == 1:
+                logs.log('Fuzzing round {}.'.format(batch_start))
+                yield (batch_start,) + tuple(run_engine_fuzzer(
+                    engine_impl, self.fuzz_target, sync_corpus_directory,
+                    self.testcase_directory, artifacts_directory, self.project.id,
+                    prepared_target=prepared_target))
+                continue
+
+            logs.log('Fuzzing rounds {} in parallel.'.format(fuzzing_rounds))
+            results = run_parallel_engine_fuzzers(
+                engine_impl, self.fuzz_target, sync_corpus_directory,
+                self.testcase_directory, artifacts_directory, self.project.id,
+                fuzzing_rounds, prepared_target=prepared_target)
+            for fuzzing_round, round_result in zip(fuzzing_rounds, results):
+                if round_result:
+                    yield (fuzzing_round,) + tuple(round_result)
+
     def do_engine_fuzzing(self, engine_impl: Engine):
         """Run fuzzing engine."""
         # Record fuzz target.
@@ -1591,8 +2236,10 @@ class FuzzingSession(object):
         # Synchronize corpus files with CS
         sync_corpus_directory = builtin.get_corpus_directory(
             self.data_directory, self.fuzz_target.project_qualified_name())
-        self.sync_corpus(sync_corpus_directory)
-        
+        with cache_lock.lock_entry(cache_lock.CORPORA, sync_corpus_directory):
+            self.sync_corpus(sync_corpus_directory)
+            disk_cache.mark_used(sync_corpus_directory)
+
         # Artifacts diretory
         artifacts_directory = builtin.get_artifacts_directory(
             self.artifacts_directory, self.fuzz_target.project_qualified_name()
@@ -1602,72 +2249,136 @@ class FuzzingSession(object):
         environment.reset_current_memory_tool_options(
             redzone_size=self.redzone, disable_ubsan=self.disable_ubsan)
 
-        revision = environment.get_value('APP_REVISION')
         crashes = []
         fuzzer_metadata = {}
+
+        # Skip the rounds completed before a restart. Their logs and stats were
+        # already uploaded, only their crashes remain to be processed.
+        first_round = 0
+        rounds_state = {
+            'fuzz_target': fuzz_target_name,
+            'completed': 0,
+            'crashes': [],
+            'fuzzer_metadata': {},
+        }
+        saved_rounds_state = self.checkpoint and self.checkpoint.get('fuzz_rounds')
+        if (saved_rounds_state and
+                saved_rounds_state['fuzz_target'] == fuzz_target_name):
+            rounds_state = saved_rounds_state
+            first_round = rounds_state['completed']
+            fuzzer_metadata.update(rounds_state['fuzzer_metadata'])
+            crashes.extend(
+                restore_checkpointed_crashes(rounds_state['crashes']))
+            logs.log('Resuming after %d completed fuzzing rounds.' % first_round)
+
+        self._run_engine_fuzzing_session(
+            engine_impl, sync_corpus_directory, artifacts_directory,
+            first_round, rounds_state, crashes, fuzzer_metadata)
+
+        return crashes, fuzzer_metadata
+
+    def _run_engine_fuzzing_session(self, engine_impl: Engine,
+                                    sync_corpus_directory, artifacts_directory,
+                                    first_round, rounds_state, crashes,
+                                    fuzzer_metadata):
+        """Run the fuzzing rounds of do_engine_fuzzing, adding their crashes
+        and metadata to |crashes| and |fuzzer_metadata|, and upload the new
+        corpus files and coverage."""
+        revision = environment.get_value('APP_REVISION')
         return_code = 1  # Vanilla return-code for engine crashes.
+        time_series = None
+        if throughput.is_enabled():
+            time_series = throughput.TimeSeries(
+                self.fuzz_target.project_qualified_name())
+        prepared_target = PreparedFuzzTarget(engine_impl, self.fuzz_target,
+                                             sync_corpus_directory,
+                                             self.project.id)
 
-        # Do the actual fuzzing.
-        for fuzzing_round in range(environment.get_value('MAX_TESTCASES', 1)):
-            logs.log('Fuzzing round {}.'.format(fuzzing_round))
-            result, current_fuzzer_metadata, fuzzing_strategies = run_engine_fuzzer(
-                engine_impl, self.fuzz_target, sync_corpus_directory,
-                self.testcase_directory, artifacts_directory, self.project.id)
-            fuzzer_metadata.update(current_fuzzer_metadata)
-
-            # Prepare stats.
-            testcase_run = engine_common.get_testcase_run(
-                result.stats,
-                result.command,
-                fuzzer_id=self.fuzzer.id,
-                job_id=self.job.id,
-                project_id=self.project.id,
-                binary=self.fuzz_target.binary,
-            )
-
-            # Upload logs, testcases (if there are crashes), and stats.
-            # Use a consistent log time to allow correlating between logs, uploaded
-            # testcases, and stats.
-            log_time = datetime.datetime.utcfromtimestamp(
-                float(testcase_run.timestamp))
-            crash_result = CrashResult(return_code, result.time_executed, result.logs)
-            
-            log = testcase_manager._prepare_log_for_upload(crash_result.get_stacktrace(),
-                return_code, revision)
-            
-            testcase_manager.upload_log(
-                project_id=self.project.id,
-                job_id=self.job.id,
-                fuzzer_id=self.fuzzer.id,
-                log=log,
-                log_time=log_time)
-
-            for crash in result.crashes:
-                testcase_manager.upload_testcase(
+        try:
+            # Do the actual fuzzing.
+            for fuzzing_round, result, current_fuzzer_metadata, fuzzing_strategies in (
+                    self._run_engine_fuzzing_rounds(
+                        engine_impl, sync_corpus_directory, artifacts_directory,
+                        first_round, prepared_target)):
+                fuzzer_metadata.update(current_fuzzer_metadata)
+                if time_series:
+                    time_series.add_round(fuzzing_round, result.logs)
+
+                # Prepare stats.
+                testcase_run = engine_common.get_testcase_run(
+                    result.stats,
+                    result.command,
+                    fuzzer_id=self.fuzzer.id,
                     job_id=self.job.id,
                     project_id=self.project.id,
-                    fuzzer_id=self.fuzzer.id,
-                    testcase_path=crash.input_path,
-                    log_time=log_time)
-
-            add_additional_testcase_run_data(testcase_run, str(self.job.id), revision)
-            upload_testcase_run_stats(testcase_run)
-            if result.crashes:
-                crashes.extend([
-                    Crash.from_engine_crash(crash, fuzzing_strategies)
-                    for crash in result.crashes
-                    if crash
-                ])
+                    binary=self.fuzz_target.binary,
+                )
 
+                # Upload logs, testcases (if there are crashes), and stats.
+                # Use a consistent log time to allow correlating between logs, uploaded
+                # testcases, and stats.
+                log_time = datetime.datetime.utcfromtimestamp(
+                    float(testcase_run.timestamp))
+                crash_result = CrashResult(return_code, result.time_executed, result.logs)
+            
+                log = testcase_manager._prepare_log_for_upload(crash_result.get_stacktrace(),
+                    return_code, revision)
+            
+                with tracing.span('upload', round=fuzzing_round):
+                    upload_queue.upload(
+                        testcase_manager.upload_log,
+                        project_id=self.project.id,
+                        job_id=self.job.id,
+                        fuzzer_id=self.fuzzer.id,
+                        log=log,
+                        log_time=log_time)
+
+                    for crash in result.crashes:
+                        upload_queue.upload(
+                            testcase_manager.upload_testcase,
+                            job_id=self.job.id,
+                            project_id=self.project.id,
+                            fuzzer_id=self.fuzzer.id,
+                            testcase_path=crash.input_path,
+                            log_time=log_time)
+
+                    add_additional_testcase_run_data(testcase_run, str(self.job.id), revision)
+                    upload_testcase_run_stats(testcase_run)
+                if result.crashes:
+                    crashes.extend([
+                        Crash.from_engine_crash(crash, fuzzing_strategies)
+                        for crash in result.crashes
+                        if crash
+                    ])
+
+                if self.checkpoint:
+                    # The checkpoint must not claim uploads that are still
+                    # queued.
+                    upload_queue.flush()
+                    rounds_state['completed'] = fuzzing_round + 1
+                    rounds_state['fuzzer_metadata'] = fuzzer_metadata
+                    rounds_state['crashes'].extend(
+                        checkpoint_crashes(self.checkpoint, fuzzing_round,
+                                           result.crashes, fuzzing_strategies))
+                    self.checkpoint.set('fuzz_rounds', rounds_state)
+
+        finally:
+            prepared_target.cleanup()
+            # Uploads of completed rounds must not be lost when a round fails.
+            with tracing.span('upload_flush'):
+                upload_queue.flush()
         logs.log('All fuzzing rounds complete.')
-        self.sync_new_corpus_files()
+        if time_series:
+            time_series.finish()
+        self.sync_new_corpus_files(engine_impl)
         
         #Upload coverage files
         target_path = environment.get_value('TARGET_PATH')
         if not target_path:
             raise FuzzTaskException('No target path found to upload coverage data.')
         
-        coverage_uploader.upload_coverage(
+        upload_coverage(
+            revision=environment.get_value('APP_REVISION'),
             project_id=self.project.id,
             fuzz_target_id=self.fuzz_target.id,
             binary_path=target_path, 
@@ -1675,7 +2386,82 @@ class FuzzingSession(object):
             fuzzer_name=f"{self.fuzzer.name}_{self.fuzz_target.binary}"
         )
 
-        return crashes, fuzzer_metadata
+    def do_multi_target_engine_fuzzing(self, engine_impl: Engine, target_weights,
+                                       crash_revision):
+        """Fuzz several fuzz targets of the build set up for this session, one
+        after another, splitting the fuzzing rounds between them by weight."""
+        first_target = environment.get_value('FUZZ_TARGET')
+        if not first_target:
+            raise FuzzTaskException('No fuzz targets found.')
+
+        build_directory = environment.get_value('BUILD_DIR')
+        build_targets = [
+            os.path.splitext(os.path.basename(path))[0]
+            for path in fuzzer_utils.get_fuzz_targets(build_directory)
+        ]
+        fuzz_targets = select_session_fuzz_targets(
+            first_target, build_targets, target_weights,
+            get_fuzz_targets_per_task())
+        max_testcases = environment.get_value('MAX_TESTCASES', 1)
+        allocation = allocate_fuzzing_rounds(fuzz_targets, target_weights,
+                                             max_testcases)
+
+        completed_targets = []
+        if self.checkpoint:
+            completed_targets = self.checkpoint.get('completed_fuzz_targets', [])
+
+        try:
+            for fuzz_target_name, rounds in allocation:
+                if fuzz_target_name in completed_targets:
+                    logs.log('Skipping fuzz target %s completed before a restart.'
+                             % fuzz_target_name)
+                    continue
+
+                logs.log('Fuzzing %s for %d rounds.' % (fuzz_target_name, rounds))
+                environment.set_value('FUZZ_TARGET', fuzz_target_name)
+                environment.set_value('MAX_TESTCASES', rounds)
+                crashes, fuzzer_metadata = self.do_engine_fuzzing(engine_impl)
+                self._process_session_results(crashes, fuzzer_metadata, [], {},
+                                              crash_revision)
+
+                if self.checkpoint:
+                    completed_targets.append(fuzz_target_name)
+                    self.checkpoint.set('completed_fuzz_targets',
+                                        completed_targets)
+        finally:
+            environment.set_value('MAX_TESTCASES', max_testcases)
+
+    def _run_blackbox_fuzzing_rounds(self, fuzzer_executable, fuzzer_command,
+                                     fuzzer_timeout, testcase_count,
+                                     working_dir):
+        """Run |testcase_count| blackbox fuzzing rounds and yield the round
+        number and results of each. Rounds run one after another, or on a pool
+        of MAX_FUZZ_THREADS workers if PARALLEL_BLACKBOX_ROUNDS is set."""
+        worker_count = min(get_parallel_blackbox_round_count(), testcase_count)
+        if worker_count <= 1:
+            log_collector = None
+            if blackbox_logs.is_enabled():
+                log_collector = blackbox_logs.LogCollector(
+                    self.artifacts_directory)
+
+            for fuzzing_round in range(testcase_count):
+                logs.log(f'Fuzzing round {fuzzing_round}.')
+                yield (fuzzing_round,) + tuple(run_blackbox_fuzzer(
+                    fuzzer_executable, fuzzer_command, fuzzer_timeout,
+                    self.testcase_directory, self.artifacts_directory,
+                    working_dir, log_collector))
+            return
+
+        logs.log('Fuzzing %d rounds on %d workers.' % (testcase_count,
+                                                       worker_count))
+        pool = BlackboxWorkerPool(worker_count, fuzzer_executable,
+                                  self.data_directory, self.testcase_directory,
+                                  self.artifacts_directory, fuzzer_timeout,
+                                  working_dir)
+        try:
+            yield from pool.run(range(testcase_count))
+        finally:
+            pool.merge_artifacts(self.artifacts_directory)
 
     def do_blackbox_fuzzing(self, fuzzer_directory):
         # Set fuzzer name in environment.
@@ -1716,7 +2502,9 @@ class FuzzingSession(object):
         sync_corpus_directory = builtin.get_corpus_directory(
             self.data_directory, self.fuzz_target.project_qualified_name())
         
-        self.sync_corpus(sync_corpus_directory)
+        with cache_lock.lock_entry(cache_lock.CORPORA, sync_corpus_directory):
+            self.sync_corpus(sync_corpus_directory)
+            disk_cache.mark_used(sync_corpus_directory)
         
         # Create artifacts output fuzzer directory if not exists
         self.artifacts_directory = f"{self.artifacts_directory}/{str(self.fuzzer.name)}_{fuzzer_binary_name}"
@@ -1724,13 +2512,9 @@ class FuzzingSession(object):
             os.mkdir(self.artifacts_directory)
 
         # Build the fuzzer command with renamed crash_testcase_dir.
-        command = shell.get_execute_command(fuzzer_executable)
-        argument_separator = ' ' if command.startswith(('node ', 'sh ')) else '='
-        fuzzer_command = (
-            f'{command} --input_dir{argument_separator}{self.data_directory} '
-            f'--testcase_dir{argument_separator}{self.testcase_directory} '
-            f'--artifacts_dir{argument_separator}{self.artifacts_directory} '
-        )
+        fuzzer_command = get_blackbox_fuzzer_command(
+            fuzzer_executable, self.data_directory, self.testcase_directory,
+            self.artifacts_directory)
         environment.set_value('APP_ARGS', (
             f'--testcase_dir {self.testcase_directory} '
             f'--artifacts_dir {self.artifacts_directory} '
@@ -1738,65 +2522,82 @@ class FuzzingSession(object):
         ))
         
         
-        # Run fuzzing rounds.
-        for fuzzing_round in range(testcase_count):
-            logs.log(f'Fuzzing round {fuzzing_round}.')
-            
-            # Run the fuzzer and get results.
-            result, current_fuzzer_metadata, return_code = run_blackbox_fuzzer(fuzzer_executable, fuzzer_command,  
-                                 fuzzer_timeout, self.testcase_directory, self.artifacts_directory, fuzzer_executable_directory)
-
-            
-            fuzzer_metadata.update(current_fuzzer_metadata)
-
-            # Prepare stats.
-            testcase_run = engine_common.get_testcase_run(
-                result.stats,
-                result.command,
-                fuzzer_id=self.fuzzer.id,
-                job_id=self.job.id,
-                project_id=self.project.id,
-                binary=self.fuzz_target.binary,
-            )
-            
-            # Upload logs, testcases (if there are crashes), and stats.
-            # Use a consistent log time to allow correlating between logs, uploaded
-            # testcases, and stats.
-            log_time = datetime.datetime.utcfromtimestamp(
-                float(testcase_run.timestamp))
-            crash_result = CrashResult(return_code, result.time_executed, result.logs)
-            
-            revision = environment.get_value('APP_REVISION')
-            log = testcase_manager._prepare_log_for_upload(crash_result.get_stacktrace(), return_code, revision)
-            testcase_manager.upload_log(
-                job_id=self.job.id,
-                project_id=self.project.id,
-                fuzzer_id=self.fuzzer.id,
-                log=log,
-                log_time=log_time)
-
-            for crash in result.crashes:
-                testcase_manager.upload_testcase(
+        try:
+            # Run fuzzing rounds.
+            for fuzzing_round, result, current_fuzzer_metadata, return_code in (
+                    self._run_blackbox_fuzzing_rounds(
+                        fuzzer_executable, fuzzer_command, fuzzer_timeout,
+                        testcase_count, fuzzer_executable_directory)):
+                fuzzer_metadata.update(current_fuzzer_metadata)
+
+                # Prepare stats.
+                testcase_run = engine_common.get_testcase_run(
+                    result.stats,
+                    result.command,
+                    fuzzer_id=self.fuzzer.id,
                     job_id=self.job.id,
                     project_id=self.project.id,
-                    fuzzer_id=self.fuzzer.id,
-                    testcase_path=crash.input_path,
-                    log_time=log_time)
-
-            add_additional_testcase_run_data(testcase_run, self.job.id, self.fuzzer.revision)
-            upload_testcase_run_stats(testcase_run)
-            if result.crashes:
-                crashes.extend([
-                    Crash.from_engine_crash(crash, [])
-                    for crash in result.crashes
-                    if crash
-                ])
-
+                    binary=self.fuzz_target.binary,
+                )
+            
+                # Upload logs, testcases (if there are crashes), and stats.
+                # Use a consistent log time to allow correlating between logs, uploaded
+                # testcases, and stats.
+                log_time = datetime.datetime.utcfromtimestamp(
+                    float(testcase_run.timestamp))
+                crash_result = CrashResult(return_code, result.time_executed, result.logs)
+            
+                revision = environment.get_value('APP_REVISION')
+                with tracing.span('upload', round=fuzzing_round):
+                    if result.log_path:
+                        # The logs of the round were truncated, upload them in full.
+                        upload_queue.upload(
+                            blackbox_logs.upload_log_file,
+                            result.log_path,
+                            header=testcase_manager._prepare_log_for_upload(
+                                '', return_code, revision),
+                            job_id=self.job.id,
+                            project_id=self.project.id,
+                            fuzzer_id=self.fuzzer.id,
+                            log_time=log_time)
+                    else:
+                        log = testcase_manager._prepare_log_for_upload(
+                            crash_result.get_stacktrace(), return_code, revision)
+                        upload_queue.upload(
+                            testcase_manager.upload_log,
+                            job_id=self.job.id,
+                            project_id=self.project.id,
+                            fuzzer_id=self.fuzzer.id,
+                            log=log,
+                            log_time=log_time)
+
+                    for crash in result.crashes:
+                        upload_queue.upload(
+                            testcase_manager.upload_testcase,
+                            job_id=self.job.id,
+                            project_id=self.project.id,
+                            fuzzer_id=self.fuzzer.id,
+                            testcase_path=crash.input_path,
+                            log_time=log_time)
+
+                    add_additional_testcase_run_data(testcase_run, self.job.id, self.fuzzer.revision)
+                    upload_testcase_run_stats(testcase_run)
+                if result.crashes:
+                    crashes.extend([
+                        Crash.from_engine_crash(crash, [])
+                        for crash in result.crashes
+                        if crash
+                    ])
+
+        finally:
+            with tracing.span('upload_flush'):
+                upload_queue.flush()
         logs.log('All fuzzing rounds complete.')
         self.sync_new_corpus_files()
         
         #Upload coverage files
-        coverage_uploader.upload_coverage(
+        upload_coverage(
+            revision=self.fuzzer.revision,
             project_id=self.project.id,
             fuzz_target_id=self.fuzz_target.id,
             binary_path=fuzzer_executable,
@@ -1844,7 +2645,10 @@ class FuzzingSession(object):
 
         # Synchronize corpus files with CS
         if sync_corpus_directory:
-            self.sync_corpus(sync_corpus_directory)
+            with cache_lock.lock_entry(cache_lock.CORPORA,
+                                       sync_corpus_directory):
+                self.sync_corpus(sync_corpus_directory)
+                disk_cache.mark_used(sync_corpus_directory)
             environment.set_value('FUZZ_CORPUS_DIR', sync_corpus_directory)
 
         # Initialize a list of crashes.
@@ -1966,7 +2770,8 @@ class FuzzingSession(object):
         
         #Upload coverage files
         fuzzer_path = environment.get_value("TARGET_PATH")
-        coverage_uploader.upload_coverage(
+        upload_coverage(
+            revision=self.fuzzer.revision,
             project_id=self.project.id,
             fuzz_target_id=self.fuzz_target.id,
             binary_path=fuzzer_path,
@@ -2004,7 +2809,8 @@ class FuzzingSession(object):
         # Ensure that that the fuzzer still exists.
         logs.log('Setting up fuzzer and data bundles.')
         try:
-            setup.update_fuzzer_and_data_bundles(self.fuzzer)
+            with tracing.span('fuzzer_update'):
+                setup.update_fuzzer_and_data_bundles(self.fuzzer)
         except errors.InvalidFuzzerError as e:
             _track_fuzzer_run_result(self.fuzzer_name, 0, 0,
                                      FuzzErrorCode.FUZZER_SETUP_FAILED)
@@ -2024,23 +2830,42 @@ class FuzzingSession(object):
             # is done on trunk build (using revision=None). Otherwise, a job definition
             # can provide a revision to use via |APP_REVISION|.
             target_weights = fuzzer_selection.get_fuzz_target_weights(self.job.id)
+            unpack_all = environment.get_value('UNPACK_ALL_FUZZ_TARGETS_AND_FILES')
+            if get_fuzz_targets_per_task() > 1:
+                # Build setup can only unpack one fuzz target or all of them,
+                # and the other targets are picked from those in the build.
+                environment.set_value('UNPACK_ALL_FUZZ_TARGETS_AND_FILES', True)
 
             build_helper = BuildHelper(job_id=self.job.id, target_weights=target_weights, revision=environment.get_value('APP_REVISION'))
-            build_setup_result = build_helper.setup_build()
-            # Check if we have an application path. If not, our build failed
-            # to setup correctly.
-            if not build_setup_result and not build_utils.check_app_path():
-                _track_fuzzer_run_result(self.fuzzer_name, 0, 0,
-                                        FuzzErrorCode.BUILD_SETUP_FAILED)
-                return
-
-            dataflow_bucket_path = environment.get_value('DATAFLOW_BUILD_BUCKET_PATH')
-            if dataflow_bucket_path:
-                # Some fuzzing jobs may use auxiliary builds, such as DFSan instrumented
-                # builds accompanying libFuzzer builds to enable DFT-based fuzzing.
-                if not build_helper.setup_trunk_build(
-                        [dataflow_bucket_path], build_prefix='DATAFLOW'):
-                    logs.log_error('Failed to set up dataflow build.')
+            try:
+                with tracing.span('build_setup'):
+                    build_setup_result = setup.setup_build(build_helper)
+                # Check if we have an application path. If not, our build failed
+                # to setup correctly.
+                if not build_setup_result and not build_utils.check_app_path():
+                    _track_fuzzer_run_result(self.fuzzer_name, 0, 0,
+                                            FuzzErrorCode.BUILD_SETUP_FAILED)
+                    return
+
+                dataflow_bucket_path = environment.get_value('DATAFLOW_BUILD_BUCKET_PATH')
+                if dataflow_bucket_path:
+                    # Some fuzzing jobs may use auxiliary builds, such as DFSan instrumented
+                    # builds accompanying libFuzzer builds to enable DFT-based fuzzing.
+                    with cache_lock.lock_entry(cache_lock.BUILDS,
+                                               dataflow_bucket_path):
+                        dataflow_build_setup_result = build_helper.setup_trunk_build(
+                            [dataflow_bucket_path], build_prefix='DATAFLOW')
+                        if dataflow_build_setup_result:
+                            disk_cache.mark_used(
+                                dataflow_build_setup_result.base_build_dir)
+                    if not dataflow_build_setup_result:
+                        logs.log_error('Failed to set up dataflow build.')
+            finally:
+                if unpack_all is None:
+                    environment.remove_key('UNPACK_ALL_FUZZ_TARGETS_AND_FILES')
+                else:
+                    environment.set_value('UNPACK_ALL_FUZZ_TARGETS_AND_FILES',
+                                          unpack_all)
 
             # Save fuzz targets count to aid with CPU weighting.
             self._save_fuzz_targets_count()
@@ -2049,7 +2874,8 @@ class FuzzingSession(object):
             # If yes, bail out.
             logs.log('Checking for bad build.')
             crash_revision = environment.get_value('APP_REVISION') if environment.get_value('APP_REVISION') else 1
-            is_bad_build = testcase_manager.check_for_bad_build(self.job.id, crash_revision)
+            with tracing.span('bad_build_check'):
+                is_bad_build = testcase_manager.check_for_bad_build(self.job.id, crash_revision)
             _track_build_run_result(self.job.id, crash_revision, is_bad_build)
             if is_bad_build:
                 return
@@ -2067,6 +2893,11 @@ class FuzzingSession(object):
         engine_impl = engine.Engine.get(self.fuzzer.name)
 
         if engine_impl and self.fuzzer.builtin:
+            if get_fuzz_targets_per_task() > 1:
+                self.do_multi_target_engine_fuzzing(engine_impl, target_weights,
+                                                    crash_revision)
+                return
+
             crashes, fuzzer_metadata = self.do_engine_fuzzing(engine_impl)
 
             # Not applicable to engine fuzzers.
@@ -2089,10 +2920,37 @@ class FuzzingSession(object):
             # TODO(ochang): Pipe this error a little better.
             return
 
+        self._process_session_results(crashes, fuzzer_metadata,
+                                      testcase_file_paths, testcases_metadata,
+                                      crash_revision)
+
+    def _get_session_context(self, fuzzer_metadata, testcases_metadata,
+                             crash_revision):
+        """Return the context for processing the crashes of this session."""
+        return FuzzingSessionContext(
+            project=self.project,
+            bot_name=environment.get_value('BOT_NAME'),
+            job=self.job,
+            fuzz_target=self.fuzz_target,
+            redzone=self.redzone,
+            disable_ubsan=self.disable_ubsan,
+            platform=environment.get_platform_id(),
+            crash_revision=crash_revision,
+            fuzzer=self.fuzzer,
+            window_argument=self.window_argument,
+            fuzzer_metadata=fuzzer_metadata,
+            testcases_metadata=testcases_metadata,
+            timeout_multiplier=self.timeout_multiplier,
+            test_timeout=self.test_timeout,
+            thread_wait_timeout=THREAD_WAIT_TIMEOUT,
+            data_directory=self.data_directory)
+
+    def _process_session_results(self, crashes, fuzzer_metadata,
+                                 testcase_file_paths, testcases_metadata,
+                                 crash_revision):
+        """Process the crashes of the session and upload its stats."""
         logs.log('Finished processing test cases.')
 
-        platform = environment.get_platform_id()
-
         # For Android, bring back device to a good state before analyzing crashes.
         if environment.is_android() and crashes:
             # Remove this variable so that application is fully shutdown before every
@@ -2106,26 +2964,10 @@ class FuzzingSession(object):
         logs.log('Raw crash count: ' + str(len(crashes)))
 
         # Process and save crashes to datastore.
-        bot_name = environment.get_value('BOT_NAME')
         new_crash_count, known_crash_count, processed_groups = process_crashes(
             crashes=crashes,
-            context=FuzzingSessionContext(
-                project=self.project,
-                bot_name=bot_name,
-                job=self.job,
-                fuzz_target=self.fuzz_target,
-                redzone=self.redzone,
-                disable_ubsan=self.disable_ubsan,
-                platform=platform,
-                crash_revision=crash_revision,
-                fuzzer=self.fuzzer,
-                window_argument=self.window_argument,
-                fuzzer_metadata=fuzzer_metadata,
-                testcases_metadata=testcases_metadata,
-                timeout_multiplier=self.timeout_multiplier,
-                test_timeout=self.test_timeout,
-                thread_wait_timeout=THREAD_WAIT_TIMEOUT,
-                data_directory=self.data_directory))
+            context=self._get_session_context(
+                fuzzer_metadata, testcases_metadata, crash_revision))
 
         upload_job_run_stats(
             fuzzer_id=self.fuzzer.id,
@@ -2142,13 +2984,14 @@ class FuzzingSession(object):
         # Delete the fuzzed testcases. This is explicitly needed since
         # some testcases might reside on NFS and would otherwise be
         # left forever.
-        for testcase_file_path in testcase_file_paths:
-            shell.remove_file(testcase_file_path)
-
-        # Explicit cleanup for large vars.
-        del testcase_file_paths
-        del testcases_metadata
-        utils.python_gc()
+        with tracing.span('cleanup'):
+            for testcase_file_path in testcase_file_paths:
+                shell.remove_file(testcase_file_path)
+
+            # Explicit cleanup for large vars.
+            del testcase_file_paths
+            del testcases_metadata
+            utils.python_gc()
 
 
 def execute_task(context: TaskContext):
@@ -23,7 +23,7 @@ from pingu_sdk.metrics import logs
 from pingu_sdk.minimizer import delta_minimizer, minimizer, basic_minimizers, js_minimizer, html_minimizer
 from pingu_sdk.platforms import android
 from pingu_sdk.system import environment, errors, shell, process_handler, tasks
-from bot.tasks import setup, task_creation
+from bot.tasks import build_index, setup, task_creation
 from pingu_sdk.tokenizer.antlr_tokenizer import AntlrTokenizer
 from pingu_sdk.tokenizer.grammars import JavaScriptLexer
 from pingu_sdk.utils import utils
@@ -881,7 +881,7 @@ def run_libfuzzer_engine(tool_name, target_name, arguments, testcase_path,
     #                                        arguments, testcase_path, output_path,
     #                                        timeout)
 
-    target_path = engine_common.find_fuzzer_path(
+    target_path = build_index.find_fuzzer_path(
         environment.get_value('BUILD_DIR'), target_name)
     if not target_path:
         return engine.ReproduceResult([], 0, 0, '')
@@ -1005,8 +1005,10 @@ def _skip_minimization(testcase: Testcase, message, crash: Crash, crash_result:
     create_additional_tasks(testcase)
 
 
-def do_libfuzzer_minimization(testcase: Testcase, testcase_file_path, crash: Crash, project_id):
-    """Use libFuzzer's built-in minimizer where appropriate."""
+def do_libfuzzer_minimization(testcase: Testcase, testcase_file_path, crash: Crash, project_id,
+                              checkpoint=None):
+    """Use libFuzzer's built-in minimizer where appropriate. If a |checkpoint| is
+    given, completed rounds are saved to it and skipped when resuming."""
     is_overriden_job = bool(environment.get_value('ORIGINAL_JOB_ID'))
 
     def handle_unreproducible():
@@ -1082,9 +1084,23 @@ def do_libfuzzer_minimization(testcase: Testcase, testcase_file_path, crash: Cra
         testcase = get_api_client().testcase_api.get_testcase_by_id(str(testcase.id))
         testcase.set_metadata('env', env)
 
+    first_round = 1
+    saved_rounds_state = checkpoint and checkpoint.get('libfuzzer_minimization')
+    if saved_rounds_state:
+        first_round = saved_rounds_state['round'] + 1
+        saved_testcase_path = saved_rounds_state['testcase_path']
+        if saved_testcase_path:
+            # Rebuild the crash result of the last successful round.
+            crash_result = _run_libfuzzer_testcase(
+                testcase, saved_testcase_path, crash)
+            if crash_result.is_crash():
+                last_crash_result = crash_result
+                current_testcase_path = saved_testcase_path
+        logs.log('Resuming libFuzzer minimization at round %d.' % first_round)
+
     # We attempt minimization multiple times in case one round results in an
     # incorrect state, or runs into another issue such as a slow unit.
-    for round_number in range(1, rounds + 1):
+    for round_number in range(first_round, rounds + 1):
         logs.log('Minimizing round %d.' % round_number)
         output_file_path, crash_result = _run_libfuzzer_tool(
             'minimize',
@@ -1100,6 +1116,16 @@ def do_libfuzzer_minimization(testcase: Testcase, testcase_file_path, crash: Cra
             last_crash_result = crash_result
             current_testcase_path = output_file_path
 
+        if checkpoint:
+            saved_testcase_path = None
+            if last_crash_result:
+                saved_testcase_path = checkpoint.save_file(
+                    'minimized-testcase', current_testcase_path)
+            checkpoint.set('libfuzzer_minimization', {
+                'round': round_number,
+                'testcase_path': saved_testcase_path,
+            })
+
     if not last_crash_result:
         repro_command = testcase_manager.get_command_line_for_application(
             file_to_run=testcase_file_path)
@@ -1234,7 +1260,7 @@ def execute_task(context: TaskContext):
     crash = api_client.crash_api.get_crash_by_testcase(str(testcase.id))
     crash_revision = crash.crash_revision if crash is not None else last_tested_crash_revision
     build_helper = BuildHelper(job_id=context.job.id, revision=crash_revision)
-    build_setup_result = build_helper.setup_build()
+    build_setup_result = setup.setup_build(build_helper)
 
     # Check if we have an application path. If not, our build failed
     # to setup correctly.
@@ -1254,7 +1280,8 @@ def execute_task(context: TaskContext):
         return
 
     if environment.is_libfuzzer_job():
-        do_libfuzzer_minimization(testcase, testcase_file_path, crash, project_id=context.project.id)
+        do_libfuzzer_minimization(testcase, testcase_file_path, crash, project_id=context.project.id,
+                                  checkpoint=context.checkpoint)
         return
 
     if environment.is_engine_fuzzer_job():
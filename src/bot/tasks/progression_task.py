@@ -48,7 +48,7 @@ class ProgressionTask:
         crash = api_client.crash_api.get_crash_by_testcase(str(testcase.id))
         data_handler.update_testcase_comment(testcase, TaskState.STARTED)
         build_helper = BuildHelper(job_id=job_id)
-        build_helper.setup_build()
+        setup.setup_build(build_helper)
         if not build_utils.check_app_path():
             testcase = api_client.testcase_api.get_testcase_by_id(testcase_id)
             data_handler.update_testcase_comment(
@@ -128,7 +128,7 @@ class ProgressionTask:
                                          update_metadata=False) -> CrashResult:
         """Test to see if a test case reproduces in the specified revision."""
         build_helper = BuildHelper(job_id=job_id, revision=revision)
-        build_helper.setup_build()
+        setup.setup_build(build_helper)
         if not build_utils.check_app_path():
             raise errors.BuildSetupError(revision, job_type)
 
@@ -0,0 +1,141 @@
+"""Deferred deletion of large directories.
+
+Deleting a multi-GB corpus or build can take minutes on overlay filesystems.
+Instead of blocking the task, directories are renamed into a trash directory,
+which is atomic and instant on the same filesystem, and deleted by a background
+thread at the lowest CPU and I/O priority.
+"""
+
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import uuid
+
+from pingu_sdk.metrics import logs
+from pingu_sdk.system import environment, shell
+
+TRASH_DIRECTORY_NAME = 'trash'
+
+_lock = threading.Lock()
+_queue = queue.Queue()
+_thread = None
+
+
+def is_enabled():
+    """Return true if large directories are deleted in the background."""
+    return bool(environment.get_value('DEFERRED_DELETION', False))
+
+
+def get_trash_directory():
+    """Return the directory holding directories pending deletion."""
+    return os.path.join(environment.get_value('BOT_DIR'), TRASH_DIRECTORY_NAME)
+
+
+def _get_delete_command(path):
+    """Return the command deleting |path| at idle I/O priority, or None if it
+    is not available on this platform."""
+    ionice = shutil.which('ionice')
+    nice = shutil.which('nice')
+    if not ionice or not nice:
+        return None
+
+    return [ionice, '-c', '3', nice, '-n', '19', 'rm', '-rf', path]
+
+
+def _delete(path):
+    """Delete |path|."""
+    command = _get_delete_command(path)
+    if command:
+        subprocess.call(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    if os.path.exists(path):
+        shell.remove_directory(path, ignore_errors=True)
+
+
+def _reap():
+    """Delete queued directories until the bot exits."""
+    while True:
+        path = _queue.get()
+        try:
+            _delete(path)
+        except Exception:
+            logs.log_error('Failed to delete %s.' % path)
+        finally:
+            _queue.task_done()
+
+
+def _start_reaper(trash_directory):
+    """Start the reaper thread if it is not running. Directories left in the
+    trash by a previous run of the bot are queued first."""
+    global _thread
+
+    with _lock:
+        if _thread:
+            return
+
+        for entry in os.listdir(trash_directory):
+            _queue.put(os.path.join(trash_directory, entry))
+
+        _thread = threading.Thread(target=_reap, name='reaper')
+        _thread.daemon = True
+        _thread.start()
+
+
+def remove_directory(directory, recreate=False, ignore_errors=False):
+    """Remove |directory| without waiting for its contents to be deleted. Falls
+    back to deleting it right away if it can't be moved to the trash, e.g. if
+    it is a mount point or on another filesystem."""
+    if not is_enabled() or not os.path.isdir(directory):
+        shell.remove_directory(
+            directory, recreate=recreate, ignore_errors=ignore_errors)
+        return
+
+    trash_directory = get_trash_directory()
+    trash_path = os.path.join(
+        trash_directory, '%s-%s' % (os.path.basename(directory), uuid.uuid4().hex))
+    try:
+        shell.create_directory(trash_directory, create_intermediates=True)
+        _start_reaper(trash_directory)
+        os.rename(directory, trash_path)
+    except OSError as e:
+        logs.log_warn('Deleting %s right away: %s' % (directory, str(e)))
+        shell.remove_directory(
+            directory, recreate=recreate, ignore_errors=ignore_errors)
+        return
+
+    _queue.put(trash_path)
+    if recreate:
+        shell.create_directory(directory, create_intermediates=True)
+
+
+def clear_testcase_directories():
+    """Like shell.clear_testcase_directories, with the local testcase
+    directories deleted in the background."""
+    if is_enabled():
+        for name in ['FUZZ_INPUTS', 'FUZZ_INPUTS_DISK']:
+            directory = environment.get_value(name)
+            if directory:
+                remove_directory(directory, recreate=True)
+
+    # Clears the now empty local directories and any device directories.
+    shell.clear_testcase_directories()
+
+
+def clear_temp_directory():
+    """Like shell.clear_temp_directory, with the temp directories deleted in the
+    background."""
+    if is_enabled():
+        for name in ['BOT_TMPDIR', 'TEST_TMPDIR', 'USER_PROFILE_ROOT_DIR']:
+            directory = environment.get_value(name)
+            if directory:
+                remove_directory(directory, recreate=True)
+
+    shell.clear_temp_directory()
+
+
+def wait_for_deletions():
+    """Block until all queued directories are deleted."""
+    _queue.join()
@@ -81,7 +81,7 @@ def _testcase_reproduces_in_revision(testcase: Testcase,
         data_handler.update_testcase_comment(testcase, TaskState.WIP,
                                              log_message)
     build_helper = BuildHelper(job_id=job_id, revision=revision)
-    build_helper.setup_build()
+    setup.setup_build(build_helper)
     if not build_utils.check_app_path():
         raise errors.BuildSetupError(revision, job_id)
 
@@ -16,6 +16,8 @@ from pingu_sdk.datastore import blobs_manager as blobs
 from pingu_sdk.datastore.models import Testcase, Fuzzer, DataBundle
 from pingu_sdk import testcase_manager
 from pingu_sdk.build_management import revisions
+from pingu_sdk.build_management.build_helper import (
+    DEFAULT_BUILD_BUCKET_PATH_ENV_VARS)
 from pingu_sdk.datastore import data_handler
 from pingu_sdk.fuzzing import leak_blacklist
 from pingu_sdk.metrics import logs, fuzzer_logs
@@ -24,6 +26,10 @@ from pingu_sdk.system import environment, shell, errors, tasks, archive
 from pingu_sdk.utils import utils, dates
 from pingu_sdk.datastore.data_constants import TaskState, ArchiveStatus
 from pingu_sdk.datastore.pingu_api.pingu_api_client import get_api_client
+from bot.tasks import cache_lock
+from bot.tasks import disk_cache
+from bot.tasks import entity_cache
+from bot.tasks import task_prefetcher
 
 _BOT_DIR = 'working_directory'
 _DATA_BUNDLE_CACHE_COUNT = 10
@@ -152,8 +158,7 @@ def prepare_environment_for_testcase(testcase: Testcase, job_id, task_name):
 def setup_testcase(testcase: Testcase, job_id, fuzzer_override=None):
     """Sets up the testcase and needed dependencies like fuzzer,
   data bundle, etc."""
-    api_client = get_api_client()
-    fuzzer = api_client.fuzzer_api.get_fuzzer_by_id(str(testcase.fuzzer_id))
+    fuzzer = entity_cache.get_fuzzer_by_id(testcase.fuzzer_id)
     fuzzer_name = fuzzer_override or fuzzer.name
     task_name = environment.get_value('TASK_NAME')
     testcase_fail_wait = environment.get_value('FAIL_WAIT')
@@ -208,7 +213,6 @@ def setup_testcase(testcase: Testcase, job_id, fuzzer_override=None):
         # Get local blacklist without this testcase's entry.
         leak_blacklist.copy_global_to_local_blacklist(excluded_testcase=testcase)
 
-    fuzzer = api_client.fuzzer_api.get_fuzzer_by_id(str(testcase.fuzzer_id))
     environment.set_value("FUZZER_NAME", fuzzer.name)
     prepare_environment_for_testcase(testcase, job_id, task_name)
 
@@ -337,9 +341,15 @@ def _clear_old_data_bundles_if_needed():
     dirs_to_remove = sorted(
         dirs, key=os.path.getmtime, reverse=True)[_DATA_BUNDLE_CACHE_COUNT:]
     for dir_to_remove in dirs_to_remove:
-        logs.log('Removing data bundle directory to keep disk cache small: %s' %
-                 dir_to_remove)
-        shell.remove_directory(dir_to_remove)
+        # Skip the data bundles and corpora used by running tasks.
+        with cache_lock.try_lock(
+                cache_lock.get_entry_lock_name(dir_to_remove)) as locked:
+            if not locked:
+                continue
+
+            logs.log('Removing data bundle directory to keep disk cache '
+                     'small: %s' % dir_to_remove)
+            shell.remove_directory(dir_to_remove)
 
 def _set_fuzzer_env_vars(fuzzer: Fuzzer):
   """Sets fuzzer env vars for fuzzer set up."""
@@ -387,8 +397,9 @@ def _update_fuzzer(
 
     # Copy the archive to local disk and unpack it.
     archive_path = os.path.join(fuzzer_directory, fuzzer.filename)
-    fuzzer_stream = get_api_client().fuzzer_api.download_fuzzer(fuzzer.id)
-    utils.write_data_to_file(content=fuzzer_stream, file_path=archive_path)
+    if not task_prefetcher.take_staged_fuzzer_archive(fuzzer, archive_path):
+        fuzzer_stream = get_api_client().fuzzer_api.download_fuzzer(fuzzer.id)
+        utils.write_data_to_file(content=fuzzer_stream, file_path=archive_path)
     try:
         archive.unpack(
             archive_path,
@@ -487,6 +498,35 @@ def update_data_bundle(fuzzer: Fuzzer, data_bundle: DataBundle):
     return True
 
 
+def get_build_lock_key(build_helper):
+    """Return the key of the setup lock of the build of |build_helper|. The
+    build directory is only known once the build is set up, and is chosen from
+    the build bucket paths of the job, or from the job if it has none."""
+    bucket_paths = [
+        environment.get_value(name, '')
+        for name in (('FUZZ_TARGET_BUILD_BUCKET_PATH', 'CUSTOM_BINARY',
+                      'SYSTEM_BINARY_DIR') + DEFAULT_BUILD_BUCKET_PATH_ENV_VARS)
+    ]
+    if any(bucket_paths):
+        return '|'.join(str(bucket_path) for bucket_path in bucket_paths)
+
+    return str(getattr(build_helper, 'job_id', None) or
+               environment.get_value('JOB_ID', ''))
+
+
+def setup_build(build_helper):
+    """Set up the build of |build_helper|, like BuildHelper.setup_build, under
+    its builds cache lock so that task slots sharing the builds directory never
+    unpack the same build at once."""
+    with cache_lock.lock_entry(cache_lock.BUILDS,
+                               get_build_lock_key(build_helper)):
+        build = build_helper.setup_build()
+        if build:
+            disk_cache.mark_used(build.base_build_dir)
+
+    return build
+
+
 def update_fuzzer_and_data_bundles(fuzzer: Fuzzer):
     """Update the fuzzer with a given name if necessary."""
     if not fuzzer:
@@ -498,14 +538,19 @@ def update_fuzzer_and_data_bundles(fuzzer: Fuzzer):
     fuzzer_directory = get_fuzzer_directory(fuzzer.name)
     environment.set_value('FUZZER_DIR', fuzzer_directory)
 
-    # Check for updates to this fuzzer.
-    version_file = os.path.join(fuzzer_directory,
-                                f'.{fuzzer.name}_version')
-    _update_fuzzer(fuzzer, fuzzer_directory, version_file)
-    
-    # Check for data bundles updates
-    _clear_old_data_bundles_if_needed()
-    _set_up_data_bundles(fuzzer, [])
+    # Fuzzers and data bundles are shared by all task slots.
+    with cache_lock.lock_entry(cache_lock.FUZZERS, fuzzer_directory):
+        # Check for updates to this fuzzer.
+        version_file = os.path.join(fuzzer_directory,
+                                    f'.{fuzzer.name}_version')
+        _update_fuzzer(fuzzer, fuzzer_directory, version_file)
+        disk_cache.mark_used(fuzzer_directory)
+
+    # Removing data bundles evicts them, so it holds the corpora lock alone.
+    with cache_lock.lock(cache_lock.CORPORA):
+        # Check for data bundles updates
+        _clear_old_data_bundles_if_needed()
+        _set_up_data_bundles(fuzzer, [])
 
     # Setup environment variable for launcher script path.
     if fuzzer.launcher_script:
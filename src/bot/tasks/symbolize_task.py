@@ -11,7 +11,7 @@ from pingu_sdk.crash_analysis.crash_result import CrashResult
 from pingu_sdk.datastore import data_handler
 from pingu_sdk.metrics import logs
 from pingu_sdk.system import environment, tasks, process_handler
-from bot.tasks import setup, task_creation
+from bot.tasks import reaper, setup, task_creation
 from pingu_sdk.utils import utils
 from pingu_sdk.build_management.build_managers import build_utils
 from pingu_sdk.datastore.data_constants import TaskState
@@ -67,7 +67,7 @@ def execute_task(context: TaskContext):
 
     # Set up a custom or regular build based on revision.
     build_helper = BuildHelper(job_id=context.job.id, revision=build_revision)
-    build_helper.setup_build()
+    setup.setup_build(build_helper)
 
     # Get crash revision used in setting up build.
     crash_revision = environment.get_value('APP_REVISION')
@@ -189,7 +189,7 @@ def execute_task(context: TaskContext):
     os.chdir(root_directory)
 
     # Cleanup symbolized builds which are space-heavy.
-    symbolized_builds.delete()
+    reaper.remove_directory(symbolized_builds.base_build_dir)
 
 
 def get_symbolized_stacktraces(testcase_file_path, testcase: Testcase,
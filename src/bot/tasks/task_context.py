@@ -1,14 +1,29 @@
-from pingu_sdk.datastore.models import Project, Job
-from pingu_sdk.datastore.pingu_api.pingu_api_client import get_api_client
+from pingu_sdk.datastore.models import Fuzzer, Project, Job
+from bot.tasks import checkpoints, entity_cache
 from pingu_sdk.system.tasks import Task
 
 class TaskContext:
-    def __init__(self, task: Task, project: Project, job: Job, fuzzer_name: str = None):
+    def __init__(self, task: Task, project: Project, job: Job, fuzzer_name: str = None,
+                 fuzzer: Fuzzer = None):
         self.task = task
         self.job = job
         self.project = project
-        self.fuzzer = None
+        self.fuzzer = fuzzer
         self.fuzzer_name = fuzzer_name
-        if self.fuzzer_name:
-            fuzzer = get_api_client().fuzzer_api.get_fuzzer(name=fuzzer_name)
-            self.fuzzer = fuzzer
\ No newline at end of file
+        if self.fuzzer_name and not self.fuzzer:
+            fuzzer = entity_cache.get_fuzzer(fuzzer_name)
+            self.fuzzer = fuzzer
+        self._checkpoint = None
+
+    @property
+    def checkpoint(self):
+        """Checkpoint of this task, loaded on first use. None if checkpointing
+        is disabled."""
+        if not self._checkpoint:
+            self._checkpoint = checkpoints.get_checkpoint(self.task)
+        return self._checkpoint
+
+    def clear_checkpoint(self):
+        """Delete the checkpoint of this task if one was used."""
+        if self._checkpoint:
+            self._checkpoint.clear()
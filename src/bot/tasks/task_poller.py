@@ -0,0 +1,195 @@
+"""Task queue polling with adaptive backoff and optional long-polling."""
+
+import json
+import logging
+import random
+import time
+
+import requests
+
+from pingu_sdk.datastore.pingu_api.pingu_api import PinguAPIError
+from pingu_sdk.datastore.pingu_api.pingu_api_client import get_api_client
+from pingu_sdk.metrics import logs
+from pingu_sdk.system import environment, tasks
+from pingu_sdk.system.tasks import Task
+from bot.tasks import cache_inventory
+
+# Default first wait, in seconds, after the queue is found empty.
+DEFAULT_MIN_WAIT = 1
+
+# Extra seconds the HTTP request may take on top of the long-poll timeout.
+LONG_POLL_GRACE_PERIOD = 10
+
+# Minimum number of seconds between two warnings about failed task requests.
+REQUEST_WARNING_INTERVAL = 10 * 60
+
+_empty_polls = 0
+_last_request_warning_time = None
+_suppressed_request_warnings = 0
+
+
+def reset_backoff():
+    """Poll again without waiting, e.g. after a task completed."""
+    global _empty_polls
+    _empty_polls = 0
+
+
+def get_wait_time():
+    """Return how long to wait before polling an empty queue again. The wait
+    doubles with every empty poll up to TASK_POLL_MAX_WAIT, with full jitter
+    so that idle bots spread out."""
+    min_wait = environment.get_value('TASK_POLL_MIN_WAIT', DEFAULT_MIN_WAIT)
+    max_wait = environment.get_value('TASK_POLL_MAX_WAIT',
+                                     environment.get_value('FAIL_WAIT'))
+    backoff = min(max_wait, min_wait * 2**_empty_polls)
+    return random.uniform(min_wait, max(min_wait, backoff))
+
+
+def wait_for_next_task():
+    """Back off after finding the task queue empty."""
+    global _empty_polls
+
+    wait_time = get_wait_time()
+    _empty_polls += 1
+    time.sleep(wait_time)
+
+
+def _make_task(api_task):
+    """Return a Task for a task returned by the task API."""
+    return Task(
+        id=api_task['task_id'],
+        command=api_task['command'],
+        argument=api_task['argument'],
+        job_id=api_task['job_id'])
+
+
+def _make_candidate_task(api_task):
+    """Return a Task for a candidate task returned by the task API, with the
+    build revision it needs if the API gave one."""
+    task = _make_task(api_task)
+    task.revision = api_task.get('revision')
+    return task
+
+
+def _request_task(params, timeout=None):
+    """Send a task queue request with |params| and return the decoded response,
+    or None if there is nothing to hand out."""
+    task_api = get_api_client().task_api
+    params['platform'] = environment.get_value('PLATFORM')
+    if timeout:
+        params['wait'] = timeout
+        timeout += LONG_POLL_GRACE_PERIOD
+
+    try:
+        response = task_api.make_request(
+            method='GET', path=task_api.path, params=params, timeout=timeout)
+        return json.loads(response.content.decode('utf-8'))
+    except (PinguAPIError, ValueError):
+        return None
+    except requests.HTTPError as e:
+        # The server answered, e.g. with no task to hand out.
+        logs.log('Task request failed: %s' % str(e), level=logging.DEBUG)
+        return None
+    except Exception as e:
+        _warn_request_failure(e)
+        return None
+
+
+def _warn_request_failure(exception):
+    """Log a failed task request, at most once per REQUEST_WARNING_INTERVAL so
+    that an unreachable server does not flood the logs of idle bots."""
+    global _last_request_warning_time
+    global _suppressed_request_warnings
+
+    now = time.time()
+    if (_last_request_warning_time is not None and
+            now - _last_request_warning_time < REQUEST_WARNING_INTERVAL):
+        _suppressed_request_warnings += 1
+        logs.log('Failed to request a task: %s' % str(exception),
+                 level=logging.DEBUG)
+        return
+
+    message = 'Failed to request a task: %s' % str(exception)
+    if _suppressed_request_warnings:
+        message += ' (%d more failures since the last warning)' % (
+            _suppressed_request_warnings)
+    logs.log_warn(message)
+    _last_request_warning_time = now
+    _suppressed_request_warnings = 0
+
+
+def _get_long_poll_task(timeout):
+    """Ask the task API for a task, letting it hold the request for up to
+    |timeout| seconds until one is queued."""
+    try:
+        return _make_task(_request_task({}, timeout))
+    except (KeyError, TypeError):
+        return None
+
+
+def _get_locality_task(candidate_count, timeout=None):
+    """Ask the task API for up to |candidate_count| candidate tasks, advertising
+    what is cached locally, and claim the one that reuses the most of it."""
+    inventory = cache_inventory.get_inventory()
+    params = {
+        'candidates': candidate_count,
+        'inventory': json.dumps(
+            cache_inventory.summarize(inventory), sort_keys=True),
+    }
+    response = _request_task(params, timeout)
+    if not response:
+        return None
+
+    try:
+        if 'candidates' not in response:
+            # The server picked and leased a task itself.
+            return _make_task(response)
+
+        candidates = [
+            _make_candidate_task(candidate)
+            for candidate in response['candidates']
+        ]
+    except (KeyError, TypeError):
+        return None
+
+    for task in cache_inventory.sort_tasks(candidates, inventory):
+        # Another bot may have claimed it in the meantime, try the next one.
+        claimed_task = _request_task({'task_id': task.id})
+        if not claimed_task:
+            continue
+
+        logs.log('Claimed task %s (%d cached bytes).' %
+                 (task.payload(), cache_inventory.score_task(task, inventory)))
+        try:
+            return _make_task(claimed_task)
+        except (KeyError, TypeError):
+            continue
+
+    return None
+
+
+def get_task():
+    """Get a task. Long-poll the task API if TASK_LONG_POLL_TIMEOUT is set, and
+    prefer tasks that reuse local caches if TASK_LOCALITY_CANDIDATES is set."""
+    long_poll_timeout = environment.get_value('TASK_LONG_POLL_TIMEOUT')
+    candidate_count = environment.get_value('TASK_LOCALITY_CANDIDATES')
+    if not long_poll_timeout and not candidate_count:
+        return tasks.get_task()
+
+    task = tasks.get_command_override()
+    if task:
+        return task
+
+    start_time = time.time()
+    if candidate_count:
+        task = _get_locality_task(candidate_count, long_poll_timeout)
+    else:
+        task = _get_long_poll_task(long_poll_timeout)
+
+    if (not task and long_poll_timeout and
+            time.time() - start_time >= long_poll_timeout):
+        # The server already held the request for the whole timeout, there is
+        # no point in backing off on top of that.
+        reset_backoff()
+
+    return task
@@ -0,0 +1,247 @@
+"""Lookahead task prefetching.
+
+While a task runs, lease the next one and fetch what it needs to start (job,
+project, fuzzer and the fuzzer archive) on a background thread, so that the
+next process_command starts warm. Staging must not touch the environment, it
+belongs to the task that is currently running.
+"""
+
+import atexit
+import os
+import threading
+import time
+
+from pingu_sdk.datastore.pingu_api.pingu_api_client import get_api_client
+from pingu_sdk.metrics import logs
+from pingu_sdk.system import environment, shell
+from pingu_sdk.system.tasks import Task
+from pingu_sdk.utils import utils
+from bot.tasks import entity_cache
+from bot.tasks import task_poller
+
+PREFETCH_DIRECTORY_NAME = 'prefetch'
+
+# Commands whose argument is the fuzzer name.
+_FUZZER_ARGUMENT_COMMANDS = ['fuzz', 'corpus_pruning']
+
+# Seconds to wait for a running prefetch to finish before dropping its task.
+RELEASE_TIMEOUT = 60
+
+_lock = threading.Lock()
+_prefetch_thread = None
+_staged_task = None
+_current_staged_task = None
+# Time at which the last prefetch found the task queue empty.
+_empty_prefetch_time = None
+_release_registered = False
+
+
+class StagedTask(object):
+    """A leased task and the entities fetched ahead of time for it."""
+
+    def __init__(self, task: Task):
+        self.task = task
+        self.job = None
+        self.project = None
+        self.fuzzer = None
+
+
+def is_enabled():
+    """Return true if task prefetching is enabled for this bot."""
+    return bool(environment.get_value('TASK_PREFETCH', False))
+
+
+def _get_staging_directory():
+    """Return the directory where prefetched blobs are kept."""
+    return os.path.join(
+        environment.get_value('CACHE_DIR'), PREFETCH_DIRECTORY_NAME)
+
+
+def get_staged_fuzzer_archive_path(fuzzer):
+    """Return the path of the staged archive for this fuzzer revision."""
+    return os.path.join(_get_staging_directory(), 'fuzzers',
+                        '%s-%s' % (fuzzer.id, fuzzer.revision), fuzzer.filename)
+
+
+def take_staged_fuzzer_archive(fuzzer, destination_path):
+    """Move the staged archive of |fuzzer| to |destination_path|. Return false if
+    nothing was staged for this fuzzer revision."""
+    if not is_enabled():
+        return False
+
+    staged_archive_path = get_staged_fuzzer_archive_path(fuzzer)
+    if not os.path.exists(staged_archive_path):
+        return False
+
+    if not shell.move(staged_archive_path, destination_path):
+        return False
+
+    shell.remove_directory(os.path.dirname(staged_archive_path))
+    logs.log('Using prefetched archive for fuzzer %s.' % fuzzer.name)
+    return True
+
+
+def _get_fuzzer_name(task: Task):
+    """Return the fuzzer name of a task, if it can be derived from the payload."""
+    if task.command not in _FUZZER_ARGUMENT_COMMANDS:
+        return None
+
+    return task.argument.split(',')[0]
+
+
+def _stage_fuzzer_archive(fuzzer):
+    """Download the fuzzer archive, unless the current revision is already
+    installed."""
+    if fuzzer.builtin or not fuzzer.filename:
+        return
+
+    fuzzers_directory = environment.get_value('FUZZERS_DIR')
+    version_file = os.path.join(fuzzers_directory, fuzzer.name,
+                                '.%s_version' % fuzzer.name)
+    if os.path.exists(version_file):
+        with open(version_file) as file_handle:
+            if file_handle.read().strip() == str(fuzzer.revision):
+                return
+
+    staged_archive_path = get_staged_fuzzer_archive_path(fuzzer)
+    if os.path.exists(staged_archive_path):
+        return
+
+    shell.create_directory(
+        os.path.dirname(staged_archive_path), create_intermediates=True)
+
+    # Download next to the final path so that a partial archive is never used.
+    partial_archive_path = staged_archive_path + '.partial'
+    fuzzer_stream = get_api_client().fuzzer_api.download_fuzzer(fuzzer.id)
+    utils.write_data_to_file(content=fuzzer_stream, file_path=partial_archive_path)
+    os.rename(partial_archive_path, staged_archive_path)
+
+
+def stage_task(staged_task: StagedTask):
+    """Fetch the entities and blobs needed to start |staged_task|."""
+    task = staged_task.task
+    staged_task.job = entity_cache.get_job(task.job)
+    staged_task.project = entity_cache.get_project(staged_task.job.project_id)
+
+    fuzzer_name = _get_fuzzer_name(task)
+    if not fuzzer_name:
+        return
+
+    staged_task.fuzzer = entity_cache.get_fuzzer(fuzzer_name)
+    if staged_task.fuzzer:
+        _stage_fuzzer_archive(staged_task.fuzzer)
+
+
+def _prefetch():
+    """Lease the next task and stage it. Runs on the prefetch thread."""
+    global _staged_task
+    global _empty_prefetch_time
+
+    try:
+        task = task_poller.get_task()
+    except Exception:
+        logs.log_warn('Failed to prefetch next task.')
+        return
+
+    if not task:
+        with _lock:
+            _empty_prefetch_time = time.time()
+        return
+
+    if task.is_command_override:
+        # Command overrides are not leased, there is nothing to win.
+        return
+
+    staged_task = StagedTask(task)
+    try:
+        stage_task(staged_task)
+    except Exception:
+        # Anything not staged is fetched again when the task runs.
+        logs.log_warn('Failed to stage prefetched task %s.' % task.payload())
+
+    with _lock:
+        _staged_task = staged_task
+
+    logs.log('Prefetched task %s.' % task.payload())
+
+
+def prefetch_next_task():
+    """Start leasing and staging the next task in the background."""
+    global _prefetch_thread
+    global _release_registered
+
+    with _lock:
+        if _staged_task or (_prefetch_thread and _prefetch_thread.is_alive()):
+            return
+
+        if not _release_registered:
+            # Log a task leased ahead of time that the bot exits without.
+            atexit.register(release_staged_task)
+            _release_registered = True
+
+        _prefetch_thread = threading.Thread(
+            target=_prefetch, name='task-prefetch', daemon=True)
+        _prefetch_thread.start()
+
+
+def get_task():
+    """Return the prefetched task if there is one, otherwise lease a new one."""
+    global _staged_task
+    global _current_staged_task
+    global _empty_prefetch_time
+
+    prefetch_thread = _prefetch_thread
+    if prefetch_thread:
+        prefetch_thread.join()
+
+    with _lock:
+        _current_staged_task = _staged_task
+        _staged_task = None
+        empty_prefetch_time = _empty_prefetch_time
+        _empty_prefetch_time = None
+
+    if _current_staged_task:
+        return _current_staged_task.task
+
+    if (empty_prefetch_time and
+            time.time() - empty_prefetch_time < task_poller.get_wait_time()):
+        # The queue was just found empty, back off instead of polling again.
+        return None
+
+    return task_poller.get_task()
+
+
+def release_staged_task():
+    """Drop a prefetched task that was not handed out yet, e.g. when the task
+    loop stops on an error or the bot exits. The task API has no call to give
+    a lease back, and queuing the task again would run it twice, so the task
+    is handed out again once its lease expires."""
+    global _staged_task
+
+    prefetch_thread = _prefetch_thread
+    if prefetch_thread:
+        prefetch_thread.join(RELEASE_TIMEOUT)
+
+    with _lock:
+        staged_task = _staged_task
+        _staged_task = None
+
+    if not staged_task:
+        return
+
+    logs.log('Dropped prefetched task %s, it is handed out again once its '
+             'lease expires.' % staged_task.task.payload())
+
+
+def take_staged_task(task: Task):
+    """Return the staged entities for |task| and forget about them."""
+    global _current_staged_task
+
+    with _lock:
+        staged_task = _current_staged_task
+        if not staged_task or staged_task.task is not task:
+            return None
+
+        _current_staged_task = None
+
+    return staged_task
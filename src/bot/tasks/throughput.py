@@ -0,0 +1,185 @@
+"""Throughput time series of engine fuzzing sessions.
+
+libFuzzer prints a status line whenever it finds new coverage and on every
+power of two executions, with the number of executions so far, coverage,
+corpus size, executions per second and RSS. The status lines of each fuzzing
+round are sampled into a per-session time series, written as a compressed
+columnar file, and summarized as throughput percentiles and coverage stalls to
+find slow targets and slow bots.
+"""
+
+import array
+import math
+import os
+import re
+import sys
+import time
+import zipfile
+
+from pingu_sdk.metrics import logs
+from pingu_sdk.system import environment, shell
+
+# Columns of the time series, all stored as doubles.
+COLUMNS = [
+    'round',
+    'elapsed',
+    'execs',
+    'exec_per_sec',
+    'coverage',
+    'features',
+    'corpus_units',
+    'rss_mb',
+]
+
+STATUS_LINE_REGEX = re.compile(r'^#(\d+)\s+(INITED|NEW|REDUCE|pulse|DONE)\b')
+FIELD_REGEXES = {
+    'coverage': re.compile(r'\bcov:\s*(\d+)'),
+    'features': re.compile(r'\bft:\s*(\d+)'),
+    'corpus_units': re.compile(r'\bcorp:\s*(\d+)'),
+    'exec_per_sec': re.compile(r'\bexec/s:\s*(\d+)'),
+    'rss_mb': re.compile(r'\brss:\s*(\d+)Mb'),
+}
+
+# Default number of seconds without new coverage after which a round is
+# considered stalled.
+DEFAULT_STALL_SECONDS = 10 * 60
+
+
+def is_enabled():
+    """Return true if throughput time series are recorded."""
+    return bool(environment.get_value('THROUGHPUT_TIME_SERIES', False))
+
+
+def get_time_series_directory():
+    """Return the directory time series files are written to."""
+    time_series_directory = environment.get_value('THROUGHPUT_DIR')
+    if time_series_directory:
+        return time_series_directory
+
+    return os.path.join(environment.get_value('LOG_DIR'), 'throughput')
+
+
+def parse_samples(log_output):
+    """Return a dict of column values for each status line in |log_output|."""
+    samples = []
+    for line in log_output.splitlines():
+        match = STATUS_LINE_REGEX.match(line)
+        if not match:
+            continue
+
+        sample = {'execs': int(match.group(1))}
+        for column, regex in FIELD_REGEXES.items():
+            field_match = regex.search(line)
+            sample[column] = int(field_match.group(1)) if field_match else 0
+
+        # exec/s is averaged over the whole run, which gives its duration.
+        if sample['exec_per_sec']:
+            sample['elapsed'] = sample['execs'] / sample['exec_per_sec']
+        else:
+            sample['elapsed'] = samples[-1]['elapsed'] if samples else 0
+        samples.append(sample)
+
+    return samples
+
+
+def percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of |sorted_values|."""
+    if not sorted_values:
+        return 0
+
+    rank = max(1, int(math.ceil(fraction * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+class TimeSeries(object):
+    """Status samples of the fuzzing rounds of one session."""
+
+    def __init__(self, name):
+        self.name = name
+        self.start_time = time.time()
+        self.columns = {column: array.array('d') for column in COLUMNS}
+
+    def add_round(self, fuzzing_round, log_output):
+        """Add the status samples in the output of |fuzzing_round|."""
+        for sample in parse_samples(log_output):
+            sample['round'] = fuzzing_round
+            for column in COLUMNS:
+                self.columns[column].append(sample[column])
+
+    def get_stall_seconds(self):
+        """Return the longest time a round ran without new coverage."""
+        longest_stall = 0
+        last_round = None
+        for fuzzing_round, elapsed, features in zip(
+                self.columns['round'], self.columns['elapsed'],
+                self.columns['features']):
+            if fuzzing_round != last_round or features > last_features:
+                last_round = fuzzing_round
+                last_features = features
+                last_progress_time = elapsed
+                continue
+
+            longest_stall = max(longest_stall, elapsed - last_progress_time)
+
+        return longest_stall
+
+    def get_summary(self):
+        """Return throughput percentiles and stall metrics of the session."""
+        exec_per_sec = sorted(value for value in self.columns['exec_per_sec']
+                              if value)
+        stall_seconds = self.get_stall_seconds()
+        return {
+            'samples': len(self.columns['round']),
+            'exec_per_sec_p10': percentile(exec_per_sec, 0.1),
+            'exec_per_sec_p50': percentile(exec_per_sec, 0.5),
+            'exec_per_sec_p90': percentile(exec_per_sec, 0.9),
+            'max_rss_mb': max(self.columns['rss_mb'], default=0),
+            'stall_seconds': stall_seconds,
+            'stalled': stall_seconds >= environment.get_value(
+                'THROUGHPUT_STALL_SECONDS', DEFAULT_STALL_SECONDS),
+        }
+
+    def write(self, file_path):
+        """Write the time series to |file_path|, one compressed member of
+        little-endian doubles per column."""
+        with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for column in COLUMNS:
+                values = array.array('d', self.columns[column])
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                archive.writestr(column + '.f64', values.tobytes())
+
+    def finish(self):
+        """Write the time series file of the session and log its summary.
+        Return the summary."""
+        summary = self.get_summary()
+        logs.log('Throughput of %s: %s.' % (self.name, summary),
+                 throughput=summary)
+        if not summary['samples']:
+            return summary
+
+        time_series_directory = get_time_series_directory()
+        file_path = os.path.join(time_series_directory, '%s-%d.zip' %
+                                 (self.name, int(self.start_time)))
+        try:
+            shell.create_directory(
+                time_series_directory, create_intermediates=True)
+            self.write(file_path)
+        except (IOError, OSError) as e:
+            logs.log_warn('Failed to write throughput time series: %s' % str(e))
+
+        return summary
+
+
+def read(file_path):
+    """Return the columns of a time series file as arrays of doubles."""
+    columns = {}
+    with zipfile.ZipFile(file_path) as archive:
+        for column in COLUMNS:
+            values = array.array('d')
+            values.frombytes(archive.read(column + '.f64'))
+            if sys.byteorder == 'big':
+                values.byteswap()
+            columns[column] = values
+
+    return columns
@@ -0,0 +1,263 @@
+"""Per-task tracing of the main task phases.
+
+Spans are recorded while a task trace is active and written out as a Chrome
+trace (chrome://tracing, Perfetto) when the task ends. Span durations are also
+aggregated into per-phase histograms across tasks, and merged into a histograms
+file shared by all task slots and bot restarts.
+"""
+
+import bisect
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+from pingu_sdk.metrics import logs
+from pingu_sdk.system import environment, shell
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Upper bounds, in seconds, of the histogram buckets. The last bucket is
+# unbounded.
+HISTOGRAM_BUCKETS = [
+    0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 5 * 60, 15 * 60, 30 * 60, 60 * 60
+]
+
+HISTOGRAMS_FILENAME = 'histograms.json'
+
+_lock = threading.Lock()
+_trace = None
+# Histograms of all spans of this process.
+_histograms = {}
+# Histograms of the spans not merged into the histograms file yet.
+_pending_histograms = {}
+
+
+class Trace(object):
+    """Spans recorded for one task."""
+
+    def __init__(self, task):
+        self.task = task
+        self.start_time = time.time()
+        self.events = []
+
+    def add_span(self, name, start_time, duration, args):
+        """Record a completed span."""
+        self.events.append({
+            'name': name,
+            'cat': self.task.command or 'task',
+            'ph': 'X',
+            'ts': int(start_time * 1000 * 1000),
+            'dur': int(duration * 1000 * 1000),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args,
+        })
+
+    def to_chrome_trace(self):
+        """Return the trace in Chrome trace event format."""
+        return {
+            'traceEvents': self.events,
+            'displayTimeUnit': 'ms',
+            'otherData': {
+                'task_id': str(self.task.id),
+                'task': self.task.payload(),
+            },
+        }
+
+
+def is_enabled():
+    """Return true if task tracing is enabled."""
+    return bool(environment.get_value('TASK_TRACE', False))
+
+
+def get_trace_directory():
+    """Return the directory trace files are written to."""
+    trace_directory = environment.get_value('TASK_TRACE_DIR')
+    if trace_directory:
+        return trace_directory
+
+    return os.path.join(environment.get_value('LOG_DIR'), 'traces')
+
+
+def _new_histogram():
+    """Return an empty histogram."""
+    return {
+        'count': 0,
+        'sum': 0.0,
+        'max': 0.0,
+        'buckets': [0] * (len(HISTOGRAM_BUCKETS) + 1),
+    }
+
+
+def _record_histogram(name, duration):
+    """Add |duration| to the histogram of |name|. Caller holds the lock."""
+    for histograms in (_histograms, _pending_histograms):
+        histogram = histograms.setdefault(name, _new_histogram())
+        histogram['count'] += 1
+        histogram['sum'] += duration
+        histogram['max'] = max(histogram['max'], duration)
+        histogram['buckets'][bisect.bisect_left(HISTOGRAM_BUCKETS,
+                                                duration)] += 1
+
+
+def _merge_histograms(histograms, other_histograms):
+    """Add the counts of |other_histograms| to |histograms|."""
+    for name, other_histogram in other_histograms.items():
+        histogram = histograms.setdefault(name, _new_histogram())
+        histogram['count'] += other_histogram['count']
+        histogram['sum'] += other_histogram['sum']
+        histogram['max'] = max(histogram['max'], other_histogram['max'])
+        histogram['buckets'] = [
+            count + other_count for count, other_count in zip(
+                histogram['buckets'], other_histogram['buckets'])
+        ]
+
+
+def get_histograms():
+    """Return the per-phase duration histograms of this process."""
+    with _lock:
+        return {
+            'bucket_bounds': HISTOGRAM_BUCKETS,
+            'phases': json.loads(json.dumps(_histograms)),
+        }
+
+
+def start_task(task):
+    """Start tracing |task|."""
+    global _trace
+    if not is_enabled():
+        return
+
+    with _lock:
+        _trace = Trace(task)
+
+
+@contextlib.contextmanager
+def span(name, **args):
+    """Time the enclosed block as phase |name| of the current task."""
+    trace = _trace
+    if not trace:
+        yield
+        return
+
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        duration = time.time() - start_time
+        with _lock:
+            trace.add_span(name, start_time, duration, args)
+            _record_histogram(name, duration)
+
+
+def traced(name):
+    """Decorator timing every call of the function as phase |name|."""
+
+    def decorator(func):
+        """Decorator function."""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            """Wrapper function."""
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _write_json(file_path, data):
+    """Write |data| as JSON to |file_path|."""
+    with open(file_path, 'w') as file_handle:
+        json.dump(data, file_handle)
+
+
+@contextlib.contextmanager
+def _file_lock(file_path):
+    """Hold an exclusive lock on |file_path| across processes for the duration
+    of the context. Does nothing where flock is not available."""
+    if fcntl is None:
+        yield
+        return
+
+    with open(file_path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_histograms_file(file_path):
+    """Return the phases of the histograms file |file_path|, or an empty dict if
+    it doesn't exist, is unreadable or uses other bucket bounds."""
+    try:
+        with open(file_path) as file_handle:
+            data = json.load(file_handle)
+    except (IOError, OSError, ValueError):
+        return {}
+
+    if not isinstance(data, dict) or data.get(
+            'bucket_bounds') != HISTOGRAM_BUCKETS:
+        return {}
+    return data.get('phases') or {}
+
+
+def _write_histograms_file(trace_directory):
+    """Merge the histograms recorded since the last write into the histograms
+    file of |trace_directory|, which is shared by all task slots."""
+    with _lock:
+        pending_histograms = json.loads(json.dumps(_pending_histograms))
+        _pending_histograms.clear()
+
+    file_path = os.path.join(trace_directory, HISTOGRAMS_FILENAME)
+    try:
+        with _file_lock(file_path):
+            histograms = _read_histograms_file(file_path)
+            _merge_histograms(histograms, pending_histograms)
+            temp_file_path = '%s.%d' % (file_path, os.getpid())
+            _write_json(temp_file_path, {
+                'bucket_bounds': HISTOGRAM_BUCKETS,
+                'phases': histograms,
+            })
+            os.replace(temp_file_path, file_path)
+    except (IOError, OSError):
+        # Keep the counts for the next write.
+        with _lock:
+            _merge_histograms(_pending_histograms, pending_histograms)
+        raise
+
+
+def finish_task():
+    """Stop tracing the current task and write its trace file. Return the path
+    of the trace file."""
+    global _trace
+
+    with _lock:
+        trace = _trace
+        _trace = None
+        if not trace:
+            return None
+
+        _record_histogram('task', time.time() - trace.start_time)
+
+    trace_directory = get_trace_directory()
+    trace_file_path = os.path.join(
+        trace_directory, '%s-%d.json' % (trace.task.id, int(trace.start_time)))
+    try:
+        shell.create_directory(trace_directory, create_intermediates=True)
+        _write_json(trace_file_path, trace.to_chrome_trace())
+        _write_histograms_file(trace_directory)
+    except (IOError, OSError) as e:
+        logs.log_warn('Failed to write task trace: %s' % str(e))
+        return None
+
+    logs.log('Wrote task trace to %s.' % trace_file_path)
+    return trace_file_path
@@ -7,7 +7,7 @@ import random
 
 from pingu_sdk.system import environment
 from pingu_sdk.utils import utils
-from pingu_sdk.datastore.pingu_api.pingu_api_client import get_api_client
+from bot.tasks import entity_cache
 from pingu_sdk.metrics import logs
 
 TRIALS_CONFIG_FILENAME = 'trials_config.json'
@@ -36,7 +36,7 @@ class Trials:
         for extension in extensions_to_strip:
             app_name = utils.strip_from_right(app_name, extension)
 
-        for trial in get_api_client().trial_api.get_trials_by_name(app_name):
+        for trial in entity_cache.get_trials(app_name):
             self.trials[trial.app_args] = AppArgs(trial.probability)
 
         app_dir = environment.get_value('APP_DIR')
@@ -0,0 +1,136 @@
+"""Background uploads of fuzzing round results.
+
+Round logs, crash inputs and stats are uploaded on a background thread so that
+the next fuzzing round does not wait for them. The queue is bounded: once it is
+full, queuing blocks until uploads catch up. Stats queued together are uploaded
+in one batch, and failed uploads are retried with exponential backoff.
+"""
+
+import queue
+import threading
+
+from pingu_sdk.metrics import fuzzer_stats, logs
+from pingu_sdk.system import environment, retry
+
+# Default number of uploads that can be pending.
+DEFAULT_QUEUE_SIZE = 64
+
+UPLOAD_RETRIES = 3
+UPLOAD_RETRY_DELAY = 2
+
+_lock = threading.Lock()
+_queue = None
+_thread = None
+
+
+def is_enabled():
+    """Return true if fuzzing results are uploaded in the background."""
+    return bool(environment.get_value('BACKGROUND_UPLOADS', False))
+
+
+@retry.wrap(
+    retries=UPLOAD_RETRIES,
+    delay=UPLOAD_RETRY_DELAY,
+    function='bot.tasks.upload_queue._upload')
+def _upload(upload_function, args, kwargs):
+    """Run an upload, retrying on failure."""
+    upload_function(*args, **kwargs)
+
+
+def _run_upload(upload_function, args, kwargs):
+    """Run an upload, logging instead of raising if all retries failed."""
+    try:
+        _upload(upload_function, args, kwargs)
+    except Exception:
+        logs.log_error('Failed to upload with %s.' %
+                       getattr(upload_function, '__name__', upload_function))
+
+
+def _get_stats_key(testcase_run):
+    """Return the key of stats that fuzzer_stats.upload_stats can upload in one
+    batch."""
+    return (testcase_run.kind, testcase_run.fuzzer_id, testcase_run.binary,
+            testcase_run.project_id, testcase_run.job_id)
+
+
+def _process(items):
+    """Run the uploads in |items|, batching stats."""
+    stats_batches = {}
+    for upload_function, args, kwargs in items:
+        if upload_function is None:
+            testcase_run = args[0]
+            stats_batches.setdefault(_get_stats_key(testcase_run),
+                                     []).append(testcase_run)
+            continue
+
+        _run_upload(upload_function, args, kwargs)
+
+    for stats_batch in stats_batches.values():
+        _run_upload(fuzzer_stats.upload_stats, (stats_batch,), {})
+
+
+def _upload_loop(upload_queue):
+    """Run queued uploads until the bot exits."""
+    while True:
+        items = [upload_queue.get()]
+        # Take whatever else is queued already, so small objects are batched.
+        while True:
+            try:
+                items.append(upload_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            _process(items)
+        except Exception:
+            logs.log_error('Failed to process uploads.')
+        finally:
+            for _ in items:
+                upload_queue.task_done()
+
+
+def _get_queue():
+    """Return the upload queue, starting its thread if needed."""
+    global _queue
+    global _thread
+
+    with _lock:
+        if not _queue:
+            queue_size = environment.get_value('UPLOAD_QUEUE_SIZE',
+                                               DEFAULT_QUEUE_SIZE)
+            _queue = queue.Queue(maxsize=queue_size)
+            _thread = threading.Thread(
+                target=_upload_loop, args=(_queue,), name='upload-queue')
+            _thread.daemon = True
+            _thread.start()
+
+        return _queue
+
+
+def upload(upload_function, *args, **kwargs):
+    """Call |upload_function| in the background if enabled, otherwise right
+    away."""
+    if not is_enabled():
+        upload_function(*args, **kwargs)
+        return
+
+    _get_queue().put((upload_function, args, kwargs))
+
+
+def upload_stats(testcase_run):
+    """Upload |testcase_run| stats, batched with other queued stats if uploads
+    run in the background."""
+    if not is_enabled():
+        fuzzer_stats.upload_stats([testcase_run])
+        return
+
+    _get_queue().put((None, (testcase_run,), {}))
+
+
+def flush():
+    """Block until all queued uploads are done."""
+    with _lock:
+        upload_queue = _queue
+
+    if upload_queue:
+        upload_queue.join()
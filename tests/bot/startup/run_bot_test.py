@@ -2,6 +2,8 @@
 """run_bot tests."""
 # pylint: disable=protected-access
 import os
+import shutil
+import tempfile
 import unittest
 
 import mock
@@ -92,3 +94,72 @@ class TaskLoopTest(unittest.TestCase):
     self.assertIn('Exception: text', exception)
     self.assertFalse(clean_exit)
     self.assertEqual('payload', payload)
+
+
+class SetTaskSlotEnvironmentTest(unittest.TestCase):
+  """Test set_task_slot_environment."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    os.environ['FUZZ_INPUTS'] = os.path.join(self.temp_dir, 'inputs')
+    os.environ['BOT_TMPDIR'] = os.path.join(self.temp_dir, 'tmp')
+    os.environ['BUILDS_DIR'] = os.path.join(self.temp_dir, 'builds')
+    os.environ.pop('FUZZ_INPUTS_DISK', None)
+
+  def test_slot_directories(self):
+    """Test that scratch directories are private to the slot."""
+    run_bot.set_task_slot_environment(2)
+
+    self.assertEqual('2', os.environ['TASK_SLOT'])
+    self.assertEqual(
+        os.path.join(self.temp_dir, 'inputs', 'slot-2'),
+        os.environ['FUZZ_INPUTS'])
+    self.assertEqual(os.environ['FUZZ_INPUTS'],
+                     os.environ['FUZZ_INPUTS_MEMORY'])
+    self.assertEqual(
+        os.path.join(self.temp_dir, 'tmp', 'slot-2'), os.environ['BOT_TMPDIR'])
+    self.assertTrue(os.path.isdir(os.environ['BOT_TMPDIR']))
+
+    # Shared directories are left alone, unset ones are not created.
+    self.assertEqual(
+        os.path.join(self.temp_dir, 'builds'), os.environ['BUILDS_DIR'])
+    self.assertNotIn('FUZZ_INPUTS_DISK', os.environ)
+
+
+class MainTest(unittest.TestCase):
+  """Test main."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, [
+        'bot.startup.run_bot._initialize',
+        'bot.startup.run_bot.run_loop',
+        'multiprocessing.Process',
+        'pingu_sdk.metrics.logs.configure',
+    ])
+
+  def test_single_slot(self):
+    """Test that a single slot runs the task loop in process."""
+    run_bot.main()
+
+    self.assertEqual(1, self.mock.run_loop.call_count)
+    self.assertEqual(0, self.mock.Process.call_count)
+
+  def test_multiple_slots(self):
+    """Test that every slot gets its own process."""
+    os.environ['TASK_SLOTS'] = '3'
+    self.mock.Process.return_value.exitcode = 0
+
+    run_bot.main()
+
+    self.assertEqual(0, self.mock.run_loop.call_count)
+    self.mock.Process.assert_has_calls([
+        mock.call(
+            target=run_bot.run_task_slot, args=(slot,),
+            name='task-slot-%d' % slot) for slot in range(3)
+    ], any_order=True)
+    self.assertEqual(3, self.mock.Process.return_value.start.call_count)
+    self.assertEqual(3, self.mock.Process.return_value.join.call_count)
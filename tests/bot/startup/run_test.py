@@ -1,9 +1,11 @@
 
 """Run tests."""
+import os
 import unittest
 
 import mock
 
+from pingu_sdk.system import environment
 from tests.test_libs import helpers
 from bot.startup import run
 
@@ -39,3 +41,112 @@ class RunLoopTest(unittest.TestCase):
         mock.call('working_directory command'),
         mock.call('working_directory command'),
     ])
+
+  def test_loop_warm_worker(self):
+    """Test looping with bot processes forked from the warm worker."""
+    helpers.patch(self, [
+        'bot.startup.run.start_warm_bot',
+        'bot.startup.run.use_warm_worker',
+    ])
+    self.mock.use_warm_worker.return_value = True
+    self.mock.bot_run_timed_out.side_effect = [False, True]
+    self.mock.start_warm_bot.return_value = 0
+
+    run.run_loop('working_directory command', 'heartbeat command')
+
+    self.assertEqual(2, self.mock.start_warm_bot.call_count)
+    self.assertEqual(0, self.mock.start_bot.call_count)
+    self.assertEqual(2, self.mock.bot_run_timed_out.call_count)
+
+
+class StartWarmBotTest(unittest.TestCase):
+  """Test start_warm_bot."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, ['bot.startup.run.get_warm_worker_context'])
+    self.process = mock.Mock()
+    self.process.name = 'run-bot'
+    self.mock.get_warm_worker_context.return_value.Process.return_value = (
+        self.process)
+
+  def test_exit_code(self):
+    """Test that the exit code of the forked bot is returned."""
+    self.process.is_alive.return_value = False
+    self.process.exitcode = 1
+    self.assertEqual(1, run.start_warm_bot())
+
+    self.mock.get_warm_worker_context.return_value.Process.assert_called_with(
+        target=run.run_warm_bot, args=(mock.ANY, dict(os.environ)),
+        name='run-bot')
+    self.process.start.assert_called_once_with()
+    self.assertEqual(0, self.process.terminate.call_count)
+
+  def test_output(self):
+    """Test that the output of the forked bot is logged."""
+    helpers.patch(self, ['bot.startup.run._log_bot_exit'])
+
+    output_paths = []
+
+    def start():
+      process_class = self.mock.get_warm_worker_context.return_value.Process
+      output_paths.append(process_class.call_args[1]['args'][0])
+      with open(output_paths[0], 'w') as file_handle:
+        file_handle.write('output')
+
+    self.process.start.side_effect = start
+    self.process.is_alive.return_value = False
+    self.process.exitcode = 0
+    self.assertEqual(0, run.start_warm_bot())
+    self.mock._log_bot_exit.assert_called_once_with('run-bot', 0, 'output')
+    self.assertFalse(os.path.exists(output_paths[0]))
+
+  def test_timeout(self):
+    """Test that a bot running past RUN_TIMEOUT is terminated."""
+    environment.set_value('RUN_TIMEOUT', 10)
+    self.process.is_alive.return_value = True
+    self.assertEqual(0, run.start_warm_bot())
+
+    self.process.join.assert_any_call(10)
+    self.process.terminate.assert_called_once_with()
+
+  def test_start_failure(self):
+    """Test a failure to fork the bot."""
+    self.process.start.side_effect = OSError
+    self.assertEqual(1, run.start_warm_bot())
+
+  def test_use_warm_worker(self):
+    """Test that the warm worker is opt in."""
+    self.assertFalse(run.use_warm_worker())
+    environment.set_value('BOT_WARM_WORKER', True)
+    self.assertTrue(run.use_warm_worker())
+
+
+class RunWarmBotTest(unittest.TestCase):
+  """Test run_warm_bot."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, [
+        'bot.startup.run_bot.main',
+        'multiprocessing.set_start_method',
+    ])
+
+  def test_environment(self):
+    """Test that the bot runs with the environment passed by run.py and the
+    start method of run_bot."""
+    environment.set_value('STALE', 1)
+    environ = {'BOT_NAME': 'bot', 'ROOT_DIR': '/root'}
+    self.mock.main.side_effect = lambda: self.assertEqual(
+        environ, dict(os.environ))
+    run.run_warm_bot(environ=environ)
+
+    self.mock.main.assert_called_once_with()
+    self.mock.set_start_method.assert_called_once_with('spawn', force=True)
+
+  def test_exception(self):
+    """Test that a failing bot exits with 1."""
+    self.mock.main.side_effect = ValueError
+    with self.assertRaises(SystemExit) as context:
+      run.run_warm_bot()
+    self.assertEqual(1, context.exception.code)
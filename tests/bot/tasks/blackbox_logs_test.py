@@ -0,0 +1,125 @@
+"""blackbox_logs tests."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from bot.tasks import blackbox_logs
+from tests.test_libs import helpers
+
+
+class BoundedLogTest(unittest.TestCase):
+  """Tests for keeping the head and tail of a log."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    os.environ['BOT_TMPDIR'] = self.temp_dir
+
+  def test_fits(self):
+    """Test that a log that fits is kept whole and not spilled."""
+    bounded_log = blackbox_logs.BoundedLog(8)
+    bounded_log.write(b'abc')
+    bounded_log.write(b'defgh')
+    bounded_log.close()
+
+    self.assertEqual('abcdefgh', bounded_log.get_text())
+    self.assertIsNone(bounded_log.spill_path)
+    self.assertEqual([], os.listdir(self.temp_dir))
+
+  def test_truncated(self):
+    """Test that only the head and tail of a long log are kept, and that the
+    full log is spilled."""
+    bounded_log = blackbox_logs.BoundedLog(8)
+    for chunk in [b'abc', b'defgh', b'ijk', b'lmnopqrs']:
+      bounded_log.write(chunk)
+    bounded_log.close()
+
+    self.assertEqual(19, bounded_log.size)
+    self.assertEqual('ab' + blackbox_logs.TRUNCATED_MESSAGE % 11 + 'nopqrs',
+                     bounded_log.get_text())
+    with open(bounded_log.spill_path, 'rb') as f:
+      self.assertEqual(b'abcdefghijklmnopqrs', f.read())
+
+
+class LogCollectorTest(unittest.TestCase):
+  """Tests for collecting the logs written since the previous round."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    os.environ['BOT_TMPDIR'] = self.temp_dir
+
+    self.artifacts_directory = os.path.join(self.temp_dir, 'artifacts')
+    os.mkdir(self.artifacts_directory)
+    self.collector = blackbox_logs.LogCollector(self.artifacts_directory)
+
+  def _write(self, filename, data, mode='a'):
+    """Write |data| to a file in the artifacts directory."""
+    with open(os.path.join(self.artifacts_directory, filename), mode) as f:
+      f.write(data)
+
+  def test_collect(self):
+    """Test that only data written since the previous round is collected."""
+    self._write('a.log', 'first')
+    self._write('stats-1.stats', '{}')
+    self.assertEqual('first\n', self.collector.collect().get_text())
+    self.assertEqual('', self.collector.collect().get_text())
+
+    self._write('a.log', ' second')
+    self._write('b.log', 'other')
+    self.assertEqual(' second\nother\n', self.collector.collect().get_text())
+
+  def test_rewritten(self):
+    """Test that replaced and truncated files are read from the start."""
+    self._write('a.log', 'first round')
+    self.collector.collect()
+
+    self._write('a.log', 'second', mode='w')
+    self.assertEqual('second\n', self.collector.collect().get_text())
+
+    os.remove(os.path.join(self.artifacts_directory, 'a.log'))
+    self._write('a.log', 'third round')
+    self.assertEqual('third round\n', self.collector.collect().get_text())
+
+  def test_spilled(self):
+    """Test that a truncated round log is spilled outside the artifacts
+    directory."""
+    os.environ['MAX_BLACKBOX_LOG_SIZE'] = '8'
+    self._write('a.log', 'abcdefghijkl')
+    round_log = self.collector.collect()
+
+    self.assertIsNotNone(round_log.spill_path)
+    self.assertEqual(self.temp_dir, os.path.dirname(round_log.spill_path))
+    with open(round_log.spill_path) as f:
+      self.assertEqual('abcdefghijkl\n', f.read())
+
+
+class UploadLogFileTest(unittest.TestCase):
+  """Tests for uploading a spilled log."""
+
+  def setUp(self):
+    helpers.patch(self, ['pingu_sdk.testcase_manager.upload_log'])
+
+  def test_upload(self):
+    """Test that the header and log are uploaded and the file removed."""
+    handle, log_path = tempfile.mkstemp()
+    with os.fdopen(handle, 'wb') as f:
+      f.write(b'log')
+
+    blackbox_logs.upload_log_file(
+        log_path,
+        b'header\n',
+        job_id='job',
+        project_id='project',
+        fuzzer_id='fuzzer',
+        log_time='time')
+    self.mock.upload_log.assert_called_once_with(
+        log=b'header\nlog',
+        job_id='job',
+        project_id='project',
+        fuzzer_id='fuzzer',
+        log_time='time')
+    self.assertFalse(os.path.exists(log_path))
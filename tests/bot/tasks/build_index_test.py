@@ -0,0 +1,98 @@
+"""build_index tests."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from bot.tasks import build_index
+from tests.test_libs import helpers
+
+
+class BuildIndexTest(unittest.TestCase):
+  """Tests for looking up fuzz targets through a build index."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, [
+        'pingu_sdk.fuzzers.engine_common.find_fuzzer_path',
+    ])
+    self.build_directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.build_directory)
+    os.environ['FUZZ_TARGET_INDEX'] = 'True'
+
+    self._write('a/target_fuzzer')
+    self._write('a/target_fuzzer.options')
+    self._write('a/target_fuzzer_seed_corpus.zip')
+    self._write('b/other_fuzzer')
+
+  def _write(self, relative_path):
+    """Create an empty file in the build directory."""
+    file_path = os.path.join(self.build_directory, relative_path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w') as f:
+      f.write('')
+
+  def _path(self, relative_path):
+    """Return the path of a file in the build directory."""
+    return os.path.join(self.build_directory, relative_path)
+
+  def test_lookup(self):
+    """Test looking up a target and its supporting files."""
+    self.assertEqual({
+        'path': self._path('a/target_fuzzer'),
+        'options': self._path('a/target_fuzzer.options'),
+        'seed_corpus': self._path('a/target_fuzzer_seed_corpus.zip'),
+    }, build_index.get_fuzz_target(self.build_directory, 'target_fuzzer'))
+    self.assertEqual(
+        self._path('b/other_fuzzer'),
+        build_index.find_fuzzer_path(self.build_directory, 'other_fuzzer'))
+    self.assertIsNone(
+        build_index.find_fuzzer_path(self.build_directory, 'missing_fuzzer'))
+    self.mock.find_fuzzer_path.assert_not_called()
+
+  def test_persisted(self):
+    """Test that the index is saved in the build directory and reused."""
+    build_index.find_fuzzer_path(self.build_directory, 'target_fuzzer')
+    with open(build_index.get_index_path(self.build_directory)) as f:
+      index = json.load(f)
+    self.assertEqual(
+        os.path.join('b', 'other_fuzzer'),
+        index['targets']['other_fuzzer']['path'])
+    self.assertNotIn(build_index.INDEX_FILENAME, index['targets'])
+
+    # The index is not rebuilt for targets it has.
+    shutil.rmtree(self._path('b'))
+    self._write('c/other_fuzzer')
+    self._write('c/new_fuzzer')
+    self.assertEqual(
+        self._path('a/target_fuzzer'),
+        build_index.find_fuzzer_path(self.build_directory, 'target_fuzzer'))
+    with open(build_index.get_index_path(self.build_directory)) as f:
+      self.assertEqual(index, json.load(f))
+
+    # Moved and newly unpacked targets are found by rebuilding the index.
+    self.assertEqual(
+        self._path('c/other_fuzzer'),
+        build_index.find_fuzzer_path(self.build_directory, 'other_fuzzer'))
+    self.assertEqual(
+        self._path('c/new_fuzzer'),
+        build_index.find_fuzzer_path(self.build_directory, 'new_fuzzer'))
+
+  def test_legacy_name(self):
+    """Test looking up a target by its project qualified name."""
+    os.environ['PROJECT_NAME'] = 'project'
+    self.assertEqual(
+        self._path('a/target_fuzzer'),
+        build_index.find_fuzzer_path(self.build_directory,
+                                     'project_target_fuzzer'))
+
+  def test_disabled(self):
+    """Test that the build directory is walked when disabled."""
+    os.environ['FUZZ_TARGET_INDEX'] = 'False'
+    self.mock.find_fuzzer_path.return_value = '/path'
+    self.assertEqual(
+        '/path',
+        build_index.find_fuzzer_path(self.build_directory, 'target_fuzzer'))
+    self.assertFalse(
+        os.path.exists(build_index.get_index_path(self.build_directory)))
@@ -0,0 +1,119 @@
+"""cache_inventory tests."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from bot.tasks import cache_inventory
+from pingu_sdk.system.tasks import Task
+from tests.test_libs import helpers
+
+
+def _write_file(path, content):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path, 'w') as f:
+    f.write(content)
+
+
+def _task(task_id, command, argument, job, revision=None):
+  task = Task(task_id, command, argument, job)
+  task.revision = revision
+  return task
+
+
+class CacheInventoryTest(unittest.TestCase):
+  """Tests for the cache inventory and task scoring."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    for name in ['BUILDS_DIR', 'FUZZERS_DIR', 'DATA_BUNDLES_DIR']:
+      os.environ[name] = os.path.join(self.temp_dir, name.lower())
+
+    _write_file(
+        os.path.join(os.environ['BUILDS_DIR'], 'job', 'revisions', 'REVISION'),
+        '1234')
+    _write_file(
+        os.path.join(os.environ['BUILDS_DIR'], 'job', 'revisions', 'target'),
+        'A' * 96)
+    _write_file(
+        os.path.join(os.environ['FUZZERS_DIR'], 'libFuzzer',
+                     '.libFuzzer_version'), '3')
+    _write_file(
+        os.path.join(os.environ['DATA_BUNDLES_DIR'], 'project_target', 'input'),
+        'A' * 50)
+
+    self.inventory = cache_inventory.get_inventory(refresh=True)
+
+  def test_inventory(self):
+    """Test scanning the local caches."""
+    self.assertEqual({
+        'builds': {
+            'job': {
+                'revision': '1234',
+                'size': 100
+            }
+        },
+        'fuzzers': {
+            'libFuzzer': {
+                'revision': '3',
+                'size': 1
+            }
+        },
+        'corpora': {
+            'project_target': {
+                'files': 1,
+                'size': 50
+            }
+        },
+    }, self.inventory)
+
+    self.assertEqual({
+        'builds': {
+            'job': '1234'
+        },
+        'fuzzers': {
+            'libFuzzer': '3'
+        },
+        'corpora': ['project_target'],
+    }, cache_inventory.summarize(self.inventory))
+
+  def test_score(self):
+    """Test scoring tasks by cached bytes."""
+    self.assertEqual(
+        101,
+        cache_inventory.score_task(
+            _task('1', 'fuzz', 'libFuzzer', 'job', 1234), self.inventory))
+    self.assertEqual(
+        151,
+        cache_inventory.score_task(
+            _task('2', 'corpus_pruning', 'libFuzzer,target', 'job', '1234'),
+            self.inventory))
+    self.assertEqual(
+        0,
+        cache_inventory.score_task(
+            _task('3', 'fuzz', 'afl', 'other_job', '1234'), self.inventory))
+
+  def test_score_other_revision(self):
+    """Test that a cached build only counts for the revision it has."""
+    self.assertEqual(
+        1,
+        cache_inventory.score_task(
+            _task('1', 'fuzz', 'libFuzzer', 'job', '1235'), self.inventory))
+    self.assertEqual(
+        1,
+        cache_inventory.score_task(
+            _task('2', 'fuzz', 'libFuzzer', 'job'), self.inventory))
+    self.assertEqual(
+        1,
+        cache_inventory.score_task(
+            Task('3', 'fuzz', 'libFuzzer', 'job'), self.inventory))
+
+  def test_sort(self):
+    """Test that tasks reusing the cache come first."""
+    cold = _task('1', 'fuzz', 'afl', 'other_job', '1234')
+    warm = _task('2', 'fuzz', 'libFuzzer', 'job', '1234')
+    self.assertEqual([warm, cold],
+                     cache_inventory.sort_tasks([cold, warm], self.inventory))
@@ -0,0 +1,132 @@
+"""cache_lock tests."""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from bot.startup import run_bot
+from bot.tasks import cache_lock
+from tests.test_libs import helpers
+
+
+def _acquire_lock(name, result_queue):
+  """Take the lock |name| in a child process and report when."""
+  with cache_lock.lock(name):
+    result_queue.put(time.time())
+
+
+def _acquire_entry_lock(key, result_queue):
+  """Take the corpora setup lock of |key| in a child process and report
+  when."""
+  with cache_lock.lock_entry(cache_lock.CORPORA, key):
+    result_queue.put(time.time())
+
+
+def _try_lock(name, result_queue):
+  """Try to take the lock |name| in a child process and report whether it
+  was taken."""
+  with cache_lock.try_lock(name) as locked:
+    result_queue.put(locked)
+
+
+class CacheLockTest(unittest.TestCase):
+  """Tests for the shared cache locks."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    os.environ['BOT_DIR'] = os.path.join(self.temp_dir, 'bot')
+    os.environ['BOT_TMPDIR'] = os.path.join(self.temp_dir, 'tmp')
+
+  def test_shared_by_slots(self):
+    """Test that all task slots use the same lock files."""
+    lock_path = cache_lock.get_lock_path(cache_lock.BUILDS)
+    run_bot.set_task_slot_environment(1)
+    self.assertEqual(lock_path, cache_lock.get_lock_path(cache_lock.BUILDS))
+    self.assertEqual(
+        os.path.join(self.temp_dir, 'bot', 'cache-locks', 'builds.lock'),
+        lock_path)
+
+  def test_exclusive(self):
+    """Test that a lock held by one process blocks another process."""
+    context = multiprocessing.get_context('fork')
+    result_queue = context.Queue()
+    with cache_lock.lock(cache_lock.BUILDS):
+      process = context.Process(
+          target=_acquire_lock, args=(cache_lock.BUILDS, result_queue))
+      process.start()
+      time.sleep(0.5)
+      release_time = time.time()
+
+    acquire_time = result_queue.get(timeout=10)
+    process.join()
+    self.assertGreaterEqual(acquire_time, release_time)
+
+  def test_independent(self):
+    """Test that locks of different caches do not block each other."""
+    context = multiprocessing.get_context('fork')
+    result_queue = context.Queue()
+    with cache_lock.lock(cache_lock.BUILDS):
+      process = context.Process(
+          target=_acquire_lock, args=(cache_lock.FUZZERS, result_queue))
+      process.start()
+      result_queue.get(timeout=10)
+      process.join()
+
+  def test_held_shared(self):
+    """Test that a lock held in shared mode can't be taken by another process
+    until it is released."""
+    self.addCleanup(cache_lock.release_held)
+    context = multiprocessing.get_context('fork')
+    result_queue = context.Queue()
+    name = cache_lock.get_entry_lock_name(self.temp_dir)
+    cache_lock.hold_shared(name)
+
+    process = context.Process(target=_try_lock, args=(name, result_queue))
+    process.start()
+    self.assertFalse(result_queue.get(timeout=10))
+    process.join()
+
+    cache_lock.release_held()
+    process = context.Process(target=_try_lock, args=(name, result_queue))
+    process.start()
+    self.assertTrue(result_queue.get(timeout=10))
+    process.join()
+
+  def _get_entry_lock_time(self, key, held_lock):
+    """Return when a child process took the setup lock of |key| and when
+    |held_lock| was released by this process."""
+    context = multiprocessing.get_context('fork')
+    result_queue = context.Queue()
+    with held_lock:
+      process = context.Process(
+          target=_acquire_entry_lock, args=(key, result_queue))
+      process.start()
+      time.sleep(0.5)
+      release_time = time.time()
+
+    acquire_time = result_queue.get(timeout=10)
+    process.join()
+    return acquire_time, release_time
+
+  def test_entries_independent(self):
+    """Test that setting up different entries of a cache does not block."""
+    acquire_time, release_time = self._get_entry_lock_time(
+        '/corpus/b', cache_lock.lock_entry(cache_lock.CORPORA, '/corpus/a'))
+    self.assertLess(acquire_time, release_time)
+
+  def test_same_entry(self):
+    """Test that setting up the same entry is serialized."""
+    acquire_time, release_time = self._get_entry_lock_time(
+        '/corpus/a', cache_lock.lock_entry(cache_lock.CORPORA, '/corpus/a'))
+    self.assertGreaterEqual(acquire_time, release_time)
+
+  def test_eviction_blocks_setup(self):
+    """Test that no entry is set up while caches are evicted."""
+    acquire_time, release_time = self._get_entry_lock_time(
+        '/corpus/a',
+        cache_lock.lock_all([cache_lock.BUILDS, cache_lock.CORPORA]))
+    self.assertGreaterEqual(acquire_time, release_time)
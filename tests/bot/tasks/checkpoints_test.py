@@ -0,0 +1,104 @@
+"""checkpoints tests."""
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from bot.tasks import checkpoints
+from pingu_sdk.system.tasks import Task
+from tests.test_libs import helpers
+
+
+class CheckpointTest(unittest.TestCase):
+  """Tests for saving and resuming checkpoints."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    os.environ['BOT_DIR'] = self.temp_dir
+    os.environ['TASK_CHECKPOINTS'] = 'True'
+    self.task = Task('1', 'corpus_pruning', 'libFuzzer,target', 'job')
+
+  def test_disabled(self):
+    """Test that no checkpoint is returned when checkpointing is disabled."""
+    os.environ['TASK_CHECKPOINTS'] = 'False'
+    self.assertIsNone(checkpoints.get_checkpoint(self.task))
+
+  def test_resume(self):
+    """Test that state saved by a task is found when it is leased again."""
+    checkpoint = checkpoints.get_checkpoint(self.task)
+    self.assertIsNone(checkpoint.get('merge'))
+    checkpoint.set('merge', {'size': 10})
+
+    task = Task('1', 'corpus_pruning', 'libFuzzer,target', 'job')
+    self.assertEqual({'size': 10}, checkpoints.get_checkpoint(task).get('merge'))
+
+    other_task = Task('1', 'corpus_pruning', 'libFuzzer,other', 'job')
+    self.assertIsNone(checkpoints.get_checkpoint(other_task).get('merge'))
+
+  def test_same_payload(self):
+    """Test that a later task with the same payload does not resume the state
+    of an earlier one."""
+    checkpoints.get_checkpoint(self.task).set('merge', {'size': 10})
+
+    task = Task('2', 'corpus_pruning', 'libFuzzer,target', 'job')
+    self.assertIsNone(checkpoints.get_checkpoint(task).get('merge'))
+
+  def test_no_task_id(self):
+    """Test that tasks without an id are not checkpointed."""
+    task = Task(None, 'corpus_pruning', 'libFuzzer,target', 'job')
+    self.assertIsNone(checkpoints.get_checkpoint(task))
+
+  def test_save_file(self):
+    """Test keeping files and directories in a checkpoint."""
+    input_path = os.path.join(self.temp_dir, 'input')
+    with open(input_path, 'w') as f:
+      f.write('A')
+    corpus_path = os.path.join(self.temp_dir, 'corpus')
+    os.mkdir(corpus_path)
+    shutil.copy(input_path, corpus_path)
+
+    checkpoint = checkpoints.get_checkpoint(self.task)
+    saved_input_path = checkpoint.save_file('input', input_path)
+    checkpoint.save_file('corpus', corpus_path)
+    # Saving again replaces the previous copy.
+    checkpoint.save_file('corpus', corpus_path)
+
+    with open(saved_input_path) as f:
+      self.assertEqual('A', f.read())
+    self.assertEqual(['input'],
+                     os.listdir(checkpoint.get_file_path('corpus')))
+
+    checkpoint.clear()
+    self.assertFalse(os.path.exists(saved_input_path))
+    self.assertIsNone(checkpoints.get_checkpoint(self.task).get('corpus'))
+
+  def test_stale(self):
+    """Test that old checkpoints are discarded."""
+    os.environ['CHECKPOINT_MAX_AGE'] = '60'
+    checkpoint = checkpoints.get_checkpoint(self.task)
+    checkpoint.set('merge', {'size': 10})
+
+    checkpoint.state['updated'] = time.time() - 120
+    with open(os.path.join(checkpoint.directory, 'state.json'), 'w') as f:
+      json.dump(checkpoint.state, f)
+
+    self.assertIsNone(checkpoints.get_checkpoint(self.task).get('merge'))
+    self.assertFalse(os.path.exists(checkpoint.directory))
+
+  def test_stale_phase(self):
+    """Test that an old phase is not resumed even if the checkpoint was
+    updated since."""
+    os.environ['CHECKPOINT_MAX_AGE'] = '60'
+    checkpoint = checkpoints.get_checkpoint(self.task)
+    checkpoint.set('merge', {'size': 10})
+    checkpoint.state['phase_times']['merge'] = time.time() - 120
+    checkpoint.set('upload', {'count': 1})
+
+    checkpoint = checkpoints.get_checkpoint(self.task)
+    self.assertIsNone(checkpoint.get('merge'))
+    self.assertEqual({'count': 1}, checkpoint.get('upload'))
@@ -2,6 +2,10 @@
 """commands tests."""
 import datetime
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 from uuid import uuid4
 
@@ -158,3 +162,114 @@ class UpdateEnvironmentForJobTest(unittest.TestCase):
         'FUZZ_TEST_TIMEOUT = 123\nMAX_TESTCASES = 5\n')
     self.assertEqual(9001, environment.get_value('FUZZ_TEST_TIMEOUT'))
     self.assertEqual(42, environment.get_value('MAX_TESTCASES'))
+
+
+class CleanupTaskStateTest(unittest.TestCase):
+  """cleanup_task_state tests."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, [
+        'pingu_sdk.system.process_handler.cleanup_stale_processes',
+        'pingu_sdk.system.shell.clear_build_urls_directory',
+        'pingu_sdk.system.shell.clear_crash_stacktraces_directory',
+        'pingu_sdk.system.shell.clear_testcase_directories',
+        'pingu_sdk.system.shell.clear_temp_directory',
+        'pingu_sdk.system.shell.clear_system_temp_directory',
+        'pingu_sdk.system.shell.clear_device_temp_directories',
+        'pingu_sdk.system.environment.reset_current_memory_tool_options',
+        'bot.tasks.disk_cache.enforce_budget',
+        'bot.tasks.upload_queue.flush',
+    ])
+
+  def test_cleanup(self):
+    """Test that everything is cleaned up without task slots."""
+    commands.cleanup_task_state()
+
+    self.assertEqual(1, self.mock.cleanup_stale_processes.call_count)
+    self.assertEqual(1, self.mock.clear_system_temp_directory.call_count)
+    self.assertEqual(1, self.mock.clear_testcase_directories.call_count)
+    self.assertEqual(1, self.mock.clear_temp_directory.call_count)
+    self.assertEqual(1, self.mock.enforce_budget.call_count)
+    self.assertEqual(1, self.mock.flush.call_count)
+
+  def test_cleanup_in_task_slot(self):
+    """Test that host-wide state is preserved in a task slot."""
+    os.environ['TASK_SLOT'] = '1'
+    commands.cleanup_task_state()
+
+    self.assertEqual(0, self.mock.cleanup_stale_processes.call_count)
+    self.assertEqual(0, self.mock.clear_build_urls_directory.call_count)
+    self.assertEqual(0, self.mock.clear_system_temp_directory.call_count)
+    self.assertEqual(1, self.mock.enforce_budget.call_count)
+    self.assertEqual(1, self.mock.clear_testcase_directories.call_count)
+    self.assertEqual(1, self.mock.clear_temp_directory.call_count)
+
+
+class WriteFileIfChangedTest(unittest.TestCase):
+  """Test write_file_if_changed."""
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    self.file_path = os.path.join(self.temp_dir, 'project.yaml')
+
+  def test_write(self):
+    """Test that the file is written only when its content changes."""
+    self.assertTrue(commands.write_file_if_changed(self.file_path, 'a'))
+    self.assertFalse(commands.write_file_if_changed(self.file_path, 'a'))
+    self.assertTrue(commands.write_file_if_changed(self.file_path, 'b'))
+
+    with open(self.file_path) as f:
+      self.assertEqual('b', f.read())
+    self.assertEqual(['project.yaml'], os.listdir(self.temp_dir))
+
+
+class ImportTimeTest(unittest.TestCase):
+  """Test the cost of importing commands, which every bot process pays."""
+
+  # Cumulative import time budget for bot.tasks.commands, in microseconds.
+  IMPORT_TIME_BUDGET = 3 * 1000 * 1000
+
+  def _get_import_times(self):
+    """Import commands in a fresh interpreter and return the cumulative import
+    time of each module, in microseconds."""
+    src_directory = os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(commands.__file__))))
+    env = os.environ.copy()
+    env['PYTHONPATH'] = src_directory
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import bot.tasks.commands'],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True)
+
+    import_times = {}
+    for line in result.stderr.decode('utf-8').splitlines():
+      if not line.startswith('import time:') or 'cumulative' in line:
+        continue
+      _, cumulative, module = line[len('import time:'):].split('|')
+      import_times[module.strip()] = int(cumulative)
+
+    return import_times
+
+  def test_task_modules_not_imported(self):
+    """Test that task modules are only imported on first use."""
+    import_times = self._get_import_times()
+    for module in commands.COMMAND_MAP.values():
+      self.assertNotIn(module, import_times)
+
+  def test_import_time_budget(self):
+    """Test that importing commands stays within budget."""
+    import_times = self._get_import_times()
+    slowest = sorted(
+        import_times.items(), key=lambda item: item[1], reverse=True)[:10]
+    self.assertLess(
+        import_times['bot.tasks.commands'], self.IMPORT_TIME_BUDGET,
+        'Slowest imports (us): %s' % slowest)
+
+  def test_get_command_module(self):
+    """Test resolving a command to its module."""
+    from bot.tasks import symbolize_task
+    self.assertIs(symbolize_task, commands.get_command_module('symbolize'))
@@ -0,0 +1,118 @@
+"""corpus_manifest tests."""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from bot.tasks import corpus_manifest
+
+
+class CorpusManifestTest(unittest.TestCase):
+  """Tests for the corpus manifest."""
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    self.corpus_directory = os.path.join(self.temp_dir, 'corpus')
+    os.mkdir(self.corpus_directory)
+    self.manifest_path = corpus_manifest.get_manifest_path(
+        self.temp_dir, 'libFuzzer_target')
+    self._write_unit('a', 'A')
+    self._write_unit(os.path.join('subdir', 'b'), 'B')
+
+  def _write_unit(self, name, contents):
+    """Write a corpus unit and return its path."""
+    path = os.path.join(self.corpus_directory, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+      f.write(contents)
+    return path
+
+  def _get_manifest(self):
+    return corpus_manifest.CorpusManifest(self.manifest_path,
+                                          self.corpus_directory)
+
+  def test_new_files(self):
+    """Test that only units added after the sync are new."""
+    manifest = self._get_manifest()
+    self.assertEqual(2, manifest.update())
+    self.assertEqual([], manifest.get_new_files())
+
+    new_path = self._write_unit('c', 'C')
+    self.assertEqual([new_path], manifest.get_new_files())
+
+    manifest.add([new_path])
+    self.assertEqual([], manifest.get_new_files())
+
+  def test_duplicate_content(self):
+    """Test that units with synced content under another name are not new,
+    and that copies among the new units are reported once."""
+    manifest = self._get_manifest()
+    manifest.update()
+    self._write_unit('a_copy', 'A')
+    self.assertEqual([], manifest.get_new_files())
+
+    self._write_unit('c', 'C')
+    self._write_unit('c_copy', 'C')
+    self.assertEqual(1, len(manifest.get_new_files()))
+
+  def test_changed_unit(self):
+    """Test that a synced unit whose content changed is new."""
+    manifest = self._get_manifest()
+    manifest.update()
+    path = self._write_unit('a', 'AA')
+    self.assertEqual([path], manifest.get_new_files())
+
+  def test_persistent(self):
+    """Test that the manifest is kept between tasks, and that removed units
+    are forgotten by the next sync."""
+    self._get_manifest().update()
+
+    manifest = self._get_manifest()
+    self.assertEqual([], manifest.get_new_files())
+
+    os.remove(os.path.join(self.corpus_directory, 'a'))
+    self.assertEqual(1, manifest.update())
+    path = self._write_unit('a_copy', 'A')
+    self.assertEqual([path], manifest.get_new_files())
+
+  def test_duplicate_not_rehashed(self):
+    """Test that skipped copies are recorded and not hashed again, and are
+    reported once the content they copy is no longer synced."""
+    manifest = self._get_manifest()
+    manifest.update()
+    copy_path = self._write_unit('a_copy', 'A')
+    self.assertEqual([], manifest.get_new_files())
+
+    with mock.patch.object(
+        corpus_manifest, 'get_file_hash',
+        side_effect=corpus_manifest.get_file_hash) as get_file_hash:
+      self.assertEqual([], manifest.get_new_files())
+      self.assertEqual(0, get_file_hash.call_count)
+
+      os.remove(os.path.join(self.corpus_directory, 'a'))
+      manifest.update()
+      self.assertEqual([copy_path], manifest.get_new_files())
+      self.assertEqual(0, get_file_hash.call_count)
+
+    manifest.add([copy_path])
+    self.assertEqual([], manifest.get_new_files())
+
+  def test_old_manifest(self):
+    """Test that manifests without upload states are migrated, with their
+    units treated as uploaded."""
+    connection = sqlite3.connect(self.manifest_path)
+    connection.execute(
+        'CREATE TABLE units (path TEXT PRIMARY KEY, sha1 TEXT NOT NULL, '
+        'size INTEGER NOT NULL, mtime INTEGER NOT NULL, '
+        'generation INTEGER NOT NULL)')
+    connection.commit()
+    connection.close()
+
+    manifest = self._get_manifest()
+    self.assertEqual(2, manifest.update())
+    self._write_unit('a_copy', 'A')
+    self.assertEqual([], manifest.get_new_files())
@@ -249,4 +249,32 @@ class CorpusPruningTest(unittest.TestCase, BaseTest):
         '-timeout=5', '-rss_limit_mb=2560', '-max_len=5242880', '-detect_leaks=1',
         '-use_value_profile=1'
     ]
-    six.assertCountEqual(self, flags, expected_custom_flags)
\ No newline at end of file
+    six.assertCountEqual(self, flags, expected_custom_flags)
+
+class CorpusGenerationTest(unittest.TestCase):
+  """Tests for _get_corpus_generation."""
+
+  def setUp(self):
+    self.corpus_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.corpus_dir)
+
+  def _write_unit(self, name, data):
+    with open(os.path.join(self.corpus_dir, name), 'w') as f:
+      f.write(data)
+
+  def test_changes_with_units(self):
+    """Test that adding or changing units changes the generation."""
+    self._write_unit('a', 'A')
+    generation = corpus_pruning_task._get_corpus_generation(self.corpus_dir)
+    self.assertEqual(generation,
+                     corpus_pruning_task._get_corpus_generation(self.corpus_dir))
+
+    self._write_unit('b', 'B')
+    added_generation = corpus_pruning_task._get_corpus_generation(
+        self.corpus_dir)
+    self.assertNotEqual(generation, added_generation)
+
+    self._write_unit('b', 'BB')
+    self.assertNotEqual(
+        added_generation,
+        corpus_pruning_task._get_corpus_generation(self.corpus_dir))
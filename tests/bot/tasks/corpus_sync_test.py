@@ -0,0 +1,125 @@
+"""corpus_sync tests."""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from bot.tasks import corpus_manifest, corpus_sync
+from tests.test_libs import helpers
+
+
+def _make_archive(units):
+  """Return a corpus archive holding |units|."""
+  data = io.BytesIO()
+  with zipfile.ZipFile(data, 'w') as archive:
+    for name, contents in units.items():
+      archive.writestr(name, contents)
+  return data.getvalue()
+
+
+class SyncToDiskTest(unittest.TestCase):
+  """Tests for delta corpus syncs."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    os.environ['BOT_TMPDIR'] = self.temp_dir
+    os.environ['CORPUS_DOWNLOAD_WORKERS'] = '2'
+    self.corpus_directory = os.path.join(self.temp_dir, 'corpus')
+    self.corpus_storage = mock.Mock()
+
+  def _write_unit(self, name, contents):
+    path = os.path.join(self.corpus_directory, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+      f.write(contents)
+    return path
+
+  def test_delta(self):
+    """Test that only missing and changed units are extracted, and that
+    nothing is removed without a manifest."""
+    self.corpus_storage.api_client.download_corpus.return_value = (
+        _make_archive({
+            'a': 'A',
+            'b': 'BB',
+            'c': 'C',
+            'dir/d': 'D',
+        }))
+    changed_path = self._write_unit('a', 'X')
+    self._write_unit('b', 'B')
+    unchanged_path = self._write_unit('c', 'C')
+    unchanged_mtime = os.path.getmtime(unchanged_path) - 100
+    os.utime(unchanged_path, (unchanged_mtime, unchanged_mtime))
+    self._write_unit('deleted', 'E')
+
+    self.assertTrue(
+        corpus_sync.sync_to_disk(self.corpus_storage, self.corpus_directory))
+
+    self.assertEqual({
+        'a': 1,
+        'b': 2,
+        'c': 1,
+        os.path.join('dir', 'd'): 1,
+        'deleted': 1,
+    }, corpus_sync.get_local_units(self.corpus_directory))
+    # Units are compared by content, not only by size.
+    with open(changed_path) as f:
+      self.assertEqual('A', f.read())
+    # Units matching storage are not extracted again.
+    self.assertEqual(unchanged_mtime, os.path.getmtime(unchanged_path))
+    # The downloaded archive is not left behind.
+    self.assertEqual(['corpus'], os.listdir(self.temp_dir))
+
+  def test_manifest(self):
+    """Test that only units the manifest knows were synced are removed, and
+    that units unchanged since they were synced are not read."""
+    self.corpus_storage.api_client.download_corpus.return_value = (
+        _make_archive({
+            'a': 'A',
+            'b': 'B',
+        }))
+    self._write_unit('a', 'A')
+    deleted_path = self._write_unit('deleted', 'D')
+    manifest = corpus_manifest.CorpusManifest(
+        os.path.join(self.temp_dir, 'manifest.sqlite'), self.corpus_directory)
+    manifest.update()
+    unsynced_path = self._write_unit('unsynced', 'U')
+
+    with mock.patch.object(
+        corpus_sync, 'get_file_crc',
+        side_effect=corpus_sync.get_file_crc) as get_file_crc:
+      self.assertTrue(
+          corpus_sync.sync_to_disk(
+              self.corpus_storage, self.corpus_directory, manifest=manifest))
+
+    self.assertEqual(0, get_file_crc.call_count)
+    self.assertFalse(os.path.exists(deleted_path))
+    self.assertTrue(os.path.exists(unsynced_path))
+    self.assertEqual({
+        'a': 1,
+        'b': 1,
+        'unsynced': 1,
+    }, corpus_sync.get_local_units(self.corpus_directory))
+
+  def test_download_failure(self):
+    """Test that the local corpus is kept if the download fails."""
+    self.corpus_storage.api_client.download_corpus.side_effect = (
+        Exception('failed'))
+    path = self._write_unit('a', 'A')
+
+    self.assertFalse(
+        corpus_sync.sync_to_disk(self.corpus_storage, self.corpus_directory))
+    self.assertTrue(os.path.exists(path))
+
+  def test_bad_archive(self):
+    """Test that a corrupt archive fails the sync."""
+    self.corpus_storage.api_client.download_corpus.return_value = b'bad'
+
+    self.assertFalse(
+        corpus_sync.sync_to_disk(self.corpus_storage, self.corpus_directory))
+    self.assertEqual([], os.listdir(self.temp_dir))
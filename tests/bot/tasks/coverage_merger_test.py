@@ -0,0 +1,121 @@
+"""coverage_merger tests."""
+import array
+import os
+import shutil
+import tempfile
+import unittest
+
+from bot.tasks import coverage_merger
+from tests.test_libs import helpers
+
+
+ARTIFACTS_DIRECTORY = os.path.join(os.path.dirname(__file__), 'artifacts')
+
+
+class UploadCoverageTest(unittest.TestCase):
+  """Tests for uploading merged coverage."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, [
+        'pingu_sdk.fuzzing.coverage_uploader.upload_coverage',
+    ])
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    os.environ['BOT_DIR'] = os.path.join(self.temp_dir, 'bot')
+    self.artifacts_directory = os.path.join(self.temp_dir, 'artifacts')
+    os.mkdir(self.artifacts_directory)
+    self.uploads = []
+    self.mock.upload_coverage.side_effect = self._upload_coverage
+
+  def _upload_coverage(self, artifacts_directory, **kwargs):  # pylint: disable=unused-argument
+    """Record the uploaded files."""
+    uploaded_files = {}
+    for filename in os.listdir(artifacts_directory):
+      path = os.path.join(artifacts_directory, filename)
+      pcs = coverage_merger.read_sancov(path)
+      uploaded_files[filename] = (
+          sorted(pcs) if pcs is not None else open(path).read())
+    self.uploads.append(uploaded_files)
+
+  def _write_sancov(self, name, pcs, magic=coverage_merger.SANCOV_MAGIC_64):
+    typecode = 'Q' if magic == coverage_merger.SANCOV_MAGIC_64 else 'I'
+    with open(os.path.join(self.artifacts_directory, name), 'wb') as f:
+      f.write(magic.to_bytes(8, 'little'))
+      f.write(array.array(typecode, pcs).tobytes())
+
+  def _upload(self, revision=1):
+    coverage_merger.upload_coverage(
+        revision,
+        project_id='project',
+        fuzz_target_id='target',
+        binary_path='/build/target',
+        artifacts_directory=self.artifacts_directory,
+        fuzzer_name='libFuzzer_target')
+
+  def test_delta(self):
+    """Test that rounds are merged and only new PCs are uploaded."""
+    self._write_sancov('round-0.cov', [3, 1, 2])
+    self._write_sancov('round-1.cov', [2, 4], coverage_merger.SANCOV_MAGIC_32)
+    with open(os.path.join(self.artifacts_directory, 'other.profraw'),
+              'w') as f:
+      f.write('profraw')
+    self._upload()
+
+    self._write_sancov('round-2.cov', [4, 5])
+    os.remove(os.path.join(self.artifacts_directory, 'other.profraw'))
+    self._upload()
+
+    self.assertEqual([{
+        'libFuzzer_target.delta.cov': [1, 2, 3, 4],
+        'other.profraw': 'profraw',
+    }, {
+        'libFuzzer_target.delta.cov': [5],
+    }], self.uploads)
+    self.assertNotIn(coverage_merger.DELTA_DIRECTORY_NAME,
+                     os.listdir(self.artifacts_directory))
+
+  def test_lcov_delta(self):
+    """Test that LCOV tracefiles are merged and only newly covered lines are
+    uploaded."""
+    shutil.copy(
+        os.path.join(ARTIFACTS_DIRECTORY, 'coverage.cov'),
+        os.path.join(self.artifacts_directory, 'round-0.cov'))
+    with open(os.path.join(self.artifacts_directory, 'round-1.lcov'), 'w') as f:
+      f.write('TN:\nSF:/src/target.c\nDA:10,1\nDA:20,0\nend_of_record\n'
+              'SF:/src/other.c\nDA:1,2\nend_of_record\n')
+    self._upload()
+
+    for filename in os.listdir(self.artifacts_directory):
+      os.remove(os.path.join(self.artifacts_directory, filename))
+    with open(os.path.join(self.artifacts_directory, 'round-2.lcov'), 'w') as f:
+      f.write('SF:/src/target.c\nDA:15,1\nDA:20,4\nend_of_record\n')
+    self._upload()
+
+    self.assertEqual([{
+        'libFuzzer_target.delta.lcov':
+            'SF:/src/other.c\nDA:1,2\nend_of_record\n'
+            'SF:/src/target.c\nDA:10,6\nDA:15,3\nend_of_record\n',
+    }, {
+        'libFuzzer_target.delta.lcov':
+            'SF:/src/target.c\nDA:20,4\nend_of_record\n',
+    }], self.uploads)
+
+  def test_nothing_new(self):
+    """Test that nothing is uploaded without new coverage."""
+    self._write_sancov('round-0.cov', [1])
+    self._upload()
+    self._upload()
+    self.assertEqual(1, len(self.uploads))
+
+  def test_new_revision(self):
+    """Test that a new revision starts from empty coverage and replaces the
+    coverage kept for the previous one."""
+    self._write_sancov('round-0.cov', [1])
+    self._upload(revision=1)
+    self._upload(revision=2)
+
+    self.assertEqual(2, len(self.uploads))
+    self.assertEqual(['target-2.sancov'],
+                     os.listdir(coverage_merger.get_coverage_directory()))
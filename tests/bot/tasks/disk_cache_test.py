@@ -0,0 +1,115 @@
+"""disk_cache tests."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from bot.tasks import cache_lock, disk_cache
+from tests.test_libs import helpers
+
+
+def _create_entry(path, size, last_used_time):
+  os.makedirs(path)
+  with open(os.path.join(path, 'data'), 'w') as f:
+    f.write('A' * size)
+  os.utime(path, (last_used_time, last_used_time))
+
+
+class DiskCacheTest(unittest.TestCase):
+  """Tests for evicting cache entries."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    self.addCleanup(disk_cache._stats.clear)
+    self.addCleanup(disk_cache.release_used)
+    os.environ['BOT_DIR'] = os.path.join(self.temp_dir, 'bot')
+
+    for name in ['BUILDS_DIR', 'FUZZERS_DIR', 'DATA_BUNDLES_DIR']:
+      os.environ[name] = os.path.join(self.temp_dir, name.lower())
+
+    self.old_corpus = os.path.join(os.environ['DATA_BUNDLES_DIR'], 'old')
+    self.new_corpus = os.path.join(os.environ['DATA_BUNDLES_DIR'], 'new')
+    self.fuzzer = os.path.join(os.environ['FUZZERS_DIR'], 'libFuzzer')
+    _create_entry(self.old_corpus, 100, 1000)
+    _create_entry(self.new_corpus, 100, 3000)
+    _create_entry(self.fuzzer, 100, 2000)
+
+  def test_disabled(self):
+    """Test that nothing is evicted without a budget."""
+    disk_cache.enforce_budget()
+    self.assertTrue(os.path.exists(self.old_corpus))
+    self.assertEqual({}, disk_cache.get_stats())
+
+  def test_quota(self):
+    """Test that the least recently used entries of a category over its quota
+    are evicted."""
+    os.environ['CACHE_CORPORA_QUOTA_GB'] = str(150 / disk_cache.BYTES_IN_GB)
+    disk_cache.enforce_budget()
+
+    self.assertFalse(os.path.exists(self.old_corpus))
+    self.assertTrue(os.path.exists(self.new_corpus))
+    self.assertTrue(os.path.exists(self.fuzzer))
+    self.assertEqual({
+        'corpora': {
+            'evictions': 1,
+            'evicted_bytes': 100
+        }
+    }, disk_cache.get_stats())
+
+  def test_budget(self):
+    """Test that the least recently used entries across categories are evicted
+    to fit the total budget."""
+    os.environ['CACHE_DISK_BUDGET_GB'] = str(150 / disk_cache.BYTES_IN_GB)
+    disk_cache.enforce_budget()
+
+    self.assertFalse(os.path.exists(self.old_corpus))
+    self.assertFalse(os.path.exists(self.fuzzer))
+    self.assertTrue(os.path.exists(self.new_corpus))
+
+  def test_locked(self):
+    """Test that eviction holds the locks of all cache categories."""
+    os.environ['CACHE_DISK_BUDGET_GB'] = str(150 / disk_cache.BYTES_IN_GB)
+    with mock.patch('bot.tasks.cache_lock.lock_all') as mock_lock_all:
+      disk_cache.enforce_budget()
+
+    mock_lock_all.assert_called_once_with(disk_cache.CATEGORIES)
+    self.assertFalse(os.path.exists(self.old_corpus))
+
+  def test_mark_used(self):
+    """Test that a used entry is evicted last."""
+    os.environ['CACHE_DISK_BUDGET_GB'] = str(250 / disk_cache.BYTES_IN_GB)
+    disk_cache.mark_used(self.old_corpus)
+    disk_cache.enforce_budget()
+
+    self.assertTrue(os.path.exists(self.old_corpus))
+    self.assertFalse(os.path.exists(self.fuzzer))
+
+  def test_in_use(self):
+    """Test that entries used by a running task are not evicted until it
+    finishes."""
+    os.environ['CACHE_DISK_BUDGET_GB'] = str(150 / disk_cache.BYTES_IN_GB)
+    disk_cache.mark_used(os.path.join(self.old_corpus, 'data'))
+    os.utime(self.old_corpus, (1000, 1000))
+    disk_cache.enforce_budget()
+
+    self.assertTrue(os.path.exists(self.old_corpus))
+    self.assertFalse(os.path.exists(self.fuzzer))
+    self.assertFalse(os.path.exists(self.new_corpus))
+
+    os.environ['CACHE_DISK_BUDGET_GB'] = '0'
+    disk_cache.release_used()
+    disk_cache.enforce_budget()
+    self.assertFalse(os.path.exists(self.old_corpus))
+
+  def test_get_entry_path(self):
+    """Test that paths are mapped to the cache entry holding them."""
+    self.assertEqual(self.fuzzer, disk_cache.get_entry_path(
+        os.path.join(self.fuzzer, 'bin', 'fuzzer')))
+    self.assertEqual(self.fuzzer, disk_cache.get_entry_path(self.fuzzer))
+    self.assertIsNone(
+        disk_cache.get_entry_path(os.environ['FUZZERS_DIR']))
+    self.assertIsNone(disk_cache.get_entry_path(self.temp_dir))
@@ -0,0 +1,128 @@
+"""entity_cache tests."""
+import unittest
+
+import mock
+
+from bot.tasks import entity_cache
+from tests.test_libs import helpers
+
+
+class EntityCacheTest(unittest.TestCase):
+  """Tests for EntityCache."""
+
+  def setUp(self):
+    helpers.patch(self, ['time.time'])
+    self.mock.time.return_value = 1000
+    self.cache = entity_cache.EntityCache(capacity=2, ttl_in_seconds=60)
+
+  def test_hit_and_miss(self):
+    """Test hit and miss counters."""
+    self.assertIsNone(self.cache.get('a'))
+    self.cache.put('a', {'value': 1})
+    self.assertEqual({'value': 1}, self.cache.get('a'))
+    self.assertEqual(1, self.cache.hits)
+    self.assertEqual(1, self.cache.misses)
+
+  def test_returns_copy(self):
+    """Test that mutating a returned value does not change the cache."""
+    self.cache.put('a', {'value': 1})
+    self.cache.get('a')['value'] = 2
+    self.assertEqual({'value': 1}, self.cache.get('a'))
+
+  def test_expiry(self):
+    """Test that entries expire after the TTL."""
+    self.cache.put('a', 1)
+    self.mock.time.return_value = 1061
+    self.assertIsNone(self.cache.get('a'))
+    self.assertEqual(0, len(self.cache))
+
+  def test_eviction(self):
+    """Test that the least recently used entry is evicted."""
+    self.cache.put('a', 1)
+    self.cache.put('b', 2)
+    self.cache.get('a')
+    self.cache.put('c', 3)
+    self.assertEqual(1, self.cache.get('a'))
+    self.assertIsNone(self.cache.get('b'))
+    self.assertEqual(3, self.cache.get('c'))
+
+  def test_none_not_cached(self):
+    """Test that None is not cached."""
+    self.cache.put('a', None)
+    self.assertEqual(0, len(self.cache))
+
+
+class EntityGettersTest(unittest.TestCase):
+  """Tests for the entity getters."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, [
+        'bot.tasks.entity_cache.get_api_client',
+        'time.time',
+    ])
+    self.mock.time.return_value = 1000
+    self.api_client = mock.Mock()
+    self.mock.get_api_client.return_value = self.api_client
+    self.fuzzer = mock.Mock(id='fuzzer-id', revision=1)
+    self.fuzzer.name = 'fuzzer'
+    self.api_client.fuzzer_api.get_fuzzer.return_value = self.fuzzer
+    self.api_client.fuzzer_api.get_fuzzer_by_id.return_value = self.fuzzer
+
+    entity_cache.configure()
+    self.addCleanup(setattr, entity_cache, '_cache', None)
+
+  def test_not_configured(self):
+    """Test that reads go to the API until the cache is configured."""
+    entity_cache._cache = None
+    entity_cache.get_job('job')
+    entity_cache.get_job('job')
+    self.assertEqual(2, self.api_client.job_api.get_job.call_count)
+
+  def test_job_cached(self):
+    """Test that a job is fetched once, and that a hit makes no request."""
+    entity_cache.get_job('job')
+    entity_cache.get_job('job')
+    self.assertEqual(1, self.api_client.job_api.get_job.call_count)
+    self.assertEqual(0, self.api_client.job_api.make_request.call_count)
+    self.assertEqual({'hits': 1, 'misses': 1, 'size': 1},
+                     entity_cache.get_stats())
+
+  def test_expired(self):
+    """Test that an entity is fetched again once its TTL expired."""
+    entity_cache.get_project('project')
+    self.mock.time.return_value += entity_cache.DEFAULT_TTL_IN_SECONDS + 1
+    entity_cache.get_project('project')
+    self.assertEqual(
+        2, self.api_client.project_api.get_project_by_id.call_count)
+
+  def test_fuzzer_aliases(self):
+    """Test that a fuzzer fetched by name is also cached by id."""
+    entity_cache.get_fuzzer('fuzzer')
+    entity_cache.get_fuzzer_by_id('fuzzer-id')
+    self.assertEqual(1, self.api_client.fuzzer_api.get_fuzzer.call_count)
+    self.assertEqual(0,
+                     self.api_client.fuzzer_api.get_fuzzer_by_id.call_count)
+
+  def test_refresh(self):
+    """Test that refresh bypasses the cache and updates both keys."""
+    entity_cache.get_fuzzer_by_id('fuzzer-id')
+    entity_cache.get_fuzzer_by_id('fuzzer-id', refresh=True)
+    self.assertEqual(2,
+                     self.api_client.fuzzer_api.get_fuzzer_by_id.call_count)
+
+    entity_cache.get_fuzzer('fuzzer')
+    self.assertEqual(0, self.api_client.fuzzer_api.get_fuzzer.call_count)
+
+  def test_update_invalidates(self):
+    """Test that writing a fuzzer drops the cached copies."""
+    entity_cache.get_fuzzer('fuzzer')
+    entity_cache.update_fuzzer(self.fuzzer)
+    self.api_client.fuzzer_api.update_fuzzer.assert_called_once_with(
+        self.fuzzer)
+
+    entity_cache.get_fuzzer('fuzzer')
+    entity_cache.get_fuzzer_by_id('fuzzer-id')
+    self.assertEqual(2, self.api_client.fuzzer_api.get_fuzzer.call_count)
+    self.assertEqual(0,
+                     self.api_client.fuzzer_api.get_fuzzer_by_id.call_count)
@@ -2,6 +2,7 @@
 # pylint: disable=protected-access
 
 import datetime
+import itertools
 import os
 import queue
 import shutil
@@ -24,7 +25,7 @@ from pingu_sdk.fuzzers.libFuzzer import engine as libfuzzer_engine
 from pingu_sdk.fuzzers import engine
 from pingu_sdk.metrics import monitor, monitoring_metrics
 from pingu_sdk.system import environment, utils
-from bot.tasks import fuzz_task
+from bot.tasks import checkpoints, fuzz_task
 from bot.tasks.task_context import TaskContext
 from tests.test_libs import helpers, test_utils
 from pingu_sdk.datastore.models.testcase_variant import TestcaseVariantStatus
@@ -988,6 +989,181 @@ class TestCorpusSync(fake_filesystem_unittest.TestCase):
         self.assertEqual(1, self.mock.rsync_to_disk.call_count)
 
 
+class UploadCorpusFilesTest(unittest.TestCase):
+    """Tests for SyncCorpusStorage.upload_files."""
+
+    def setUp(self):
+        helpers.patch(self, [
+            'pingu_sdk.fuzzing.corpus_manager.FuzzTargetCorpus',
+        ])
+        helpers.patch_environ(self)
+        self.corpus = fuzz_task.SyncCorpusStorage(uuid4(), uuid4(), 'child',
+                                                  '/dir', '/dir1')
+        self.upload_files = (
+            self.mock.FuzzTargetCorpus.return_value.upload_files)
+        self.upload_files.return_value = True
+
+    @mock.patch('bot.tasks.fuzz_task.CORPUS_UPLOAD_BATCH_SIZE', 2)
+    def test_batches(self):
+        """Test that new files are uploaded in batches, one request each, and
+        recorded as synced."""
+        self.assertTrue(
+            self.corpus.upload_files(['/dir/a', '/dir/b', '/dir/c']))
+        self.assertEqual([
+            mock.call(['/dir/a', '/dir/b']),
+            mock.call(['/dir/c']),
+        ], self.upload_files.call_args_list)
+        self.assertEqual({'/dir/a', '/dir/b', '/dir/c'},
+                         self.corpus._synced_files)
+
+    @mock.patch('bot.tasks.fuzz_task.CORPUS_UPLOAD_BATCH_SIZE', 2)
+    def test_failed_batch(self):
+        """Test that a failed batch fails the upload and that its files are
+        not recorded as synced."""
+        self.upload_files.side_effect = [False, None]
+        self.assertFalse(
+            self.corpus.upload_files(['/dir/a', '/dir/b', '/dir/c']))
+        self.assertEqual({'/dir/c'}, self.corpus._synced_files)
+
+    def test_failed_batch_manifest(self):
+        """Test that the files of a failed batch are not added to the
+        manifest."""
+        self.corpus._manifest = mock.Mock()
+        self.upload_files.return_value = False
+        self.assertFalse(self.corpus.upload_files(['/dir/a']))
+        self.assertEqual(0, self.corpus._manifest.add.call_count)
+
+
+class DistillNewCorpusFilesTest(unittest.TestCase):
+    """Tests for distill_new_corpus_files."""
+
+    def setUp(self):
+        helpers.patch_environ(self)
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        os.environ['FUZZ_INPUTS_DISK'] = os.path.join(self.temp_dir, 'inputs')
+        os.mkdir(os.environ['FUZZ_INPUTS_DISK'])
+        self.corpus_directory = os.path.join(self.temp_dir, 'corpus')
+        os.mkdir(self.corpus_directory)
+        self.new_files = []
+        for name in ['synced', 'new1', 'new2']:
+            path = os.path.join(self.corpus_directory, name)
+            with open(path, 'w') as f:
+                f.write(name)
+            if name != 'synced':
+                self.new_files.append(path)
+
+        self.corpus_storage = mock.Mock(corpus_directory=self.corpus_directory)
+        self.corpus_storage.get_new_files.side_effect = lambda: sorted(
+            os.path.join(self.corpus_directory, name)
+            for name in os.listdir(self.corpus_directory)
+            if name != 'synced')
+        self.engine_impl = mock.Mock()
+
+    def test_distill(self):
+        """Test that only the units the merge keeps are left."""
+        def minimize_corpus(target_path, arguments, input_dirs, output_dir,
+                            reproducers_dir, max_time):
+            self.assertEqual(['synced'], os.listdir(output_dir))
+            for name in os.listdir(input_dirs[0]):
+                if name.endswith('new2'):
+                    shutil.copy(os.path.join(input_dirs[0], name),
+                                os.path.join(output_dir, 'hash'))
+
+        self.engine_impl.minimize_corpus.side_effect = minimize_corpus
+        self.assertEqual(
+            [os.path.join(self.corpus_directory, 'hash')],
+            fuzz_task.distill_new_corpus_files(
+                self.engine_impl, self.corpus_storage, self.new_files))
+        self.assertCountEqual(['synced', 'hash'],
+                              os.listdir(self.corpus_directory))
+
+    def test_failure(self):
+        """Test that all new units are kept if the engine can't distill."""
+        self.engine_impl.minimize_corpus.side_effect = NotImplementedError
+        self.assertEqual(
+            self.new_files,
+            fuzz_task.distill_new_corpus_files(
+                self.engine_impl, self.corpus_storage, self.new_files))
+        self.assertCountEqual(['synced', 'new1', 'new2'],
+                              os.listdir(self.corpus_directory))
+        self.assertEqual([], os.listdir(os.environ['FUZZ_INPUTS_DISK']))
+
+
+class GetCorpusUploadPathTest(unittest.TestCase):
+    """Tests for get_corpus_upload_path."""
+
+    def setUp(self):
+        helpers.patch_environ(self)
+        os.environ['CONTENT_ADDRESSED_CORPUS'] = 'True'
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        # SHA-1 of 'A'.
+        self.sha1 = '6dcd4ce23d88e2ee9568ba546c007c63d9131c1b'
+        self.hashed_path = os.path.join(self.temp_dir, self.sha1)
+
+    def _write_unit(self, name, contents='A'):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_rename(self):
+        """Test that units are renamed after their content."""
+        path = self._write_unit('crash-input')
+        uploaded_hashes = set()
+        self.assertEqual(self.hashed_path,
+                         fuzz_task.get_corpus_upload_path(
+                             path, uploaded_hashes))
+        self.assertEqual([os.path.basename(self.hashed_path)],
+                         os.listdir(self.temp_dir))
+
+        # Uploading the hash-named unit itself is a no-op.
+        self.assertEqual(self.hashed_path,
+                         fuzz_task.get_corpus_upload_path(
+                             self.hashed_path, set()))
+
+    def test_duplicates(self):
+        """Test that copies of uploaded or synced content are removed."""
+        first_path = self._write_unit('first')
+        second_path = self._write_unit('second')
+        uploaded_hashes = set()
+        fuzz_task.get_corpus_upload_path(first_path, uploaded_hashes)
+        self.assertIsNone(
+            fuzz_task.get_corpus_upload_path(second_path, uploaded_hashes))
+        self.assertFalse(os.path.exists(second_path))
+
+        third_path = self._write_unit('third')
+        self.assertIsNone(
+            fuzz_task.get_corpus_upload_path(third_path, set()))
+        self.assertEqual([os.path.basename(self.hashed_path)],
+                         os.listdir(self.temp_dir))
+
+    def test_synced_content(self):
+        """Test that units whose content is in storage are not uploaded."""
+        path = self._write_unit('synced-copy')
+        is_synced = mock.Mock(return_value=True)
+        self.assertIsNone(
+            fuzz_task.get_corpus_upload_path(path, set(), is_synced=is_synced))
+        is_synced.assert_called_once_with(self.sha1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_not_content_addressed(self):
+        """Test that units are neither renamed nor removed by default, and
+        that copies are still not uploaded."""
+        del os.environ['CONTENT_ADDRESSED_CORPUS']
+        first_path = self._write_unit('first')
+        second_path = self._write_unit('second')
+        uploaded_hashes = set()
+        self.assertEqual(first_path,
+                         fuzz_task.get_corpus_upload_path(
+                             first_path, uploaded_hashes))
+        self.assertIsNone(
+            fuzz_task.get_corpus_upload_path(second_path, uploaded_hashes))
+        self.assertEqual(['first', 'second'], sorted(os.listdir(self.temp_dir)))
+
+
 class DoBlackboxFuzzingTest(fake_filesystem_unittest.TestCase):
     """do_blackbox_fuzzing tests."""
 
@@ -1372,6 +1548,328 @@ class DoEngineFuzzingTest(fake_filesystem_unittest.TestCase):
                 }, testcase_run.data)
 
 
+class MultiTargetFuzzingTest(unittest.TestCase):
+    """Tests for picking several fuzz targets and splitting rounds between
+    them."""
+
+    def setUp(self):
+        helpers.patch_environ(self)
+
+    def test_fuzz_targets_per_task(self):
+        """Test the number of fuzz targets per task."""
+        self.assertEqual(1, fuzz_task.get_fuzz_targets_per_task())
+        os.environ['FUZZ_TARGETS_PER_TASK'] = '3'
+        self.assertEqual(3, fuzz_task.get_fuzz_targets_per_task())
+
+    def test_select(self):
+        """Test that the picked target comes first and zero weights are
+        skipped."""
+        targets = fuzz_task.select_session_fuzz_targets(
+            'a', ['a', 'b', 'c', 'd'], {'d': 0}, 3)
+        self.assertEqual('a', targets[0])
+        self.assertCountEqual(['a', 'b', 'c'], targets)
+
+        self.assertEqual(['a'],
+                         fuzz_task.select_session_fuzz_targets('a', ['a'], {}, 3))
+
+    def test_max_testcases_restored(self):
+        """Test that MAX_TESTCASES is restored when fuzzing a target fails."""
+        os.environ['FUZZ_TARGET'] = 'a'
+        os.environ['FUZZ_TARGETS_PER_TASK'] = '2'
+        os.environ['MAX_TESTCASES'] = '10'
+        session = mock.Mock(checkpoint=None)
+        session.do_engine_fuzzing.side_effect = fuzz_task.FuzzTaskException
+        with mock.patch('pingu_sdk.fuzzers.utils.get_fuzz_targets',
+                        return_value=['/build/a', '/build/b']):
+            with self.assertRaises(fuzz_task.FuzzTaskException):
+                fuzz_task.FuzzingSession.do_multi_target_engine_fuzzing(
+                    session, mock.Mock(), {}, 1)
+
+        self.assertEqual(10, environment.get_value('MAX_TESTCASES'))
+
+    def test_allocate(self):
+        """Test splitting rounds by weight."""
+        self.assertEqual([('a', 3), ('b', 2), ('c', 2)],
+                         fuzz_task.allocate_fuzzing_rounds(
+                             ['a', 'b', 'c'], {'a': 2.0}, 7))
+        # The round lost to rounding goes to the largest remainder.
+        self.assertEqual([('a', 4), ('b', 2)],
+                         fuzz_task.allocate_fuzzing_rounds(
+                             ['a', 'b'], {'a': 2.0}, 6))
+
+    def test_allocate_few_rounds(self):
+        """Test that every target gets at least one round."""
+        self.assertEqual([('a', 1), ('b', 1)],
+                         fuzz_task.allocate_fuzzing_rounds(['a', 'b'], {}, 1))
+        self.assertEqual([('a', 1), ('b', 1)],
+                         fuzz_task.allocate_fuzzing_rounds(
+                             ['a', 'b'], {'a': 0, 'b': 0}, 2))
+
+
+def _fake_run_engine_fuzzer(engine_impl, fuzztarget, sync_corpus_directory,
+                            testcase_directory, artifacts_directory, project_id,
+                            prepared_target=None):
+    """Fake run_engine_fuzzer writing a crash and a coverage file."""
+    crash_path = os.path.join(testcase_directory, 'crash')
+    with open(crash_path, 'w') as f:
+        f.write(testcase_directory)
+    with open(os.environ['LLVM_PROFILE_FILE'], 'w') as f:
+        f.write('')
+
+    result = engine.FuzzResult('logs', ['cmd'],
+                               [engine.Crash(crash_path, 'stack', [], 1.0)],
+                               {'pid': os.getpid()}, 1.0)
+    return result, {'fuzzer_binary_name': 'target'}, {'strategy_1': 1}
+
+
+class ParallelEngineFuzzersTest(unittest.TestCase):
+    """Tests for running engine fuzzing rounds in parallel."""
+
+    def setUp(self):
+        helpers.patch_environ(self)
+        helpers.patch(self, ['bot.tasks.fuzz_task.run_engine_fuzzer'])
+        self.mock.run_engine_fuzzer.side_effect = _fake_run_engine_fuzzer
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        os.environ['BUILD_DIR'] = self.temp_dir
+        self.testcase_directory = os.path.join(self.temp_dir, 'inputs')
+        self.artifacts_directory = os.path.join(self.temp_dir, 'artifacts')
+
+    def test_round_count(self):
+        """Test that MAX_FUZZ_THREADS rounds run at once when enabled."""
+        os.environ['MAX_FUZZ_THREADS'] = '4'
+        self.assertEqual(1, fuzz_task.get_parallel_fuzz_round_count())
+
+        os.environ['PARALLEL_FUZZ_ROUNDS'] = 'True'
+        self.assertEqual(4, fuzz_task.get_parallel_fuzz_round_count())
+
+    def test_parallel(self):
+        """Test that each round runs in its own process and directories, and
+        that their artifacts are merged."""
+        results = fuzz_task.run_parallel_engine_fuzzers(
+            mock.Mock(), mock.Mock(), '/corpus', self.testcase_directory,
+            self.artifacts_directory, uuid4(), [2, 3])
+
+        self.assertEqual(2, len(results))
+        pids = set()
+        for fuzzing_round, (result, fuzzer_metadata, strategies) in zip(
+                [2, 3], results):
+            crash_path = result.crashes[0].input_path
+            self.assertEqual(
+                os.path.join(self.testcase_directory,
+                             'round-%d-crash' % fuzzing_round), crash_path)
+            with open(crash_path) as f:
+                self.assertEqual(
+                    os.path.join(self.testcase_directory,
+                                 'round-%d' % fuzzing_round), f.read())
+            self.assertEqual({'fuzzer_binary_name': 'target'}, fuzzer_metadata)
+            self.assertEqual({'strategy_1': 1}, strategies)
+            pids.add(result.stats['pid'])
+
+        self.assertEqual(2, len(pids))
+        self.assertNotIn(os.getpid(), pids)
+        self.assertCountEqual(
+            ['round-2-default.profraw', 'round-3-default.profraw'],
+            os.listdir(self.artifacts_directory))
+        # Only the crash inputs are kept from the instance testcase directories.
+        self.assertCountEqual(['round-2-crash', 'round-3-crash'],
+                              os.listdir(self.testcase_directory))
+        self.assertNotIn('LLVM_PROFILE_FILE', os.environ)
+
+
+class PreparedFuzzTargetTest(unittest.TestCase):
+    """Tests for preparing a fuzz target once per fuzzing session."""
+
+    def setUp(self):
+        helpers.patch_environ(self)
+        helpers.patch(self, [
+            'pingu_sdk.fuzzers.engine_common.find_fuzzer_path',
+            'pingu_sdk.fuzzers.engine_common.get_all_issue_metadata',
+            'pingu_sdk.fuzzers.utils.cleanup',
+        ])
+        self.mock.find_fuzzer_path.return_value = '/build_dir/target'
+        self.mock.get_all_issue_metadata.return_value = {
+            'issue_labels': 'label'
+        }
+        os.environ['BUILD_DIR'] = '/build_dir'
+
+        self.engine_impl = mock.Mock()
+        self.engine_impl.prepare.side_effect = lambda *_: mock.Mock()
+        self.fuzz_target = mock.Mock(binary='target', id='target_id')
+
+    def _prepare(self):
+        """Return a PreparedFuzzTarget for the test target."""
+        return fuzz_task.PreparedFuzzTarget(self.engine_impl, self.fuzz_target,
+                                            '/corpus', 'project_id')
+
+    def test_target_looked_up_once(self):
+        """Test that the target path and issue metadata are looked up once."""
+        prepared_target = self._prepare()
+        prepared_target.get_options()
+        prepared_target.get_options()
+
+        self.assertEqual('/build_dir/target', prepared_target.target_path)
+        self.assertEqual('/build_dir/target', os.environ['TARGET_PATH'])
+        self.assertEqual({'issue_labels': 'label'},
+                         prepared_target.issue_metadata)
+        self.mock.find_fuzzer_path.assert_called_once_with('/build_dir', 'target')
+        self.mock.get_all_issue_metadata.assert_called_once_with(
+            '/build_dir/target')
+
+    def test_prepare_every_round(self):
+        """Test that options are prepared for every round by default."""
+        prepared_target = self._prepare()
+        self.assertIsNot(prepared_target.get_options(),
+                         prepared_target.get_options())
+        self.assertEqual(2, self.engine_impl.prepare.call_count)
+        self.engine_impl.prepare.assert_called_with(
+            '/corpus', '/build_dir/target', '/build_dir', 'project_id',
+            'target_id')
+
+        prepared_target.cleanup_round()
+        self.assertEqual(1, self.mock.cleanup.call_count)
+
+    def test_prepare_once(self):
+        """Test that options are reused with PREPARE_ONCE_PER_SESSION, and that
+        their temporary artifacts are kept until the session ends."""
+        os.environ['PREPARE_ONCE_PER_SESSION'] = 'True'
+        prepared_target = self._prepare()
+        options = prepared_target.get_options()
+        self.assertIs(options, prepared_target.get_options())
+        self.assertEqual(1, self.engine_impl.prepare.call_count)
+
+        prepared_target.cleanup_round()
+        self.mock.cleanup.assert_not_called()
+
+        prepared_target.cleanup()
+        self.assertEqual(1, self.mock.cleanup.call_count)
+        self.assertIsNot(options, prepared_target.get_options())
+
+
+class BlackboxWorkerPoolTest(unittest.TestCase):
+    """Tests for running blackbox fuzzing rounds on a pool of workers."""
+
+    def setUp(self):
+        helpers.patch_environ(self)
+        helpers.patch(self, ['bot.tasks.fuzz_task.run_blackbox_fuzzer'])
+        self.mock.run_blackbox_fuzzer.side_effect = self._fake_run_blackbox_fuzzer
+        self.barrier = threading.Barrier(2, timeout=10)
+        self.calls = itertools.count()
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.testcase_directory = os.path.join(self.temp_dir, 'inputs')
+        self.artifacts_directory = os.path.join(self.temp_dir, 'artifacts')
+
+    def _fake_run_blackbox_fuzzer(self, fuzzer_executable, fuzzer_command,
+                                  timeout, testcase_directory,
+                                  artifacts_directory, working_dir,
+                                  log_collector=None):
+        """Fake run_blackbox_fuzzer writing a crash and a log file. The first
+        two rounds wait for each other."""
+        self.assertIn('--testcase_dir=%s ' % testcase_directory, fuzzer_command)
+        self.assertIn('--artifacts_dir=%s ' % artifacts_directory,
+                      fuzzer_command)
+        if next(self.calls) < 2:
+            self.barrier.wait()
+
+        crash_path = os.path.join(testcase_directory, 'crash-1')
+        with open(crash_path, 'w') as f:
+            f.write('')
+        with open(os.path.join(artifacts_directory, 'fuzzer.log'), 'w') as f:
+            f.write('')
+
+        result = engine.FuzzResult('logs', fuzzer_command,
+                                   [engine.Crash(crash_path, 'stack', [], 1.0)],
+                                   {}, 1.0)
+        return result, {'issue_labels': 'label'}, 0
+
+    def test_round_count(self):
+        """Test that MAX_FUZZ_THREADS rounds run at once when enabled."""
+        os.environ['MAX_FUZZ_THREADS'] = '4'
+        self.assertEqual(1, fuzz_task.get_parallel_blackbox_round_count())
+
+        os.environ['PARALLEL_BLACKBOX_ROUNDS'] = 'True'
+        self.assertEqual(4, fuzz_task.get_parallel_blackbox_round_count())
+
+    def test_run(self):
+        """Test that rounds run at once on workers with their own directories,
+        and that the artifacts of the workers are merged."""
+        pool = fuzz_task.BlackboxWorkerPool(
+            2, '/fuzzer/run.py', '/data', self.testcase_directory,
+            self.artifacts_directory, 60, '/fuzzer')
+        results = list(pool.run(range(5)))
+        pool.merge_artifacts(self.artifacts_directory)
+
+        self.assertFalse(self.barrier.broken)
+        self.assertCountEqual(range(5),
+                              [fuzzing_round for fuzzing_round, *_ in results])
+        crash_paths = set()
+        for _, result, fuzzer_metadata, return_code in results:
+            crash_paths.add(result.crashes[0].input_path)
+            self.assertEqual({'issue_labels': 'label'}, fuzzer_metadata)
+            self.assertEqual(0, return_code)
+
+        self.assertEqual({
+            os.path.join(self.testcase_directory, 'worker-0', 'crash-1'),
+            os.path.join(self.testcase_directory, 'worker-1', 'crash-1'),
+        }, crash_paths)
+        self.assertCountEqual(['worker-0-fuzzer.log', 'worker-1-fuzzer.log'],
+                              os.listdir(self.artifacts_directory))
+        self.assertFalse(
+            os.path.exists(self.artifacts_directory + '-worker-0'))
+
+    def test_failed_round(self):
+        """Test that a failed round is raised and cancels the others."""
+        self.mock.run_blackbox_fuzzer.side_effect = Exception('failed')
+        pool = fuzz_task.BlackboxWorkerPool(
+            2, '/fuzzer/run.py', '/data', self.testcase_directory,
+            self.artifacts_directory, 60, '/fuzzer')
+        with self.assertRaises(Exception):
+            list(pool.run(range(100)))
+        # No round is started after the first failure.
+        self.assertLessEqual(self.mock.run_blackbox_fuzzer.call_count, 2)
+
+
+class CheckpointCrashesTest(unittest.TestCase):
+    """Tests for checkpointing the crashes of completed fuzzing rounds."""
+
+    def setUp(self):
+        helpers.patch_environ(self)
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        os.environ['BOT_DIR'] = self.temp_dir
+        os.environ['TASK_CHECKPOINTS'] = 'True'
+
+    def test_restore(self):
+        """Test that crashes are restored from a checkpoint after their inputs
+        were deleted."""
+        input_path = os.path.join(self.temp_dir, 'crash-1')
+        with open(input_path, 'w') as f:
+            f.write('A')
+
+        checkpoint = checkpoints.get_checkpoint(Task('1', 'fuzz', 'libFuzzer', 'job'))
+        crashes_state = fuzz_task.checkpoint_crashes(
+            checkpoint, 3, [engine.Crash(input_path, b'stack', ['args'], 1.0), None],
+            {'strategy_1': 1})
+        checkpoint.set('fuzz_rounds', {'crashes': crashes_state})
+        os.remove(input_path)
+
+        checkpoint = checkpoints.get_checkpoint(Task('1', 'fuzz', 'libFuzzer', 'job'))
+        crashes = fuzz_task.restore_checkpointed_crashes(
+            checkpoint.get('fuzz_rounds')['crashes'])
+
+        self.assertEqual(1, len(crashes))
+        self.assertEqual(checkpoint.get_file_path('crash-3-0-crash-1'),
+                         crashes[0].file_path)
+        self.assertTrue(os.path.exists(crashes[0].file_path))
+        self.assertEqual('stack', crashes[0].unsymbolized_crash_stacktrace)
+        self.assertEqual('args', crashes[0].arguments)
+        self.assertEqual({'strategy_1': 1}, crashes[0].fuzzing_strategies)
+
+
 class AddIssueMetadataFromEnvironmentTest(unittest.TestCase):
     """Tests for _add_issue_metadata_from_environment."""
 
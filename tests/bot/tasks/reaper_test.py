@@ -0,0 +1,57 @@
+"""reaper tests."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from bot.tasks import reaper
+from tests.test_libs import helpers
+
+
+class RemoveDirectoryTest(unittest.TestCase):
+  """Tests for deferred deletion."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    os.environ['BOT_DIR'] = self.temp_dir
+    os.environ['DEFERRED_DELETION'] = 'True'
+    self.directory = os.path.join(self.temp_dir, 'corpus')
+    os.makedirs(os.path.join(self.directory, 'subdir'))
+    with open(os.path.join(self.directory, 'subdir', 'input'), 'w') as f:
+      f.write('A')
+
+  def test_remove(self):
+    """Test that a directory is moved out of the way and deleted later."""
+    reaper.remove_directory(self.directory)
+    self.assertFalse(os.path.exists(self.directory))
+
+    reaper.wait_for_deletions()
+    self.assertEqual([], os.listdir(reaper.get_trash_directory()))
+
+  def test_recreate(self):
+    """Test that the directory is recreated empty right away."""
+    reaper.remove_directory(self.directory, recreate=True)
+    self.assertEqual([], os.listdir(self.directory))
+
+    reaper.wait_for_deletions()
+    self.assertEqual([], os.listdir(reaper.get_trash_directory()))
+
+  def test_leftover_trash(self):
+    """Test that directories left in the trash by a previous run are deleted."""
+    os.makedirs(os.path.join(reaper.get_trash_directory(), 'old'))
+    self.addCleanup(setattr, reaper, '_thread', None)
+    reaper._thread = None
+
+    reaper.remove_directory(self.directory)
+    reaper.wait_for_deletions()
+    self.assertEqual([], os.listdir(reaper.get_trash_directory()))
+
+  def test_disabled(self):
+    """Test that the directory is deleted right away when disabled."""
+    os.environ['DEFERRED_DELETION'] = 'False'
+    reaper.remove_directory(self.directory)
+    self.assertFalse(os.path.exists(self.directory))
+    self.assertFalse(os.path.exists(reaper.get_trash_directory()))
@@ -0,0 +1,244 @@
+"""task_poller tests."""
+import json
+import os
+import unittest
+
+import mock
+import requests
+
+from bot.tasks import task_poller
+from pingu_sdk.datastore.pingu_api.pingu_api import PinguAPIError
+from pingu_sdk.system import environment
+from tests.test_libs import helpers
+
+
+class BackoffTest(unittest.TestCase):
+  """Tests for polling backoff."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, [
+        'random.uniform',
+        'time.sleep',
+    ])
+    self.mock.uniform.side_effect = lambda start, end: end
+    environment.set_value('TASK_POLL_MIN_WAIT', 2)
+    environment.set_value('TASK_POLL_MAX_WAIT', 20)
+    task_poller.reset_backoff()
+    self.addCleanup(task_poller.reset_backoff)
+
+  def test_exponential_backoff(self):
+    """Test that waits double up to the maximum."""
+    for _ in range(6):
+      task_poller.wait_for_next_task()
+
+    self.assertEqual(
+        [mock.call(2), mock.call(4), mock.call(8), mock.call(16),
+         mock.call(20), mock.call(20)], self.mock.sleep.call_args_list)
+
+  def test_jitter(self):
+    """Test that waits are drawn between the minimum and the backoff."""
+    task_poller.wait_for_next_task()
+    task_poller.wait_for_next_task()
+    self.mock.uniform.assert_called_with(2, 4)
+
+  def test_reset(self):
+    """Test that a completed task resets the backoff."""
+    task_poller.wait_for_next_task()
+    task_poller.wait_for_next_task()
+    task_poller.reset_backoff()
+    task_poller.wait_for_next_task()
+    self.assertEqual(mock.call(2), self.mock.sleep.call_args)
+
+  def test_default_max_wait(self):
+    """Test that the maximum wait defaults to FAIL_WAIT."""
+    del os.environ['TASK_POLL_MAX_WAIT']
+    environment.set_value('FAIL_WAIT', 5)
+    for _ in range(4):
+      task_poller.wait_for_next_task()
+    self.assertEqual(mock.call(5), self.mock.sleep.call_args)
+
+
+class GetTaskTest(unittest.TestCase):
+  """Tests for get_task."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, [
+        'bot.tasks.task_poller.get_api_client',
+        'pingu_sdk.system.tasks.get_task',
+    ])
+    self.task_api = self.mock.get_api_client.return_value.task_api
+    self.task_api.path = 'task'
+    environment.set_value('PLATFORM', 'LINUX')
+
+  def test_regular(self):
+    """Test that the queue is polled normally without long-polling."""
+    self.assertEqual(self.mock.get_task.return_value, task_poller.get_task())
+    self.assertEqual(0, self.task_api.make_request.call_count)
+
+  def test_long_poll(self):
+    """Test long-polling the task API."""
+    environment.set_value('TASK_LONG_POLL_TIMEOUT', 30)
+    self.task_api.make_request.return_value.content = json.dumps({
+        'task_id': 'id',
+        'command': 'fuzz',
+        'argument': 'libFuzzer',
+        'job_id': 'job',
+    }).encode('utf-8')
+
+    task = task_poller.get_task()
+    self.assertEqual('fuzz libFuzzer job', task.payload())
+    self.task_api.make_request.assert_called_once_with(
+        method='GET',
+        path='task',
+        params={'platform': 'LINUX', 'wait': 30},
+        timeout=30 + task_poller.LONG_POLL_GRACE_PERIOD)
+    self.assertEqual(0, self.mock.get_task.call_count)
+
+  def test_long_poll_empty(self):
+    """Test long-polling an empty queue."""
+    environment.set_value('TASK_LONG_POLL_TIMEOUT', 30)
+    self.task_api.make_request.side_effect = PinguAPIError('No task')
+    self.assertIsNone(task_poller.get_task())
+
+  def test_long_poll_command_override(self):
+    """Test that a command override wins over long-polling."""
+    environment.set_value('TASK_LONG_POLL_TIMEOUT', 30)
+    environment.set_value('COMMAND_OVERRIDE', 'fuzz libFuzzer job')
+    self.assertTrue(task_poller.get_task().is_command_override)
+    self.assertEqual(0, self.task_api.make_request.call_count)
+
+
+class RequestFailureTest(unittest.TestCase):
+  """Tests for logging failed task requests."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, [
+        'bot.tasks.task_poller.get_api_client',
+        'pingu_sdk.metrics.logs.log',
+        'pingu_sdk.metrics.logs.log_warn',
+        'time.time',
+    ])
+    self.mock.time.return_value = 1000
+    self.task_api = self.mock.get_api_client.return_value.task_api
+    task_poller._last_request_warning_time = None
+    task_poller._suppressed_request_warnings = 0
+
+  def test_http_error(self):
+    """Test that an error status from the server is not a warning."""
+    self.task_api.make_request.side_effect = requests.HTTPError('404')
+    self.assertIsNone(task_poller._request_task({}))
+    self.assertEqual(0, self.mock.log_warn.call_count)
+    self.assertEqual(1, self.mock.log.call_count)
+
+  def test_rate_limited(self):
+    """Test that other failures are warned about once per interval."""
+    self.task_api.make_request.side_effect = requests.ConnectionError('down')
+    task_poller._request_task({})
+    task_poller._request_task({})
+    self.assertEqual(1, self.mock.log_warn.call_count)
+
+    self.mock.time.return_value += task_poller.REQUEST_WARNING_INTERVAL
+    task_poller._request_task({})
+    self.assertEqual(2, self.mock.log_warn.call_count)
+    self.assertIn('1 more failures', self.mock.log_warn.call_args[0][0])
+
+
+class LocalityTest(unittest.TestCase):
+  """Tests for locality-aware task acquisition against a stand-in API."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, [
+        'bot.tasks.task_poller.get_api_client',
+        'bot.tasks.cache_inventory.get_inventory',
+    ])
+    self.mock.get_inventory.return_value = {
+        'builds': {
+            'warm_job': {
+                'revision': '1',
+                'size': 1000
+            }
+        },
+        'fuzzers': {},
+        'corpora': {},
+    }
+    environment.set_value('TASK_LOCALITY_CANDIDATES', 2)
+    environment.set_value('PLATFORM', 'LINUX')
+
+    self.queue = {
+        'cold': {
+            'task_id': 'cold',
+            'command': 'fuzz',
+            'argument': 'libFuzzer',
+            'job_id': 'cold_job'
+        },
+        'warm': {
+            'task_id': 'warm',
+            'command': 'fuzz',
+            'argument': 'libFuzzer',
+            'job_id': 'warm_job',
+            'revision': 1
+        },
+    }
+    self.requests = []
+    task_api = self.mock.get_api_client.return_value.task_api
+    task_api.path = 'task'
+    task_api.make_request.side_effect = self._make_request
+
+  def _make_request(self, method, path, params, timeout):
+    """Stand-in task API that offers candidates and hands out claimed tasks."""
+    del method, path, timeout
+    self.requests.append(dict(params))
+    if 'task_id' in params:
+      if params['task_id'] not in self.queue:
+        raise PinguAPIError('Already claimed')
+      content = self.queue.pop(params['task_id'])
+    else:
+      content = {'candidates': list(self.queue.values())}
+
+    response = mock.Mock()
+    response.content = json.dumps(content).encode('utf-8')
+    return response
+
+  def test_claims_warm_task(self):
+    """Test that the task reusing the local build is claimed."""
+    task = task_poller.get_task()
+    self.assertEqual('warm', task.id)
+    self.assertEqual(2, self.requests[0]['candidates'])
+    self.assertEqual({
+        'builds': {
+            'warm_job': '1'
+        },
+        'corpora': [],
+        'fuzzers': {}
+    }, json.loads(self.requests[0]['inventory']))
+    self.assertEqual('warm', self.requests[1]['task_id'])
+
+  def test_other_revision(self):
+    """Test that a cached build of another revision is not preferred."""
+    self.queue['warm']['revision'] = 2
+    self.assertEqual('cold', task_poller.get_task().id)
+
+  def test_falls_back_when_claimed(self):
+    """Test claiming the next best task when the best one is gone."""
+    original_make_request = self._make_request
+
+    def make_request(method, path, params, timeout):
+      if params.get('task_id') == 'warm':
+        self.queue.pop('warm')
+      return original_make_request(method, path, params, timeout)
+
+    task_api = self.mock.get_api_client.return_value.task_api
+    task_api.make_request.side_effect = make_request
+    self.assertEqual('cold', task_poller.get_task().id)
+
+  def test_server_picked_task(self):
+    """Test a server that leases a task itself."""
+    task_api = self.mock.get_api_client.return_value.task_api
+    task_api.make_request.side_effect = None
+    task_api.make_request.return_value.content = json.dumps(
+        self.queue['cold']).encode('utf-8')
+    self.assertEqual('cold', task_poller.get_task().id)
@@ -0,0 +1,153 @@
+"""task_prefetcher tests."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from bot.tasks import task_prefetcher
+from pingu_sdk.system.tasks import Task
+from tests.test_libs import helpers
+
+
+class TaskPrefetcherTest(unittest.TestCase):
+  """Tests for task prefetching and staging."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, [
+        'pingu_sdk.system.tasks.get_task',
+        ('entity_cache_get_api_client',
+         'bot.tasks.entity_cache.get_api_client'),
+        'bot.tasks.task_prefetcher.get_api_client',
+    ])
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    os.environ['CACHE_DIR'] = os.path.join(self.temp_dir, 'cache')
+    os.environ['FUZZERS_DIR'] = os.path.join(self.temp_dir, 'fuzzers')
+    os.environ['FAIL_RETRIES'] = '1'
+    os.environ['FAIL_WAIT'] = '1'
+    os.environ['TASK_PREFETCH'] = 'True'
+
+    task_prefetcher._prefetch_thread = None
+    task_prefetcher._staged_task = None
+    task_prefetcher._current_staged_task = None
+    task_prefetcher._empty_prefetch_time = None
+    task_prefetcher._release_registered = True
+
+    self.api_client = mock.Mock()
+    self.mock.get_api_client.return_value = self.api_client
+    self.mock.entity_cache_get_api_client.return_value = self.api_client
+    self.fuzzer = mock.Mock(
+        id='fuzzer-id', revision=2, filename='fuzzer.zip', builtin=False)
+    self.fuzzer.name = 'fuzzer'
+    self.api_client.fuzzer_api.get_fuzzer.return_value = self.fuzzer
+    self.api_client.fuzzer_api.download_fuzzer.return_value = b'archive'
+
+  def test_disabled_by_default(self):
+    """Test that prefetching is off unless configured."""
+    self.assertTrue(task_prefetcher.is_enabled())
+    del os.environ['TASK_PREFETCH']
+    self.assertFalse(task_prefetcher.is_enabled())
+
+  def test_prefetch_and_stage(self):
+    """Test that the next task is leased and staged in the background."""
+    task = Task('id', 'fuzz', 'fuzzer', 'job')
+    self.mock.get_task.return_value = task
+
+    task_prefetcher.prefetch_next_task()
+    self.assertEqual(task, task_prefetcher.get_task())
+    self.assertEqual(1, self.mock.get_task.call_count)
+
+    staged_task = task_prefetcher.take_staged_task(task)
+    self.assertEqual(self.api_client.job_api.get_job.return_value,
+                     staged_task.job)
+    self.assertEqual(
+        self.api_client.project_api.get_project_by_id.return_value,
+        staged_task.project)
+    self.assertEqual(self.fuzzer, staged_task.fuzzer)
+    self.assertIsNone(task_prefetcher.take_staged_task(task))
+
+    archive_path = os.path.join(self.temp_dir, 'fuzzer.zip')
+    self.assertTrue(
+        task_prefetcher.take_staged_fuzzer_archive(self.fuzzer, archive_path))
+    with open(archive_path, 'rb') as file_handle:
+      self.assertEqual(b'archive', file_handle.read())
+    self.assertFalse(
+        task_prefetcher.take_staged_fuzzer_archive(self.fuzzer, archive_path))
+
+  def test_installed_fuzzer_not_downloaded(self):
+    """Test that an installed fuzzer revision is not downloaded again."""
+    fuzzer_directory = os.path.join(os.environ['FUZZERS_DIR'], 'fuzzer')
+    os.makedirs(fuzzer_directory)
+    with open(os.path.join(fuzzer_directory, '.fuzzer_version'), 'w') as f:
+      f.write('2')
+
+    task = Task('id', 'fuzz', 'fuzzer', 'job')
+    self.mock.get_task.return_value = task
+    task_prefetcher.prefetch_next_task()
+    task_prefetcher.get_task()
+
+    self.assertEqual(0,
+                     self.api_client.fuzzer_api.download_fuzzer.call_count)
+
+  def test_staging_failure(self):
+    """Test that a staging failure still hands over the leased task."""
+    task = Task('id', 'analyze', '1', 'job')
+    self.mock.get_task.return_value = task
+    self.api_client.job_api.get_job.side_effect = Exception
+
+    task_prefetcher.prefetch_next_task()
+    self.assertEqual(task, task_prefetcher.get_task())
+    self.assertIsNone(task_prefetcher.take_staged_task(task).job)
+
+  def test_no_prefetched_task(self):
+    """Test falling back to leasing a task directly."""
+    task = Task('id', 'analyze', '1', 'job')
+    self.mock.get_task.return_value = task
+
+    self.assertEqual(task, task_prefetcher.get_task())
+    self.assertIsNone(task_prefetcher.take_staged_task(task))
+
+  def test_empty_prefetch_skips_poll(self):
+    """Test that the queue is not polled again right after a prefetch found it
+    empty."""
+    self.mock.get_task.return_value = None
+
+    task_prefetcher.prefetch_next_task()
+    self.assertIsNone(task_prefetcher.get_task())
+    self.assertEqual(1, self.mock.get_task.call_count)
+
+    # The empty result is only used once.
+    self.assertIsNone(task_prefetcher.get_task())
+    self.assertEqual(2, self.mock.get_task.call_count)
+
+  @mock.patch('pingu_sdk.system.tasks.add_task')
+  def test_release_staged_task(self, mock_add_task):
+    """Test that a prefetched task that was not handed out is dropped without
+    queuing a duplicate, so that it is handed out again when its lease
+    expires."""
+    task = Task('id', 'analyze', '1', 'job')
+    self.mock.get_task.return_value = task
+
+    task_prefetcher.prefetch_next_task()
+    task_prefetcher.release_staged_task()
+    mock_add_task.assert_not_called()
+    self.assertIsNone(task_prefetcher._staged_task)
+
+    # The next task is leased again.
+    other_task = Task('other_id', 'analyze', '2', 'job')
+    self.mock.get_task.return_value = other_task
+    self.assertEqual(other_task, task_prefetcher.get_task())
+
+  @mock.patch('pingu_sdk.system.tasks.add_task')
+  def test_release_handed_out_task(self, mock_add_task):
+    """Test that a task already handed out is not requeued."""
+    task = Task('id', 'analyze', '1', 'job')
+    self.mock.get_task.return_value = task
+
+    task_prefetcher.prefetch_next_task()
+    self.assertEqual(task, task_prefetcher.get_task())
+    task_prefetcher.release_staged_task()
+    mock_add_task.assert_not_called()
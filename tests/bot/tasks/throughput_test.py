@@ -0,0 +1,77 @@
+"""throughput tests."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from bot.tasks import throughput
+from tests.test_libs import helpers
+
+ROUND_OUTPUT = """INFO: Seed: 1234
+#2	INITED cov: 10 ft: 10 corp: 1/1b exec/s: 0 rss: 30Mb
+#100	NEW    cov: 12 ft: 14 corp: 2/3b lim: 4 exec/s: 100 rss: 31Mb L: 2/2 MS: 1 ChangeBit-
+#1024	pulse  cov: 12 ft: 14 corp: 2/3b lim: 8 exec/s: 512 rss: 32Mb
+#4096	pulse  cov: 12 ft: 14 corp: 2/3b lim: 8 exec/s: 256 rss: 40Mb
+#4096	DONE   cov: 12 ft: 14 corp: 2/3b lim: 8 exec/s: 256 rss: 40Mb
+Done 4096 runs in 16 second(s)
+"""
+
+
+class TimeSeriesTest(unittest.TestCase):
+  """Tests for throughput time series."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    os.environ['THROUGHPUT_DIR'] = self.temp_dir
+
+  def test_parse_samples(self):
+    """Test parsing libFuzzer status lines."""
+    samples = throughput.parse_samples(ROUND_OUTPUT)
+    self.assertEqual(5, len(samples))
+    self.assertEqual({
+        'execs': 100,
+        'coverage': 12,
+        'features': 14,
+        'corpus_units': 2,
+        'exec_per_sec': 100,
+        'rss_mb': 31,
+        'elapsed': 1.0,
+    }, samples[1])
+    self.assertEqual(0, samples[0]['elapsed'])
+    self.assertEqual(16.0, samples[-1]['elapsed'])
+
+  def test_summary(self):
+    """Test throughput percentiles and stall detection."""
+    os.environ['THROUGHPUT_STALL_SECONDS'] = '10'
+    time_series = throughput.TimeSeries('libFuzzer_target')
+    time_series.add_round(0, ROUND_OUTPUT)
+    time_series.add_round(1, 'no status lines')
+
+    summary = time_series.get_summary()
+    self.assertEqual(5, summary['samples'])
+    self.assertEqual(100, summary['exec_per_sec_p10'])
+    self.assertEqual(256, summary['exec_per_sec_p50'])
+    self.assertEqual(512, summary['exec_per_sec_p90'])
+    self.assertEqual(40, summary['max_rss_mb'])
+    # No new features from 1 to 16 seconds.
+    self.assertEqual(15, summary['stall_seconds'])
+    self.assertTrue(summary['stalled'])
+
+  def test_finish(self):
+    """Test that the columns are written to the time series file."""
+    time_series = throughput.TimeSeries('libFuzzer_target')
+    time_series.add_round(3, ROUND_OUTPUT)
+    time_series.finish()
+
+    file_names = os.listdir(self.temp_dir)
+    self.assertEqual(1, len(file_names))
+    columns = throughput.read(os.path.join(self.temp_dir, file_names[0]))
+    self.assertEqual([3] * 5, list(columns['round']))
+    self.assertEqual([2, 100, 1024, 4096, 4096], list(columns['execs']))
+
+  def test_finish_without_samples(self):
+    """Test that no file is written without samples."""
+    throughput.TimeSeries('libFuzzer_target').finish()
+    self.assertEqual([], os.listdir(self.temp_dir))
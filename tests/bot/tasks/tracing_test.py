@@ -0,0 +1,130 @@
+"""tracing tests."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from bot.tasks import tracing
+from pingu_sdk.system import environment
+from pingu_sdk.system.tasks import Task
+from tests.test_libs import helpers
+
+
+class TracingTest(unittest.TestCase):
+  """Tests for task tracing."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, ['time.time'])
+    self.mock.time.return_value = 100.0
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    environment.set_value('TASK_TRACE', True)
+    environment.set_value('TASK_TRACE_DIR', self.temp_dir)
+
+    tracing._histograms.clear()
+    tracing._pending_histograms.clear()
+    self.addCleanup(tracing._histograms.clear)
+    self.addCleanup(tracing._pending_histograms.clear)
+    self.task = Task('task-id', 'fuzz', 'libFuzzer', 'job')
+
+  def _advance(self, seconds):
+    self.mock.time.return_value += seconds
+
+  def test_trace_file(self):
+    """Test that spans are exported as a Chrome trace."""
+    tracing.start_task(self.task)
+    with tracing.span('build_setup'):
+      self._advance(2)
+
+    @tracing.traced('fuzzing_round')
+    def fuzz():
+      self._advance(3)
+
+    fuzz()
+    trace_file_path = tracing.finish_task()
+
+    self.assertEqual(
+        os.path.join(self.temp_dir, 'task-id-100.json'), trace_file_path)
+    with open(trace_file_path) as f:
+      trace = json.load(f)
+
+    events = trace['traceEvents']
+    self.assertEqual(['build_setup', 'fuzzing_round'],
+                     [event['name'] for event in events])
+    self.assertEqual(100 * 1000 * 1000, events[0]['ts'])
+    self.assertEqual(2 * 1000 * 1000, events[0]['dur'])
+    self.assertEqual(102 * 1000 * 1000, events[1]['ts'])
+    self.assertEqual(3 * 1000 * 1000, events[1]['dur'])
+    self.assertEqual('X', events[0]['ph'])
+    self.assertEqual('fuzz libFuzzer job', trace['otherData']['task'])
+
+  def test_histograms(self):
+    """Test that span durations are aggregated across tasks."""
+    for duration in [2, 20]:
+      tracing.start_task(self.task)
+      with tracing.span('build_setup'):
+        self._advance(duration)
+      tracing.finish_task()
+
+    histogram = tracing.get_histograms()['phases']['build_setup']
+    self.assertEqual(2, histogram['count'])
+    self.assertEqual(22, histogram['sum'])
+    self.assertEqual(20, histogram['max'])
+    self.assertEqual(1, histogram['buckets'][tracing.HISTOGRAM_BUCKETS.index(5)])
+    self.assertEqual(1,
+                     histogram['buckets'][tracing.HISTOGRAM_BUCKETS.index(30)])
+
+    with open(os.path.join(self.temp_dir, tracing.HISTOGRAMS_FILENAME)) as f:
+      self.assertEqual(2, json.load(f)['phases']['task']['count'])
+
+  def test_histograms_file_merged(self):
+    """Test that the histograms file adds up the spans of all processes."""
+    tracing.start_task(self.task)
+    with tracing.span('build_setup'):
+      self._advance(2)
+    tracing.finish_task()
+
+    # Another task slot, or this bot before a restart.
+    tracing._histograms.clear()
+    tracing.start_task(self.task)
+    with tracing.span('build_setup'):
+      self._advance(20)
+    tracing.finish_task()
+
+    self.assertEqual(1,
+                     tracing.get_histograms()['phases']['build_setup']['count'])
+    with open(os.path.join(self.temp_dir, tracing.HISTOGRAMS_FILENAME)) as f:
+      histograms = json.load(f)
+
+    self.assertEqual(tracing.HISTOGRAM_BUCKETS, histograms['bucket_bounds'])
+    histogram = histograms['phases']['build_setup']
+    self.assertEqual(2, histogram['count'])
+    self.assertEqual(22, histogram['sum'])
+    self.assertEqual(20, histogram['max'])
+    self.assertEqual(1, histogram['buckets'][tracing.HISTOGRAM_BUCKETS.index(5)])
+    self.assertEqual(1,
+                     histogram['buckets'][tracing.HISTOGRAM_BUCKETS.index(30)])
+    self.assertEqual(2, histograms['phases']['task']['count'])
+
+  def test_disabled(self):
+    """Test that nothing is recorded when tracing is disabled."""
+    environment.set_value('TASK_TRACE', False)
+    tracing.start_task(self.task)
+    with tracing.span('build_setup'):
+      pass
+
+    self.assertIsNone(tracing.finish_task())
+    self.assertEqual({}, tracing.get_histograms()['phases'])
+    self.assertEqual([], os.listdir(self.temp_dir))
+
+  def test_span_on_exception(self):
+    """Test that a span is recorded when the block raises."""
+    tracing.start_task(self.task)
+    with self.assertRaises(ValueError):
+      with tracing.span('corpus_sync'):
+        raise ValueError
+    tracing.finish_task()
+
+    self.assertEqual(1, tracing.get_histograms()['phases']['corpus_sync']['count'])
@@ -0,0 +1,87 @@
+"""upload_queue tests."""
+import os
+import threading
+import unittest
+from unittest import mock
+
+from bot.tasks import upload_queue
+from tests.test_libs import helpers
+
+
+def _make_testcase_run(fuzzer_id, job_id):
+  """Return a fake TestcaseRun."""
+  return mock.Mock(
+      kind='TestcaseRun',
+      fuzzer_id=fuzzer_id,
+      binary='target',
+      project_id='project',
+      job_id=job_id)
+
+
+class UploadQueueTest(unittest.TestCase):
+  """Tests for background uploads."""
+
+  def setUp(self):
+    helpers.patch_environ(self)
+    helpers.patch(self, [
+        'pingu_sdk.metrics.fuzzer_stats.upload_stats',
+        'pingu_sdk.system.retry.sleep',
+    ])
+    os.environ['BACKGROUND_UPLOADS'] = 'True'
+
+  def _block_uploads(self):
+    """Keep the upload thread busy until the returned event is set."""
+    event = threading.Event()
+    upload_queue.upload(event.wait)
+    return event
+
+  def test_disabled(self):
+    """Test that uploads run right away when disabled."""
+    os.environ['BACKGROUND_UPLOADS'] = 'False'
+    upload_function = mock.Mock()
+    upload_queue.upload(upload_function, 'a', log='log')
+    upload_function.assert_called_once_with('a', log='log')
+
+    testcase_run = _make_testcase_run('fuzzer', 'job')
+    upload_queue.upload_stats(testcase_run)
+    self.mock.upload_stats.assert_called_once_with([testcase_run])
+
+  def test_upload(self):
+    """Test that queued uploads are done after a flush."""
+    upload_function = mock.Mock()
+    upload_queue.upload(upload_function, 'a', log='log')
+    upload_queue.flush()
+    upload_function.assert_called_once_with('a', log='log')
+
+  def test_stats_batched(self):
+    """Test that stats queued together are uploaded in one batch per
+    fuzzer and job."""
+    first_run = _make_testcase_run('fuzzer', 'job')
+    second_run = _make_testcase_run('fuzzer', 'job')
+    other_run = _make_testcase_run('fuzzer', 'other_job')
+
+    event = self._block_uploads()
+    upload_queue.upload_stats(first_run)
+    upload_queue.upload_stats(second_run)
+    upload_queue.upload_stats(other_run)
+    event.set()
+    upload_queue.flush()
+
+    self.assertEqual(2, self.mock.upload_stats.call_count)
+    self.mock.upload_stats.assert_has_calls([
+        mock.call([first_run, second_run]),
+        mock.call([other_run]),
+    ])
+
+  def test_retry(self):
+    """Test that failed uploads are retried, and that a failing upload does
+    not stop later ones."""
+    failing_function = mock.Mock(side_effect=Exception('failed'))
+    flaky_function = mock.Mock(side_effect=[Exception('failed'), None])
+    upload_queue.upload(failing_function)
+    upload_queue.upload(flaky_function)
+    upload_queue.flush()
+
+    self.assertEqual(upload_queue.UPLOAD_RETRIES + 1,
+                     failing_function.call_count)
+    self.assertEqual(2, flaky_function.call_count)